@@ -0,0 +1,214 @@
+"""
+问答结果缓存：按归一化问题文本精确匹配，或按字符n-gram的Jaccard相似度近似匹配（适用于中文问题；
+问题中的数字必须完全相同，"2023年"与"2024年"不会互相命中），在新鲜期内直接返回缓存的回答与来源，临近过期时在后台刷新。
+
+环境变量：
+    LINKA_ANSWER_CACHE_TTL=600              # 新鲜期（秒），0 表示关闭缓存
+    LINKA_ANSWER_CACHE_REFRESH_BEFORE=120   # 距过期不足该秒数时命中会触发后台刷新
+    LINKA_ANSWER_CACHE_SIMILARITY=0.8       # 近似匹配的Jaccard阈值，0 表示只做精确匹配
+    LINKA_ANSWER_CACHE_SIZE=1000            # 最大缓存条目数
+"""
+import collections
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PUNCT_RE = re.compile(r"[\s　]+")
+_NUMBER_RE = re.compile(r"\d+")
+
+
+def normalize_query(text: str) -> str:
+    """归一化问题：全角转半角、转小写、去掉标点和空白。"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
+    return _PUNCT_RE.sub("", text)
+
+
+def char_ngrams(text: str, n: int = 2) -> Set[str]:
+    """字符n-gram集合；短于n的文本直接作为一个元素。"""
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+class CacheEntry:
+    __slots__ = ("key", "query", "grams", "answer", "search_results", "answer_blocks", "created_at", "refreshing")
+
+    def __init__(self, key, query, grams, answer, search_results, answer_blocks=()):
+        self.key = key
+        self.query = query
+        self.grams = grams
+        self.answer = answer
+        self.search_results = search_results
+        self.answer_blocks = answer_blocks  # 生成回答所用的参考内容，命中后供同一会话的追问复用
+        self.created_at = time.time()
+        self.refreshing = False
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+
+class AnswerCache:
+    """
+    线程安全的问答缓存。
+
+    条目以 (归一化问题, 是否分析图片) 为键；近似匹配通过 n-gram 倒排索引
+    只对至少共享一个n-gram的条目计算相似度。
+    """
+
+    def __init__(self, ttl: float = 600, refresh_before: float = 120, similarity: float = 0.8,
+                 max_entries: int = 1000, ngram: int = 2):
+        self.ttl = ttl
+        self.refresh_before = refresh_before
+        self.similarity = similarity
+        self.max_entries = max_entries
+        self.ngram = ngram
+        self._entries: "collections.OrderedDict[Tuple[str, bool], CacheEntry]" = collections.OrderedDict()
+        self._index: Dict[Tuple[str, bool], Set[Tuple[str, bool]]] = collections.defaultdict(set)
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="linka-answer-refresh")
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def _remove_locked(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry.grams:
+            bucket = self._index.get((gram, key[1]))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._index[(gram, key[1])]
+
+    def get(self, query: str, analyze_images: bool = False) -> Optional[CacheEntry]:
+        """查找新鲜的缓存条目：先精确匹配，再按相似度匹配。"""
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+        key = (normalized, analyze_images)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.age() < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if self.similarity > 0:
+                grams = char_ngrams(normalized, self.ngram)
+                overlaps: Dict[Tuple[str, bool], int] = collections.Counter()
+                for gram in grams:
+                    for candidate in self._index.get((gram, analyze_images), ()):
+                        overlaps[candidate] += 1
+                best, best_score = None, self.similarity
+                numbers = _NUMBER_RE.findall(normalized)
+                for candidate, inter in overlaps.items():
+                    other = self._entries[candidate]
+                    score = inter / (len(grams) + len(other.grams) - inter)
+                    # 年份、版本号等只差一个数字的问题字面上高度相似，答案却不同
+                    if (score >= best_score and other.age() < self.ttl
+                            and _NUMBER_RE.findall(candidate[0]) == numbers):
+                        best, best_score = other, score
+                if best is not None:
+                    self._entries.move_to_end(best.key)
+                    self.similar_hits += 1
+                    logger.debug("近似命中缓存: %r -> %r (%.2f)", query, best.query, best_score)
+                    return best
+            self.misses += 1
+            return None
+
+    def put(self, query: str, answer: str, search_results: List, analyze_images: bool = False,
+            answer_blocks: Optional[List[Tuple[str, str]]] = None):
+        """写入（或覆盖）一条缓存；answer_blocks 为生成回答所用的 [(markdown, url)]。"""
+        normalized = normalize_query(query)
+        if not normalized or not answer:
+            return
+        key = (normalized, analyze_images)
+        entry = CacheEntry(
+            key, query, char_ngrams(normalized, self.ngram), answer, list(search_results), list(answer_blocks or ())
+        )
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = entry
+            for gram in entry.grams:
+                self._index[(gram, analyze_images)].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+
+    def refresh_if_stale(self, entry: CacheEntry, compute: Callable[[], Tuple[str, List, List]],
+                         analyze_images: bool = False) -> bool:
+        """
+        条目临近过期时在后台重新计算并写回；同一条目同时只刷新一次。
+
+        :param entry: 命中的缓存条目
+        :param compute: 返回 (answer, search_results, answer_blocks) 的函数
+        :return: 是否提交了刷新任务
+        """
+        with self._lock:
+            if entry.refreshing or self.ttl - entry.age() > self.refresh_before:
+                return False
+            entry.refreshing = True
+
+        def run():
+            try:
+                answer, search_results, answer_blocks = compute()
+                self.put(entry.query, answer, search_results, analyze_images, answer_blocks)
+            except Exception:
+                logger.exception("后台刷新缓存失败: %s", entry.query)
+            finally:
+                entry.refreshing = False
+
+        self._refresher.submit(run)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.similar_hits) / total if total else 0.0,
+            }
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """获取进程级问答缓存；LINKA_ANSWER_CACHE_TTL 为 0 时返回None。"""
+    global _answer_cache
+    ttl = float(os.getenv("LINKA_ANSWER_CACHE_TTL", "600"))
+    if ttl <= 0:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    ttl=ttl,
+                    refresh_before=float(os.getenv("LINKA_ANSWER_CACHE_REFRESH_BEFORE", "120")),
+                    similarity=float(os.getenv("LINKA_ANSWER_CACHE_SIMILARITY", "0.8")),
+                    max_entries=int(os.getenv("LINKA_ANSWER_CACHE_SIZE", "1000")),
+                )
+    return _answer_cache
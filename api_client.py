@@ -0,0 +1,70 @@
+"""
+Linka HTTP服务的客户端：以与 rag_pipeline.stream_answer 相同的事件格式读取SSE流
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from cancellation import raise_if_cancelled
+from net_utils.http_session import get_http_session
+
+
+def stream_answer_remote(
+    api_url: str,
+    query: str,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    analyze_images: bool = False,
+    cancel_token=None,
+    timeout: float = 300,
+    session_id: Optional[str] = None,
+    instant: bool = False,
+    background_images: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    请求远程 /v1/answer 接口并逐个产出事件。
+
+    参数:
+        api_url (str): 服务地址，如 http://127.0.0.1:8765
+        query (str): 用户问题。
+        chat_history (list, optional): 历史消息列表。
+        analyze_images (bool): 是否开启图片分析。
+        cancel_token (CancelToken, optional): 取消令牌，取消时断开连接，服务端随之取消。
+        timeout (float): 读取超时（秒）。
+        session_id (str, optional): 会话ID，服务端据此让追问复用上一轮检索到的资料。
+        instant (bool): 是否先根据搜索摘要生成初步回答。
+        background_images (bool): 是否在后台分析图片，先根据文字内容回答。
+
+    返回:
+        事件字典的生成器。
+    """
+    resp = get_http_session().post(
+        f"{api_url.rstrip('/')}/v1/answer",
+        json={
+            "query": query,
+            "history": chat_history or [],
+            "analyze_images": analyze_images,
+            "session_id": session_id,
+            "instant": instant,
+            "background_images": background_images,
+        },
+        stream=True,
+        timeout=(5, timeout),
+    )
+    resp.raise_for_status()
+    resp.encoding = "utf-8"
+    unregister = cancel_token.add_callback(resp.close) if cancel_token is not None else None
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            raise_if_cancelled(cancel_token)
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):].strip())
+            if event.get("type") == "error":
+                raise RuntimeError(event.get("message", "服务端错误"))
+            yield event
+    except Exception:
+        raise_if_cancelled(cancel_token)
+        raise
+    finally:
+        if unregister:
+            unregister()
+        resp.close()
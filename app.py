@@ -1,96 +1,199 @@
 import streamlit as st
 from search_results_display import display_search_results
-from search_processing import process_search_and_content 
-from prompt_utils import format_query_with_references, get_system_prompt # 导入 get_system_prompt
+from cancellation import CancelToken, OperationCancelled
+from stream_renderer import BufferedStreamRenderer
+from conversation import ConversationState
+from concurrent.futures import ThreadPoolExecutor
 import os
-import openai
+import queue
+import time
+import uuid
+from warmup import warm_up, warmup_enabled
 
+# 配置了 LINKA_API_URL 时作为瘦客户端调用独立的HTTP服务，否则在进程内运行RAG流程
+LINKA_API_URL = os.getenv("LINKA_API_URL")
+if LINKA_API_URL:
+    from api_client import stream_answer_remote
+else:
+    from rag_pipeline import stream_answer
 
 
+
+# 初步回答上方的提示，按 draft_delta 事件的 stage 区分
+DRAFT_PREFIXES = {
+    "snippets": "*初步回答（基于搜索摘要，正在抓取网页完善）*\n\n",
+    "images": "*初步回答（图片仍在分析，完成后将更新回答）*\n\n",
+}
+
 st.set_page_config(page_title="联网搜索对话系统", layout="wide")
 st.title("🔎 联网搜索对话系统 ")
 
 st.sidebar.title("配置选项")
 analyze_images_enabled = st.sidebar.checkbox("开启图片分析", value=False)
+instant_enabled = st.sidebar.checkbox("快速预答（先根据搜索摘要回答）", value=False)
+background_images_enabled = st.sidebar.checkbox(
+    "后台分析图片（先根据文字回答，图片分析完成后更新）", value=False, disabled=not analyze_images_enabled
+)
 if st.sidebar.button("清空对话记录", use_container_width=True):
-    st.session_state["history"] = []
     st.session_state["search_results"] = []
+    st.session_state.pop("conversation", None)
+    st.session_state.pop("session_id", None)
+
+
 
+@st.cache_resource
+def warm_up_process():
+    """每个进程预热一次：在页面首次加载时预先导入转换依赖、创建共享客户端，而不是在第一个问题里。"""
+    # 瘦客户端模式下检索和生成都在服务端，服务端启动时自行预热
+    if LINKA_API_URL or not warmup_enabled():
+        return {}
+    return warm_up(analyze_images=False)
 
 
-def call_guiji_rag_model_stream(query, answer_blocks, _, chat_history=None):
-    client = openai.OpenAI(
-        api_key=os.getenv("GUIJI_API_KEY"), base_url=os.getenv("GUIJI_BASE_URL")
-    )
-    guiji_model = os.getenv("GUIJI_TEXT_MODEL")
-    # 拼接参考内容
-    prompt = format_query_with_references(query, answer_blocks)
-    sys_prompt = get_system_prompt() # 调用函数获取系统提示词
-    messages = [
-        {"role": "system", "content": sys_prompt},
-        {"role": "user", "content": prompt},
-    ]
-    if chat_history:
-        # 将历史记录拼接到消息中
-        for chat in chat_history:
-            messages.insert(-1, chat)  # 在倒数第二个位置插入，保持用户问题在最后
+@st.cache_resource
+def get_pipeline_executor():
+    """进程级线程池：检索流程在后台线程运行，脚本线程保持响应以便及时感知重跑/断开。"""
+    return ThreadPoolExecutor(max_workers=32, thread_name_prefix="linka-pipeline")
 
-    response = client.chat.completions.create(
-        model=guiji_model, messages=messages, stream=True, max_tokens=4096
-    )
-    return response
+
+warm_up_process()
+
+_EVENTS_DONE = object()
+
+
+def iter_events_with_heartbeat(events, status, label, interval=0.5, poll=0.05, on_idle=None):
+    """
+    在后台线程消费事件流，脚本线程按间隔取出事件，空闲时刷新状态标签。
+    每次调用Streamlit接口时，若用户已发送新消息或关闭页面，Streamlit会在此处中断本次脚本运行。
+    on_idle 在每次等待事件超时（poll 秒）时调用，用于刷出流式渲染的积压内容。
+    """
+    event_queue = queue.Queue()
+
+    def pump():
+        try:
+            for event in events:
+                event_queue.put(event)
+        except BaseException as e:
+            event_queue.put(e)
+        finally:
+            event_queue.put(_EVENTS_DONE)
+
+    get_pipeline_executor().submit(pump)
+    started = last_heartbeat = time.monotonic()
+    while True:
+        try:
+            item = event_queue.get(timeout=poll)
+        except queue.Empty:
+            if on_idle is not None:
+                on_idle()
+            now = time.monotonic()
+            if now - last_heartbeat >= interval:
+                last_heartbeat = now
+                status.update(label=f"{label}（{now - started:.0f}s）")
+            continue
+        if item is _EVENTS_DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
 
 
 # 搜索输入框
 query = st.text_input("请输入你的问题或关键词：", "OpenAI GPT-4o 有哪些新特性？")
 
 # 聊天历史与输入框（使用st.chat_message和st.chat_input实现原生ChatGPT体验）
-if "history" not in st.session_state:
-    st.session_state["history"] = []
 if "search_results" not in st.session_state:
     st.session_state["search_results"] = []
+# 会话状态保存对话记录（条数有上限，较早的回复压缩保存）和上一轮检索到的资料，
+# 追问时可直接复用资料；远程模式下资料由服务端按 session_id 保存
+if "conversation" not in st.session_state:
+    st.session_state["conversation"] = ConversationState()
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
 
-for msg in st.session_state["history"]:
+conversation = st.session_state["conversation"]
+for msg in conversation.history:
     with st.chat_message("user" if msg["role"] == "user" else "assistant"):
         st.markdown(msg["content"])
 
 user_input = st.chat_input("请输入你的问题...")
 
 if user_input and user_input.strip():
-    st.session_state["history"].append({"role": "user", "content": user_input.strip()})
+    # 新消息到达：取消本会话上一轮仍在进行的抓取、图片分析和生成
+    previous_token = st.session_state.get("cancel_token")
+    if previous_token is not None:
+        previous_token.cancel()
+    cancel_token = CancelToken()
+    st.session_state["cancel_token"] = cancel_token
+    # 历史在token预算内组装，不含本轮问题（本轮问题随参考资料一起发送）
+    chat_history = conversation.history.for_model()
+    conversation.history.append("user", user_input.strip())
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    with st.status("正在联网搜索和处理内容，请稍候...", expanded=True) as status:
+    status_label = "正在联网搜索和处理内容，请稍候..."
+    with st.status(status_label, expanded=True) as status:
         try:
-            status.write("🔍 正在进行 DuckDuckGo 搜索...")
-            search_summaries, answer_blocks = process_search_and_content(
-                user_input, user_agent=user_agent, analyze_images=analyze_images_enabled
-            )
-            st.session_state["search_results"] = search_summaries           
-            status.write(f"✅ 搜索完成，共{len(search_summaries)}条结果。")
-            if answer_blocks:
-                status.write("🤖 正在调用大模型流式生成回答...")
-                chat_history = st.session_state["history"][-5:]
-                response = call_guiji_rag_model_stream(
-                    user_input, answer_blocks, None, chat_history
+            if LINKA_API_URL:
+                events = stream_answer_remote(
+                    LINKA_API_URL, user_input, chat_history,
+                    analyze_images=analyze_images_enabled, cancel_token=cancel_token,
+                    session_id=st.session_state["session_id"], instant=instant_enabled,
+                    background_images=background_images_enabled,
                 )
-                full_answer = ""
-                with st.chat_message("assistant"):
-                    stream_placeholder = st.empty()
-                    for chunk in response:
-                        delta = (
-                            chunk.choices[0].delta.content
-                            if chunk.choices[0].delta
-                            else ""
-                        )
-                        if delta:
-                            full_answer += delta
-                            stream_placeholder.markdown(full_answer)
-                st.session_state["history"].append(
-                    {"role": "assistant", "content": full_answer}
+            else:
+                events = stream_answer(
+                    user_input, chat_history, analyze_images=analyze_images_enabled,
+                    cancel_token=cancel_token, user_agent=user_agent,
+                    conversation=conversation, instant=instant_enabled,
+                    background_images=background_images_enabled,
                 )
-                status.write("✅ 回答生成完毕！")
+            renderer = None
+            renderer_is_draft = False
+            answer_slot = None
+
+            def flush_stream():
+                if renderer is not None:
+                    renderer.tick()
+
+            for event in iter_events_with_heartbeat(events, status, status_label, on_idle=flush_stream):
+                if event["type"] == "status":
+                    status.write(event["message"])
+                elif event["type"] == "sources":
+                    st.session_state["search_results"] = [tuple(r) for r in event["search_results"]]
+                elif event["type"] in ("draft_delta", "delta"):
+                    is_draft = event["type"] == "draft_delta"
+                    if answer_slot is None:
+                        with st.chat_message("assistant"):
+                            answer_slot = st.empty()
+                    if renderer is None or renderer_is_draft != is_draft:
+                        # 合并增量后按间隔刷新，避免每个token都重发、重渲染整段回答；
+                        # 完整回答开始时在同一位置替换初步回答
+                        if is_draft:
+                            prefix = DRAFT_PREFIXES.get(event.get("stage"), DRAFT_PREFIXES["snippets"])
+                            renderer = BufferedStreamRenderer(
+                                lambda text, prefix=prefix: answer_slot.markdown(prefix + text)
+                            )
+                        else:
+                            renderer = BufferedStreamRenderer(answer_slot.markdown)
+                        renderer_is_draft = is_draft
+                    renderer.append(event["content"])
+                elif event["type"] == "draft_done" and renderer is not None:
+                    renderer.close()
+                elif event["type"] == "done" and renderer is not None:
+                    if renderer_is_draft:
+                        # 没有抓到更多网页内容或图片分析未及时完成，初步回答即最终回答
+                        renderer = BufferedStreamRenderer(answer_slot.markdown)
+                        renderer.append(event["answer"])
+                    renderer.close()
+                    full_answer = event["answer"]
+                    conversation.history.append("assistant", full_answer)
+                    status.write("✅ 回答生成完毕！")
+        except OperationCancelled:
+            status.write("⏹️ 已取消")
         except Exception as e:
             st.error(f"搜索或内容抓取失败: {e}")
-            status.write("❌ 搜索或内容抓取失败")    # 在status容器外部显示搜索结果
+            status.write("❌ 搜索或内容抓取失败")
+        finally:
+            # 无论正常结束、出错，还是因重跑/页面关闭被Streamlit中断，都释放本轮占用的资源
+            cancel_token.cancel()
+# 在status容器外部显示搜索结果
 display_search_results(st.session_state.get("search_results"))
-
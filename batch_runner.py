@@ -0,0 +1,208 @@
+"""
+批量/离线问答：从JSONL读取问题，有界并发地执行检索与生成，结果以JSONL流式写出，支持断点续跑
+
+用法：
+    python batch_runner.py queries.jsonl results.jsonl --concurrency 8 --llm-concurrency 4
+
+输入每行形如 {"id": "faq-1", "query": "..."}，缺少id时使用行号；可选的 history 为本题之前的历史消息，
+与交互式对话一样按 token 预算压缩或丢弃（conversation.fit_history）。
+已完成的id记录在检查点文件（默认 <输出文件>.ckpt）中，重复运行时自动跳过。
+失败的问题写入错误文件（默认 <输出文件>.errors），不写检查点，续跑时重试；输出文件中每个id只出现一次。
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from conversation import fit_history
+from llm_utils import call_guiji_rag_model_stream, iter_stream_deltas
+from net_utils.http_session import DEFAULT_USER_AGENT
+from search_processing import process_search_and_content
+from stats_utils import percentile
+from tracing import configure_logging
+
+STAGES = ["retrieval", "llm_ttft", "generation", "total"]
+
+
+def load_queries(path: str) -> List[Dict]:
+    """读取JSONL问题列表，跳过空行。"""
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            item.setdefault("id", str(line_no))
+            item["id"] = str(item["id"])
+            queries.append(item)
+    return queries
+
+
+def load_checkpoint(path: str) -> set:
+    """读取检查点中已完成的id。"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class BatchRunner:
+    """
+    有界资源的批量执行器。
+
+    - concurrency：同时处理的问题数（抓取还受进程级调度器的全局限制）
+    - llm_concurrency：同时进行的大模型生成数
+    结果和检查点在每个问题完成后立即写入，中断后可续跑；失败记录单独写入 errors_path。
+    """
+
+    def __init__(self, output_path: str, checkpoint_path: str, concurrency: int = 8,
+                 llm_concurrency: int = 4, analyze_images: bool = False, max_results: int = 10,
+                 errors_path: str = None):
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path
+        self.errors_path = errors_path or f"{output_path}.errors"
+        self.concurrency = concurrency
+        self.analyze_images = analyze_images
+        self.max_results = max_results
+        self._llm_slots = threading.BoundedSemaphore(llm_concurrency)
+        self._write_lock = threading.Lock()
+        self.timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.succeeded = 0
+        self.failed = 0
+
+    def answer(self, item: Dict) -> Dict:
+        """处理单个问题，返回结果记录（含各阶段耗时，单位秒）。"""
+        timings = {}
+        started = time.perf_counter()
+        search_summaries, answer_blocks = process_search_and_content(
+            item["query"], max_results=self.max_results,
+            user_agent=DEFAULT_USER_AGENT, analyze_images=self.analyze_images,
+        )
+        timings["retrieval"] = time.perf_counter() - started
+        answer = ""
+        if answer_blocks:
+            with self._llm_slots:
+                llm_started = time.perf_counter()
+                response = call_guiji_rag_model_stream(
+                    item["query"], answer_blocks, None, fit_history(item.get("history"))
+                )
+                parts = []
+                for delta in iter_stream_deltas(response):
+                    if not parts:
+                        timings["llm_ttft"] = time.perf_counter() - llm_started
+                    parts.append(delta)
+                timings["generation"] = time.perf_counter() - llm_started
+                answer = "".join(parts)
+        timings["total"] = time.perf_counter() - started
+        return {
+            "id": item["id"],
+            "query": item["query"],
+            "answer": answer,
+            "sources": [{"title": t, "url": u, "snippet": s} for t, u, s in search_summaries],
+            "timings": timings,
+        }
+
+    def _run_one(self, item: Dict):
+        try:
+            record = self.answer(item)
+        except Exception as e:
+            record = {"id": item["id"], "query": item["query"], "error": str(e)}
+        with self._write_lock:
+            if "error" in record:
+                # 失败的问题写入错误文件、不写检查点，续跑时重试，避免输出文件中出现重复id
+                with open(self.errors_path, "a", encoding="utf-8") as errors:
+                    errors.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.failed += 1
+                print(f"❌ [{item['id']}] {record['error']}")
+                return
+            with open(self.output_path, "a", encoding="utf-8") as out:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            with open(self.checkpoint_path, "a", encoding="utf-8") as ckpt:
+                ckpt.write(item["id"] + "\n")
+            self.succeeded += 1
+            for stage, value in record["timings"].items():
+                self.timings[stage].append(value)
+            print(f"✅ [{item['id']}] {record['timings']['total']:.2f}s")
+
+    def run(self, queries: List[Dict]) -> Dict:
+        """执行全部问题，返回汇总报告。"""
+        done = load_checkpoint(self.checkpoint_path)
+        pending = [item for item in queries if item["id"] not in done]
+        print(f"📋 共 {len(queries)} 个问题，已完成 {len(queries) - len(pending)} 个，待处理 {len(pending)} 个")
+        started = time.perf_counter()
+        # 用信号量限制在途任务数，避免一次性提交上千个任务
+        window = threading.BoundedSemaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="linka-batch") as executor:
+            for item in pending:
+                window.acquire()
+                future = executor.submit(self._run_one, item)
+                future.add_done_callback(lambda _: window.release())
+        elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> Dict:
+        """汇总吞吐量与各阶段延迟。"""
+        report = {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_seconds": elapsed,
+            "queries_per_minute": self.succeeded / elapsed * 60 if elapsed else 0.0,
+            "stages": {},
+        }
+        for stage, values in self.timings.items():
+            if values:
+                report["stages"][stage] = {
+                    "count": len(values),
+                    "mean": sum(values) / len(values),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": max(values),
+                }
+        return report
+
+
+def print_report(report: Dict):
+    print("\n========== 批量运行报告 ==========")
+    print(f"成功 {report['succeeded']}，失败 {report['failed']}，耗时 {report['elapsed_seconds']:.1f}s")
+    print(f"吞吐量: {report['queries_per_minute']:.2f} 问题/分钟")
+    for stage, stats in report["stages"].items():
+        print(
+            f"  {stage:<10} n={stats['count']:<5} mean={stats['mean']:.2f}s "
+            f"p50={stats['p50']:.2f}s p95={stats['p95']:.2f}s max={stats['max']:.2f}s"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka 批量问答")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("output", help="输出JSONL文件（追加写入）")
+    parser.add_argument("--checkpoint", help="检查点文件，默认 <output>.ckpt")
+    parser.add_argument("--errors", help="失败记录文件（追加写入），默认 <output>.errors")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时处理的问题数")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="同时进行的大模型生成数")
+    parser.add_argument("--max-results", type=int, default=10, help="每个问题的搜索结果数")
+    parser.add_argument("--analyze-images", action="store_true", help="开启图片分析")
+    args = parser.parse_args()
+    configure_logging()
+
+    runner = BatchRunner(
+        args.output,
+        args.checkpoint or f"{args.output}.ckpt",
+        concurrency=args.concurrency,
+        llm_concurrency=args.llm_concurrency,
+        analyze_images=args.analyze_images,
+        max_results=args.max_results,
+        errors_path=args.errors,
+    )
+    report = runner.run(load_queries(args.input))
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
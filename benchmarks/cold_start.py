@@ -0,0 +1,115 @@
+"""
+冷启动基准：在全新子进程中测量导入耗时、预热耗时，以及首个/第二个查询的端到端延迟
+
+用法：
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --runs 3 --importtime --json cold.json
+
+每轮启动两个子进程：一个不预热直接处理首个查询，一个先调用 warmup.warm_up 再处理。
+后端（页面、搜索、模型）均为零延迟的本地夹具，测得的差值即进程内的冷启动开销。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def run_child(warmup: bool) -> Dict[str, float]:
+    """子进程：导入 -> （预热）-> 首个查询 -> 第二个查询，结果以一行JSON输出。"""
+    from benchmarks.fixtures import FixtureServer, install_mocks
+
+    os.environ["LINKA_ANSWER_CACHE_TTL"] = "0"
+    started = time.perf_counter()
+    import rag_pipeline
+
+    result = {"import": time.perf_counter() - started}
+    with FixtureServer() as fixture:
+        restore = install_mocks(fixture)
+        try:
+            if warmup:
+                from warmup import warm_up
+
+                result["warmup"] = warm_up(analyze_images=False, hosts=())["total"]
+            for name, query in (("first_query", "冷启动查询"), ("second_query", "第二个查询")):
+                started = time.perf_counter()
+                for _ in rag_pipeline.stream_answer(query, use_cache=False):
+                    pass
+                result[name] = time.perf_counter() - started
+        finally:
+            restore()
+    print(json.dumps(result))
+    return result
+
+
+def spawn(warmup: bool, importtime: bool) -> Dict:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-m", "benchmarks.cold_start", "--child"] + (["--warmup"] if warmup else [])
+    proc = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["slowest_imports"] = parse_importtime(proc.stderr)
+    return result
+
+
+def parse_importtime(stderr: str, top: int = 10) -> List[Dict]:
+    """解析 -X importtime 输出，返回自身耗时最长的模块。"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append({"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    return sorted(rows, key=lambda r: r["self_ms"], reverse=True)[:top]
+
+
+def summarize(runs: List[Dict]) -> Dict[str, float]:
+    keys = [k for k in runs[0] if k != "slowest_imports"]
+    return {k: statistics.median(r[k] for r in runs) for k in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka 冷启动基准")
+    parser.add_argument("--runs", type=int, default=3, help="每种模式的子进程次数，结果取中位数")
+    parser.add_argument("--importtime", action="store_true", help="额外报告导入最慢的模块")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.warmup)
+        return
+
+    results = {}
+    for mode, warmup in (("cold", False), ("warmup", True)):
+        runs = [spawn(warmup, args.importtime) for _ in range(args.runs)]
+        results[mode] = summarize(runs)
+        if args.importtime:
+            results[mode]["slowest_imports"] = runs[-1]["slowest_imports"]
+
+    print(f"\n{'mode':>7} {'import(s)':>10} {'warmup(s)':>10} {'first(s)':>9} {'second(s)':>10}")
+    for mode, r in results.items():
+        print(
+            f"{mode:>7} {r['import']:>10.3f} {r.get('warmup', 0.0):>10.3f} "
+            f"{r['first_query']:>9.3f} {r['second_query']:>10.3f}"
+        )
+    if args.importtime:
+        print("\n导入最慢的模块（未预热）：")
+        for row in results["cold"]["slowest_imports"]:
+            print(f"  {row['self_ms']:>8.1f} ms  {row['module']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+"""
+离线基准测试夹具：本地HTTP服务器提供语料页面、图片，以及模拟的OpenAI兼容接口（文本生成与视觉分析）
+
+- 语料：默认生成确定性的合成页面；传入 corpus_dir 时使用录制的 *.html 页面及其中引用的图片文件
+- 延迟与错误：每类后端（页面、图片、搜索、文本模型、视觉模型）各自一个 LatencyModel
+- 搜索：mock_search 与 search_duckduckgo 签名一致，返回指向本地页面的结果
+"""
+import json
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+class LatencyModel:
+    """对数正态延迟 + 固定错误率。"""
+
+    def __init__(self, median_ms: float = 0.0, sigma: float = 0.5, error_rate: float = 0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """从 "median_ms[:sigma[:error_rate]]" 格式解析，例如 "80:0.5:0.02"。"""
+        parts = [float(p) for p in spec.split(":")] if spec else []
+        return cls(*parts)
+
+    def sample(self) -> float:
+        """采样一次延迟（秒）。"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms / 1000 * random.lognormvariate(0, self.sigma)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+    def wait(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+
+def make_png(width: int = 64, height: int = 48, seed: int = 0) -> bytes:
+    """生成一张纯色PNG图片。"""
+    rng = random.Random(seed)
+    pixel = bytes([rng.randrange(256), rng.randrange(256), rng.randrange(256)])
+    raw = b"".join(b"\x00" + pixel * width for _ in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+PARAGRAPHS = [
+    "GPT-4o 是 OpenAI 发布的多模态模型，能够同时处理文本、音频和图像输入，响应速度显著提升。",
+    "The model matches GPT-4 Turbo performance on English text and code, with significant improvement on non-English languages.",
+    "在视觉理解方面，新模型在多个基准测试中取得了领先成绩，并且 API 价格下降了一半。",
+    "Developers can access the model through the Chat Completions API with streaming support and higher rate limits.",
+    "检索增强生成（RAG）通过引入外部知识来源，显著降低了大模型产生幻觉的概率。",
+    "Latency matters: users perceive answers that start streaming within one second as instant.",
+]
+
+
+def make_page(index: int, base_url: str, paragraphs: int = 12, images: int = 3) -> str:
+    """生成一篇确定性的合成文章页面，包含导航、正文段落、列表、表格、链接和图片。"""
+    rng = random.Random(index)
+    body = []
+    for p in range(paragraphs):
+        text = " ".join(rng.choice(PARAGRAPHS) for _ in range(3))
+        link = f'<a href="{base_url}/page/{(index + p) % 50}.html?utm_source=bench&amp;utm_medium=ref&amp;id={p}">相关阅读 {p}</a>'
+        body.append(f"<p>{text} {link}</p>")
+        if p % 4 == 1 and images:
+            img = (p // 4) % images
+            body.append(f'<p><img src="{base_url}/img/{index}-{img}.png" alt="示意图 {img}"></p>')
+        if p == paragraphs // 2:
+            body.append("<ul>" + "".join(f"<li>要点 {i}：{rng.choice(PARAGRAPHS)}</li>" for i in range(4)) + "</ul>")
+            body.append(
+                "<table><tr><th>模型</th><th>得分</th></tr>"
+                + "".join(f"<tr><td>model-{i}</td><td>{rng.randint(50, 99)}</td></tr>" for i in range(4))
+                + "</table>"
+            )
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<title>基准测试文章 {index}</title>"
+        f"<meta name='author' content='bench'><meta name='date' content='2024-05-{(index % 28) + 1:02d}'>"
+        "</head><body>"
+        "<nav><a href='/'>首页</a> | <a href='/news'>新闻</a> | <a href='/about'>关于</a></nav>"
+        f"<article><h1>基准测试文章 {index}</h1>{''.join(body)}</article>"
+        "<footer>© 2024 Benchmark Corp. <a href='/privacy'>隐私政策</a></footer>"
+        "</body></html>"
+    )
+
+
+class FixtureServer:
+    """
+    本地夹具服务器。
+
+    路由：
+        /page/<n>.html              语料页面
+        /img/<name>                 图片
+        /v1/chat/completions        模拟的OpenAI兼容接口；消息中含 image_url 时按视觉模型处理
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        corpus_dir: Optional[str] = None,
+        page_latency: Optional[LatencyModel] = None,
+        image_latency: Optional[LatencyModel] = None,
+        llm_latency: Optional[LatencyModel] = None,
+        vision_latency: Optional[LatencyModel] = None,
+        llm_tokens: int = 200,
+        token_interval_ms: float = 5.0,
+        pages: int = 50,
+    ):
+        self.corpus_dir = corpus_dir
+        self.page_latency = page_latency or LatencyModel()
+        self.image_latency = image_latency or LatencyModel()
+        self.llm_latency = llm_latency or LatencyModel()
+        self.vision_latency = vision_latency or LatencyModel()
+        self.llm_tokens = llm_tokens
+        self.token_interval_ms = token_interval_ms
+        self.pages = pages
+        self.counters: Dict[str, int] = {"page": 0, "image": 0, "chat": 0, "vision": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._recorded = self._load_corpus(corpus_dir) if corpus_dir else []
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @staticmethod
+    def _load_corpus(corpus_dir: str) -> List[str]:
+        names = sorted(n for n in os.listdir(corpus_dir) if n.endswith(".html"))
+        return [os.path.join(corpus_dir, n) for n in names]
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def page_count(self) -> int:
+        return len(self._recorded) or self.pages
+
+    def page_url(self, index: int) -> str:
+        return f"{self.base_url}/page/{index % self.page_count}.html"
+
+    def count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="linka-fixture", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _make_handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _fail(self):
+                fixture.count("errors")
+                self._send(503, b"injected failure", "text/plain")
+
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path.startswith("/page/"):
+                    fixture.count("page")
+                    fixture.page_latency.wait()
+                    if fixture.page_latency.should_fail():
+                        return self._fail()
+                    index = int(path[len("/page/"):].split(".", 1)[0])
+                    if fixture._recorded:
+                        with open(fixture._recorded[index % len(fixture._recorded)], "rb") as f:
+                            body = f.read()
+                    else:
+                        body = make_page(index, fixture.base_url).encode("utf-8")
+                    return self._send(200, body, "text/html; charset=utf-8")
+                if path.startswith("/img/"):
+                    fixture.count("image")
+                    fixture.image_latency.wait()
+                    if fixture.image_latency.should_fail():
+                        return self._fail()
+                    name = path[len("/img/"):]
+                    local = os.path.join(fixture.corpus_dir, name) if fixture.corpus_dir else None
+                    if local and os.path.isfile(local):
+                        with open(local, "rb") as f:
+                            body = f.read()
+                    else:
+                        body = make_png(seed=zlib.crc32(name.encode()))
+                    return self._send(200, body, "image/png")
+                self._send(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send(404, b"not found", "text/plain")
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                messages = payload.get("messages", [])
+                is_vision = any(isinstance(m.get("content"), list) for m in messages)
+                if is_vision:
+                    fixture.count("vision")
+                    fixture.vision_latency.wait()
+                    if fixture.vision_latency.should_fail():
+                        return self._fail()
+                    content = "【图片分析开始】\n标题：示意图\n描述：一张用于基准测试的纯色示意图片。\n【图片分析结束】"
+                    return self._send(200, json.dumps(_completion(payload, content)).encode(), "application/json")
+
+                fixture.count("chat")
+                fixture.llm_latency.wait()  # 首token延迟
+                if fixture.llm_latency.should_fail():
+                    return self._fail()
+                tokens = [f"词{i} " for i in range(fixture.llm_tokens)]
+                if not payload.get("stream"):
+                    return self._send(200, json.dumps(_completion(payload, "".join(tokens))).encode(), "application/json")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for token in tokens:
+                        self.wfile.write(f"data: {json.dumps(_chunk(payload, token))}\n\n".encode())
+                        self.wfile.flush()
+                        if fixture.token_interval_ms:
+                            time.sleep(fixture.token_interval_ms / 1000)
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端取消
+
+        return Handler
+
+
+def _completion(payload: dict, content: str) -> dict:
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model") or "mock",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def _chunk(payload: dict, content: str) -> dict:
+    return {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": payload.get("model") or "mock",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+
+
+def make_mock_search(fixture: FixtureServer, latency: Optional[LatencyModel] = None):
+    """返回与 search_duckduckgo 签名一致的模拟搜索函数，结果指向夹具服务器上的页面。"""
+    latency = latency or LatencyModel()
+
+    def mock_search(query, max_results=10, proxies=None, user_agent=None):
+        latency.wait()
+        if latency.should_fail():
+            raise RuntimeError("模拟搜索失败")
+        start = zlib.crc32(query.encode("utf-8"))
+        return [
+            {
+                "title": f"基准测试文章 {(start + i) % fixture.page_count}",
+                "href": fixture.page_url(start + i),
+                "body": f"{query} 的搜索摘要 {i}：{PARAGRAPHS[i % len(PARAGRAPHS)]}",
+            }
+            for i in range(max_results)
+        ]
+
+    return mock_search
+
+
+def install_mocks(fixture: FixtureServer, search_latency: Optional[LatencyModel] = None):
+    """
+    将流程指向夹具服务器：替换搜索函数，并把文本/视觉模型接口的环境变量指向本地模拟接口。
+    返回用于恢复原状的函数。
+    """
+    import search_processing
+    from llm_utils import reset_generation_clients
+
+    original_search = search_processing.search_duckduckgo
+    search_processing.search_duckduckgo = make_mock_search(fixture, search_latency)
+    env = {
+        "GUIJI_API_KEY": "bench",
+        "GUIJI_BASE_URL": f"{fixture.base_url}/v1",
+        "GUIJI_TEXT_MODEL": "mock-text",
+        "GUIJI_VISION_MODEL": "mock-vision",
+        "NO_PROXY": "127.0.0.1,localhost",
+        # 基准需要测量完整流程，关闭问答缓存、本地索引和缓存预热
+        "LINKA_ANSWER_CACHE_TTL": "0",
+        "LINKA_LOCAL_INDEX": "",
+        "LINKA_WARMER": "0",
+    }
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    # 生成客户端会缓存配置，切换到模拟接口后需要重建
+    reset_generation_clients()
+
+    def restore():
+        search_processing.search_duckduckgo = original_search
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        reset_generation_clients()
+
+    return restore
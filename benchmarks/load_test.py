@@ -0,0 +1,250 @@
+"""
+负载测试：模拟多个并发聊天会话（多轮对话 + 思考时间），逐级加压找出p95延迟超标的饱和点
+
+用法：
+    # 进程内流程 + 模拟后端
+    python -m benchmarks.load_test --target pipeline --stub --ramp 1,4,16,32 --target-p95 8
+    # 进程内启动HTTP服务 + 模拟后端，经SSE接口加压
+    python -m benchmarks.load_test --target api --stub --ramp 4,16,64
+    # 对已部署的服务加压（服务端自行决定是否使用模拟后端）
+    python -m benchmarks.load_test --target api --api-url http://127.0.0.1:8765 --ramp 4,16
+
+每个级别报告：轮次吞吐、首token/完整回答延迟的p50/p95/p99、错误率、线程数、socket数、每会话内存。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterator, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import FixtureServer, LatencyModel, install_mocks  # noqa: E402
+from benchmarks.run_benchmark import RSSSampler, current_rss_mb  # noqa: E402
+from conversation import fit_history  # noqa: E402
+from stats_utils import percentile  # noqa: E402
+
+CONVERSATIONS = [
+    ["OpenAI GPT-4o 有哪些新特性？", "展开第二点", "和 GPT-4 Turbo 相比价格如何？"],
+    ["什么是检索增强生成？", "它有哪些常见的失败模式？", "举个例子"],
+    ["2024年有哪些开源大模型？", "哪个中文能力最好？"],
+    ["如何降低大模型推理延迟？", "流式输出有什么注意事项？", "详细说说投机解码", "总结一下"],
+    ["Streamlit 适合做生产应用吗？"],
+]
+
+
+def socket_count() -> int:
+    """当前进程打开的socket数量（仅Linux，其他平台返回-1）。"""
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return -1
+    count = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+class SessionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ttft: List[float] = []
+        self.latency: List[float] = []
+        self.turns = 0
+        self.errors = 0
+        self.max_threads = 0
+        self.max_sockets = 0
+
+    def sample_resources(self):
+        threads = threading.active_count()
+        sockets = socket_count()
+        with self.lock:
+            self.max_threads = max(self.max_threads, threads)
+            self.max_sockets = max(self.max_sockets, sockets)
+
+
+def run_session(events_factory: Callable[[str, List[Dict]], Iterator[Dict]], stats: SessionStats,
+                deadline: float, think_time: LatencyModel, rng: random.Random):
+    """一个模拟用户：反复挑选一段对话逐轮发送，轮次之间等待思考时间，直到截止时间。"""
+    while time.monotonic() < deadline:
+        history: List[Dict] = []
+        for message in rng.choice(CONVERSATIONS):
+            if time.monotonic() >= deadline:
+                return
+            chat_history = fit_history(history)
+            history.append({"role": "user", "content": message})
+            started = time.perf_counter()
+            first_token = None
+            answer = ""
+            try:
+                for event in events_factory(message, chat_history):
+                    if event["type"] in ("delta", "draft_delta") and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif event["type"] == "done":
+                        answer = event["answer"]
+            except Exception:
+                with stats.lock:
+                    stats.turns += 1
+                    stats.errors += 1
+            else:
+                elapsed = time.perf_counter() - started
+                history.append({"role": "assistant", "content": answer})
+                with stats.lock:
+                    stats.turns += 1
+                    stats.latency.append(elapsed)
+                    if first_token is not None:
+                        stats.ttft.append(first_token)
+            # 出错的轮次同样等待思考时间，否则失败会变成无间隔重试，放大出错时的负载
+            time.sleep(think_time.sample())
+
+
+def run_level(events_factory, sessions: int, duration: float, think_time: LatencyModel, seed: int = 0) -> Dict:
+    """以指定会话数运行 duration 秒，返回该级别的统计。"""
+    stats = SessionStats()
+    baseline_rss = current_rss_mb()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(events_factory, stats, deadline, think_time, random.Random(seed + i)),
+            daemon=True,
+        )
+        for i in range(sessions)
+    ]
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            stats.sample_resources()
+            time.sleep(0.2)
+        wall = time.perf_counter() - started
+    return {
+        "sessions": sessions,
+        "turns": stats.turns,
+        "errors": stats.errors,
+        "error_rate": stats.errors / stats.turns if stats.turns else 0.0,
+        "turns_per_sec": stats.turns / wall if wall else 0.0,
+        "ttft_p50": percentile(stats.ttft, 50),
+        "ttft_p95": percentile(stats.ttft, 95),
+        "p50": percentile(stats.latency, 50),
+        "p95": percentile(stats.latency, 95),
+        "p99": percentile(stats.latency, 99),
+        "max_threads": stats.max_threads,
+        "max_sockets": stats.max_sockets,
+        "peak_rss_mb": rss.peak,
+        "rss_per_session_mb": max(0.0, rss.peak - baseline_rss) / sessions,
+    }
+
+
+def start_local_api(port: int = 0) -> str:
+    """在后台线程中启动HTTP服务（与当前进程共享模拟后端），返回服务地址。"""
+    from aiohttp import web
+    from linka_server import create_app
+
+    ready = threading.Event()
+    address = {}
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_app())
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", port)
+        loop.run_until_complete(site.start())
+        address["url"] = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, name="linka-load-api", daemon=True).start()
+    ready.wait()
+    return address["url"]
+
+
+def make_events_factory(target: str, api_url: str = None, instant: bool = False):
+    if target == "api":
+        from api_client import stream_answer_remote
+
+        return lambda message, history: stream_answer_remote(api_url, message, history, instant=instant)
+    from rag_pipeline import stream_answer
+
+    return lambda message, history: stream_answer(message, history, instant=instant)
+
+
+def print_row(row: Dict):
+    print(
+        f"{row['sessions']:>8} {row['turns']:>6} {row['error_rate'] * 100:>6.1f}% {row['turns_per_sec']:>8.2f} "
+        f"{row['ttft_p95']:>9.2f} {row['p50']:>7.2f} {row['p95']:>7.2f} {row['p99']:>7.2f} "
+        f"{row['max_threads']:>8} {row['max_sockets']:>8} {row['rss_per_session_mb']:>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka 并发会话负载测试")
+    parser.add_argument("--target", choices=["pipeline", "api"], default="pipeline")
+    parser.add_argument("--api-url", help="已部署服务的地址；--target api 且未指定时在进程内启动服务")
+    parser.add_argument("--stub", action="store_true", help="使用本地夹具服务器与模拟后端")
+    parser.add_argument("--ramp", default="1,4,16", help="逗号分隔的会话数级别")
+    parser.add_argument("--duration", type=float, default=30.0, help="每个级别持续的秒数")
+    parser.add_argument("--think-time", default="2000:0.5", help="轮次间思考时间 median_ms:sigma")
+    parser.add_argument("--instant", action="store_true", help="先根据搜索摘要生成初步回答（首token按初步回答计）")
+    parser.add_argument("--target-p95", type=float, default=10.0, help="p95完整回答延迟目标（秒），超出即视为饱和")
+    parser.add_argument("--page-latency", default="80:0.5:0.01")
+    parser.add_argument("--search-latency", default="300:0.3:0")
+    parser.add_argument("--llm-latency", default="500:0.3:0")
+    parser.add_argument("--vision-latency", default="600:0.4:0")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    fixture = None
+    restore = None
+    if args.stub:
+        fixture = FixtureServer(
+            page_latency=LatencyModel.parse(args.page_latency),
+            llm_latency=LatencyModel.parse(args.llm_latency),
+            vision_latency=LatencyModel.parse(args.vision_latency),
+        ).start()
+        restore = install_mocks(fixture, LatencyModel.parse(args.search_latency))
+    api_url = args.api_url
+    if args.target == "api" and not api_url:
+        api_url = start_local_api()
+
+    events_factory = make_events_factory(args.target, api_url, args.instant)
+    think_time = LatencyModel.parse(args.think_time)
+    rows = []
+    saturation = None
+    print(f"{'sessions':>8} {'turns':>6} {'errors':>7} {'turns/s':>8} {'ttft_p95':>9} {'p50':>7} {'p95':>7} {'p99':>7} {'threads':>8} {'sockets':>8} {'MB/sess':>10}")
+    try:
+        for sessions in [int(n) for n in args.ramp.split(",") if n]:
+            row = run_level(events_factory, sessions, args.duration, think_time)
+            rows.append(row)
+            print_row(row)
+            if row["p95"] > args.target_p95:
+                saturation = sessions
+                break
+    finally:
+        if restore:
+            restore()
+        if fixture:
+            fixture.stop()
+
+    if saturation is None:
+        print(f"\n✅ 在测试的最大会话数 {rows[-1]['sessions'] if rows else 0} 下 p95 仍未超过 {args.target_p95}s")
+    else:
+        supported = rows[-2]["sessions"] if len(rows) > 1 else 0
+        print(f"\n⚠️ 饱和点：{saturation} 个会话时 p95={rows[-1]['p95']:.2f}s 超过目标 {args.target_p95}s；可稳定支撑约 {supported} 个会话")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": rows, "saturation_sessions": saturation}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Markdown输出配置基准：对同一批页面比较 default 与 prompt 两种输出配置的输出长度、token数和转换耗时
+
+用法：
+    python -m benchmarks.markdown_profiles --pages 50 --repeat 5
+    python -m benchmarks.markdown_profiles --corpus ./corpus --json profiles.json
+    python -m benchmarks.markdown_profiles --raw      # 不经trafilatura提取，直接转换整页HTML
+
+页面先按线上流程用 trafilatura 提取正文（--raw 时跳过），只对Markdown转换步骤计时。
+token数按 conversation.estimate_tokens 估算；安装了 tiktoken 时另外报告 cl100k_base 编码的实际token数。
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import make_page  # noqa: E402
+from conversation import estimate_tokens  # noqa: E402
+from html2md import OUTPUT_PROFILES, render_markdown  # noqa: E402
+
+BASE_URL = "http://127.0.0.1:8000"
+
+
+def load_pages(corpus_dir: str, pages: int) -> List[str]:
+    if not corpus_dir:
+        return [make_page(i, BASE_URL) for i in range(pages)]
+    names = sorted(n for n in os.listdir(corpus_dir) if n.endswith(".html"))[:pages]
+    pages_html = []
+    for name in names:
+        with open(os.path.join(corpus_dir, name), encoding="utf-8", errors="replace") as f:
+            pages_html.append(f.read())
+    return pages_html
+
+
+def extract(pages: List[str]) -> List[str]:
+    """与 html2md 相同的参数提取正文HTML，提取失败的页面保留原文。"""
+    import trafilatura
+
+    extracted = []
+    for html in pages:
+        content = trafilatura.extract(
+            html, include_comments=False, include_tables=True, include_images=True, include_links=True,
+        )
+        extracted.append(content or html)
+    return extracted
+
+
+def token_counter():
+    try:
+        import tiktoken  # 可选依赖
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base").encode
+
+
+def measure(documents: List[str], output_profile: str, repeat: int, encode=None) -> Dict[str, float]:
+    outputs = [render_markdown(doc, BASE_URL, output_profile) for doc in documents]  # 同时预热
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for doc in documents:
+            render_markdown(doc, BASE_URL, output_profile)
+        timings.append(time.perf_counter() - started)
+    result = {
+        "chars": sum(len(md) for md in outputs),
+        "est_tokens": sum(estimate_tokens(md) for md in outputs),
+        "ms_per_page": statistics.median(timings) / len(documents) * 1000,
+    }
+    if encode is not None:
+        result["tiktoken"] = sum(len(encode(md)) for md in outputs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka Markdown输出配置基准")
+    parser.add_argument("--pages", type=int, default=50, help="页面数（合成页面数或语料中读取的上限）")
+    parser.add_argument("--corpus", help="录制的 *.html 页面目录，默认使用合成页面")
+    parser.add_argument("--repeat", type=int, default=5, help="转换重复次数，耗时取中位数")
+    parser.add_argument("--raw", action="store_true", help="跳过trafilatura提取，直接转换整页HTML")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    pages = load_pages(args.corpus, args.pages)
+    if not pages:
+        parser.error("没有可用的页面")
+    documents = pages if args.raw else extract(pages)
+    encode = token_counter()
+    results = {profile: measure(documents, profile, args.repeat, encode) for profile in OUTPUT_PROFILES}
+
+    baseline = results["default"]
+    print(f"\n{len(documents)} 个页面，耗时为 {args.repeat} 次重复的中位数")
+    header = f"{'profile':>8} {'chars':>9} {'est_tokens':>11} {'vs default':>11} {'ms/page':>8}"
+    print(header + (f" {'tiktoken':>9}" if encode else ""))
+    for profile, r in results.items():
+        ratio = r["est_tokens"] / baseline["est_tokens"] - 1 if baseline["est_tokens"] else 0.0
+        line = f"{profile:>8} {r['chars']:>9} {r['est_tokens']:>11} {ratio:>+10.1%} {r['ms_per_page']:>8.2f}"
+        print(line + (f" {r['tiktoken']:>9}" if encode else ""))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
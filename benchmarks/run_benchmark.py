@@ -0,0 +1,211 @@
+"""
+离线性能基准：在本地夹具服务器和模拟后端上测量 process_search_and_content、convert_url_to_markdown
+以及包含流式生成的完整问答流程（answer）
+
+用法：
+    python -m benchmarks.run_benchmark --target pipeline --concurrency 1,4,16 --requests 32
+    python -m benchmarks.run_benchmark --target convert --analyze-images --vision-latency 800:0.4:0.05
+
+输出各并发级别的吞吐（页/秒）、端到端延迟 p50/p95/p99、错误数和峰值RSS，可用 --json 保存结果。
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import FixtureServer, LatencyModel, install_mocks  # noqa: E402
+from stats_utils import percentile  # noqa: E402
+
+
+def current_rss_mb() -> float:
+    """当前进程常驻内存（MB），非Linux平台退化为历史峰值。"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RSSSampler:
+    """后台线程定期采样RSS，记录测量区间内的峰值。"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def run_level(operation: Callable[[int], int], concurrency: int, requests: int) -> Dict:
+    """
+    以指定并发执行 requests 次 operation，operation(i) 返回本次处理的页面数。
+    """
+    latencies: List[float] = []
+    errors = 0
+    pages = 0
+    lock = threading.Lock()
+
+    def one(i):
+        nonlocal errors, pages
+        started = time.perf_counter()
+        try:
+            count = operation(i)
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            pages += count
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(requests)))
+        wall = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": wall,
+        "pages_per_sec": pages / wall if wall else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "peak_rss_mb": rss.peak,
+    }
+
+
+# 各语言的查询模板；英文问题按单词计算覆盖率，与中文的二元组切分走不同的路径
+QUERY_TEMPLATES = {
+    "zh": "基准查询 {i}",
+    "en": "GPT-4o API streaming latency benchmark {i}",
+}
+
+
+def benchmark_query(args, i: int) -> str:
+    """第 i 个请求的问题：在 --queries 指定的语言间轮换。"""
+    langs = args.queries.split(",")
+    return QUERY_TEMPLATES[langs[i % len(langs)]].format(i=i)
+
+
+def make_operation(target: str, fixture: FixtureServer, args) -> Callable[[int], int]:
+    if target == "convert":
+        from html2md import convert_url_to_markdown
+
+        def convert(i):
+            md = convert_url_to_markdown(
+                fixture.page_url(i), provider="guiji", analyze_images=args.analyze_images, add_frontmatter=False
+            )
+            if not md:
+                raise RuntimeError("转换失败")
+            return 1
+
+        return convert
+
+    if target == "answer":
+        from rag_pipeline import stream_answer
+
+        def answer(i):
+            pages = 0
+            for event in stream_answer(benchmark_query(args, i), analyze_images=args.analyze_images):
+                if event["type"] == "sources":
+                    pages = len(event["search_results"])
+            return pages
+
+        return answer
+
+    from search_processing import process_search_and_content
+
+    def pipeline(i):
+        _, answer_blocks = process_search_and_content(
+            benchmark_query(args, i), max_results=args.max_results, analyze_images=args.analyze_images,
+            adaptive=not args.fixed_depth,
+        )
+        return len(answer_blocks)
+
+    return pipeline
+
+
+def print_table(target: str, rows: List[Dict]):
+    print(f"\n===== {target} =====")
+    print(f"{'conc':>5} {'req':>5} {'err':>4} {'pages/s':>9} {'p50(s)':>8} {'p95(s)':>8} {'p99(s)':>8} {'peakRSS(MB)':>12}")
+    for r in rows:
+        print(
+            f"{r['concurrency']:>5} {r['requests']:>5} {r['errors']:>4} {r['pages_per_sec']:>9.2f} "
+            f"{r['p50']:>8.3f} {r['p95']:>8.3f} {r['p99']:>8.3f} {r['peak_rss_mb']:>12.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka 离线性能基准")
+    parser.add_argument("--target", choices=["pipeline", "convert", "answer", "all"], default="all")
+    parser.add_argument("--concurrency", default="1,4,16", help="逗号分隔的并发级别")
+    parser.add_argument("--requests", type=int, default=16, help="每个并发级别的请求数")
+    parser.add_argument("--max-results", type=int, default=10)
+    parser.add_argument("--fixed-depth", action="store_true", help="pipeline 目标关闭自适应检索深度，总是抓取 max-results 篇")
+    parser.add_argument("--queries", default="zh,en", help="逗号分隔的查询语言（zh/en），各请求轮换使用")
+    parser.add_argument("--analyze-images", action="store_true")
+    parser.add_argument("--corpus", help="录制的语料目录（*.html 及图片），缺省使用合成页面")
+    parser.add_argument("--page-latency", default="50:0.5:0", help="页面延迟 median_ms:sigma:error_rate")
+    parser.add_argument("--image-latency", default="20:0.5:0")
+    parser.add_argument("--search-latency", default="300:0.3:0")
+    parser.add_argument("--llm-latency", default="400:0.3:0", help="文本模型首token延迟")
+    parser.add_argument("--vision-latency", default="600:0.4:0")
+    parser.add_argument("--json", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    unknown = set(args.queries.split(",")) - set(QUERY_TEMPLATES)
+    if unknown:
+        parser.error(f"未知的查询语言: {','.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+    targets = ["pipeline", "convert", "answer"] if args.target == "all" else [args.target]
+    fixture = FixtureServer(
+        corpus_dir=args.corpus,
+        page_latency=LatencyModel.parse(args.page_latency),
+        image_latency=LatencyModel.parse(args.image_latency),
+        llm_latency=LatencyModel.parse(args.llm_latency),
+        vision_latency=LatencyModel.parse(args.vision_latency),
+    )
+    results = {}
+    with fixture:
+        restore = install_mocks(fixture, LatencyModel.parse(args.search_latency))
+        try:
+            for target in targets:
+                operation = make_operation(target, fixture, args)
+                results[target] = [run_level(operation, level, args.requests) for level in levels]
+                print_table(target, results[target])
+        finally:
+            restore()
+    results["backend_requests"] = dict(fixture.counters)
+    print(f"\n后端请求数: {results['backend_requests']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+后台缓存预热：统计线上问题的频率，结合显式的关注列表，在热门问题的本地检索结果过期之前
+预先执行搜索、抓取和转换并写入本地索引，缓存过期后的第一位用户不必再走完整的冷路径。
+
+预热的抓取任务以后台优先级提交给抓取调度器：只在没有可执行的交互任务时出队，
+且同时执行的数量不超过 LINKA_FETCH_BACKGROUND_SHARE 比例的抓取并发；
+调度器中有交互任务排队时跳过本轮预热。
+
+环境变量：
+    LINKA_WARMER=0                  # 设为 1 启用（需要启用本地索引）
+    LINKA_WARMER_WATCHLIST=         # 关注列表文件，每行一个问题（# 开头为注释），始终预热
+    LINKA_WARMER_INTERVAL=60        # 检查周期（秒）
+    LINKA_WARMER_LEAD=3600          # 在本地索引新鲜期结束前多久（秒）重新抓取
+    LINKA_WARMER_HALF_LIFE=3600     # 问题频率的衰减半衰期（秒）
+    LINKA_WARMER_MIN_SCORE=3        # 衰减后的频率不低于该值才视为热门问题
+    LINKA_WARMER_TOP=20             # 每轮最多考虑的热门问题数
+    LINKA_WARMER_BATCH=5            # 每轮最多预热的问题数
+    LINKA_WARMER_RESULTS=5          # 预热时抓取的搜索结果数
+    LINKA_FETCH_BACKGROUND_SHARE=0.25  # 后台抓取最多占用的并发比例
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from answer_cache import normalize_query
+from tracing import span
+from web_search import local_index
+
+logger = logging.getLogger(__name__)
+
+# 跟踪的问题数上限，超出时丢弃频率最低的一半
+MAX_TRACKED = 5000
+
+
+def load_watchlist(path: str) -> List[str]:
+    """读取关注列表文件：每行一个问题，忽略空行和 # 开头的注释。"""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+class CacheWarmer:
+    """
+    热门问题与关注列表的后台预热器。
+
+    线上每个首轮问题经 observe() 计入按半衰期衰减的频率；后台线程每个周期挑出关注列表中的问题
+    和频率最高的问题，若其本地检索结果在 lead 秒内将不再新鲜，则以后台优先级重新检索。
+    """
+
+    def __init__(
+        self,
+        interval: float = 60,
+        lead: float = 3600,
+        half_life: float = 3600,
+        min_score: float = 3,
+        top: int = 20,
+        batch: int = 5,
+        results: int = 5,
+        watchlist: Iterable[str] = (),
+    ):
+        self.interval = interval
+        self.lead = lead
+        self.half_life = half_life
+        self.min_score = min_score
+        self.top = top
+        self.batch = batch
+        self.results = results
+        self._watchlist: Dict[str, str] = {}
+        self._scores: Dict[str, Tuple[float, float, str]] = {}  # 归一化问题 -> (频率, 更新时间, 原问题)
+        self._warmed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.warmed = 0
+        self.skipped_busy = 0
+        self.failures = 0
+        for query in watchlist:
+            self.add_watch(query)
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+    def observe(self, query: str):
+        """记录一次线上问题。"""
+        key = normalize_query(query)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            score, updated_at, _ = self._scores.get(key, (0.0, now, query))
+            self._scores[key] = (self._decayed(score, updated_at, now) + 1, now, query)
+            if len(self._scores) > MAX_TRACKED:
+                ranked = sorted(self._scores, key=lambda k: self._decayed(*self._scores[k][:2], now))
+                for stale in ranked[:len(ranked) // 2]:
+                    del self._scores[stale]
+                    self._warmed_at.pop(stale, None)
+
+    def add_watch(self, query: str):
+        key = normalize_query(query)
+        if key:
+            with self._lock:
+                self._watchlist[key] = query
+
+    def remove_watch(self, query: str):
+        with self._lock:
+            self._watchlist.pop(normalize_query(query), None)
+
+    def hot_queries(self) -> List[str]:
+        """关注列表中的问题在前，其后是频率不低于 min_score 的最热门问题。"""
+        now = time.time()
+        with self._lock:
+            ranked = sorted(
+                ((self._decayed(score, updated_at, now), key, query)
+                 for key, (score, updated_at, query) in self._scores.items()
+                 if key not in self._watchlist),
+                reverse=True,
+            )
+            hot = [query for score, _, query in ranked[:self.top] if score >= self.min_score]
+            return list(self._watchlist.values()) + hot
+
+    def due(self, query: str) -> bool:
+        """问题的本地检索结果在 lead 秒后是否仍足以直接回答；不足时需要预热。"""
+        warmed_at = self._warmed_at.get(normalize_query(query))
+        if warmed_at is not None and time.time() - warmed_at < self.lead:
+            return False
+        max_age = max(1.0, local_index.FRESH_SECONDS - self.lead)
+        results = local_index.search_local_index(query, max_results=self.results, max_age=max_age)
+        return not local_index.answerable(query, results)
+
+    def warm(self, query: str) -> int:
+        """跳过本地索引重新搜索并抓取，抓到的页面写入本地索引，返回抓取成功的页面数。"""
+        from search_processing import start_retrieval
+
+        with span("warmer", query=query) as warm_span:
+            job = start_retrieval(
+                query, max_results=self.results, preconnect=False, use_local_index=False, background=True,
+                adaptive=False,
+            )
+            job.collect()
+            warm_span.set(pages=job.fetched_pages)
+        self._warmed_at[normalize_query(query)] = time.time()
+        return job.fetched_pages
+
+    def run_once(self) -> List[str]:
+        """执行一轮预热，返回本轮预热的问题。"""
+        from net_utils.fetch_scheduler import get_fetch_scheduler
+
+        warmed = []
+        for query in self.hot_queries():
+            if len(warmed) >= self.batch or self._stop.is_set():
+                break
+            if get_fetch_scheduler().stats()["pending"]:
+                # 交互请求正在排队，让出本轮
+                self.skipped_busy += 1
+                break
+            try:
+                if not self.due(query):
+                    continue
+                pages = self.warm(query)
+                warmed.append(query)
+                self.warmed += 1
+                logger.debug("预热完成: %s（%d 个页面）", query, pages)
+            except Exception:
+                self.failures += 1
+                logger.exception("预热失败: %s", query)
+        return warmed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="linka-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "tracked": len(self._scores),
+                "watchlist": len(self._watchlist),
+                "warmed": self.warmed,
+                "skipped_busy": self.skipped_busy,
+                "failures": self.failures,
+            }
+
+
+_warmer: Optional[CacheWarmer] = None
+_warmer_lock = threading.Lock()
+
+
+def get_cache_warmer() -> Optional[CacheWarmer]:
+    """获取并启动进程级预热器；未设置 LINKA_WARMER=1 或本地索引未启用时返回None。"""
+    global _warmer
+    if os.getenv("LINKA_WARMER", "0") != "1":
+        return None
+    if _warmer is None:
+        with _warmer_lock:
+            if _warmer is None:
+                if local_index.get_local_index() is None:
+                    logger.warning("本地索引未启用，缓存预热不生效")
+                    return None
+                path = os.getenv("LINKA_WARMER_WATCHLIST")
+                warmer = CacheWarmer(
+                    interval=float(os.getenv("LINKA_WARMER_INTERVAL", "60")),
+                    lead=float(os.getenv("LINKA_WARMER_LEAD", "3600")),
+                    half_life=float(os.getenv("LINKA_WARMER_HALF_LIFE", "3600")),
+                    min_score=float(os.getenv("LINKA_WARMER_MIN_SCORE", "3")),
+                    top=int(os.getenv("LINKA_WARMER_TOP", "20")),
+                    batch=int(os.getenv("LINKA_WARMER_BATCH", "5")),
+                    results=int(os.getenv("LINKA_WARMER_RESULTS", "5")),
+                    watchlist=load_watchlist(path) if path else (),
+                )
+                warmer.start()
+                _warmer = warmer
+    return _warmer
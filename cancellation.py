@@ -0,0 +1,75 @@
+"""
+协作式取消：会话级取消令牌，供搜索、抓取、图片分析和大模型流式输出在检查点处提前退出
+"""
+import threading
+from typing import Callable, List
+
+
+class OperationCancelled(Exception):
+    """当前操作已被取消（用户发送了新消息或离开页面）。"""
+
+
+class CancelToken:
+    """
+    线程安全的取消令牌。
+
+    调用 cancel() 后，cancelled 变为 True，并依次执行已注册的回调
+    （例如取消排队中的抓取任务、取消事件循环中的图片分析任务、关闭HTTP流）。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消令牌并执行全部回调，重复调用无副作用。"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 OperationCancelled。"""
+        if self._event.is_set():
+            raise OperationCancelled("操作已取消")
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消回调；若令牌已取消则立即执行。
+
+        :param callback: 无参回调函数
+        :return: 注销该回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+
+                def remove():
+                    with self._lock:
+                        if callback in self._callbacks:
+                            self._callbacks.remove(callback)
+
+                return remove
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: float = None) -> bool:
+        """阻塞直到被取消或超时，返回是否已取消。"""
+        return self._event.wait(timeout)
+
+
+def raise_if_cancelled(cancel_token):
+    """cancel_token 可为 None 的便捷检查。"""
+    if cancel_token is not None:
+        cancel_token.raise_if_cancelled()
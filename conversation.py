@@ -0,0 +1,285 @@
+"""
+会话状态：保存上一轮检索到的资料，并为追问选择检索策略
+
+每轮问题由 route_turn 判断：
+    - reuse        明确指向上一轮回答的追问（如"展开第二点"），或问题要点已被已有资料覆盖，直接复用上一轮资料
+    - incremental  部分要点未覆盖，只针对缺失部分补充少量搜索结果并合并
+    - full         无上一轮资料、资料过期或话题已切换，重新完整搜索
+
+环境变量：
+    LINKA_CONTEXT_TTL=1800            # 上一轮资料的有效期（秒）
+    LINKA_ROUTE_REUSE_COVERAGE=0.7    # 问题要点覆盖率不低于该值时复用
+    LINKA_ROUTE_INCREMENTAL_COVERAGE=0.3  # 覆盖率不低于该值时补充搜索，否则完整搜索
+    LINKA_ROUTE_FOLLOW_UP_CHARS=12    # 含追问标记且不超过该长度（归一化后）的问题直接复用
+    LINKA_INCREMENTAL_RESULTS=3       # 补充搜索抓取的结果数
+    LINKA_CONTEXT_MAX_BLOCKS=12       # 合并后最多保留的资料篇数
+    LINKA_SESSION_MAX=1000            # HTTP服务保留的会话数
+    LINKA_HISTORY_TOKEN_BUDGET=2000   # 传给模型的历史消息token预算
+    LINKA_HISTORY_MAX_MESSAGES=40     # 每个会话保存的消息条数上限
+    LINKA_HISTORY_FULL_TURNS=1        # 传给模型时保留全文的最近助手回复条数，更早的回复压缩后传入
+    LINKA_HISTORY_COMPACT_CHARS=300   # 压缩后每条回复的最大字符数
+"""
+import collections
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from answer_cache import normalize_query
+
+CONTEXT_TTL = float(os.getenv("LINKA_CONTEXT_TTL", "1800"))
+REUSE_COVERAGE = float(os.getenv("LINKA_ROUTE_REUSE_COVERAGE", "0.7"))
+INCREMENTAL_COVERAGE = float(os.getenv("LINKA_ROUTE_INCREMENTAL_COVERAGE", "0.3"))
+FOLLOW_UP_CHARS = int(os.getenv("LINKA_ROUTE_FOLLOW_UP_CHARS", "12"))
+INCREMENTAL_RESULTS = int(os.getenv("LINKA_INCREMENTAL_RESULTS", "3"))
+CONTEXT_MAX_BLOCKS = int(os.getenv("LINKA_CONTEXT_MAX_BLOCKS", "12"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("LINKA_HISTORY_TOKEN_BUDGET", "2000"))
+HISTORY_MAX_MESSAGES = int(os.getenv("LINKA_HISTORY_MAX_MESSAGES", "40"))
+HISTORY_FULL_TURNS = int(os.getenv("LINKA_HISTORY_FULL_TURNS", "1"))
+HISTORY_COMPACT_CHARS = int(os.getenv("LINKA_HISTORY_COMPACT_CHARS", "300"))
+
+# 明确指向上一轮回答的追问标记；"为什么""这个"之类的常用词在新问题中同样常见，不作为标记
+_FOLLOW_UP_RE = re.compile(
+    r"展开|继续|接着说|再说说|多说点|第[一二三四五六七八九十\d]+[点条项]|上面|上述|刚才|前面|以上|"
+    r"\b(elaborate|continue|above|previous|(first|second|third|last) point|point \d+)\b",
+    re.IGNORECASE,
+)
+# 英文虚词不代表问题要点
+_ENGLISH_STOPWORDS = frozenset(
+    "a an the is are was were be been being of in on at to for from by with and or not no what which who whom "
+    "whose when where why how do does did it its this that these those there here i you he she we they me my "
+    "your our their can could should would will shall may might must about as into than then so if".split()
+)
+# 疑问词和虚词不代表问题要点，提取前先作为分隔符去掉
+_QUESTION_WORDS_RE = re.compile(r"怎么样|为什么|什么|怎么|如何|多少|哪些|哪个|是否|有没有|[的了吗呢吧啊呀和与及或是]")
+_CJK_RUN_RE = re.compile(r"[一-鿿]+")
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9.+#-]*")
+_CJK_CHAR_RE = re.compile(r"[一-鿿　-〿＀-￯]")
+_MD_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+_MD_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_CITATION_RE = re.compile(r"\[\d+(?:[,，\s]*\d+)*\]")
+_MD_SYNTAX_RE = re.compile(r"^[#>*\-\s]+|[*_`]+", re.MULTILINE)
+
+
+def query_terms(query: str) -> List[str]:
+    """提取问题要点：英文/数字词（先按空白切分再归一化，去掉虚词），以及中文连续片段的二元组。"""
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    terms = []
+    for word in _WORD_RE.findall(text):
+        word = normalize_query(word)
+        if len(word) > 1 and word not in _ENGLISH_STOPWORDS:
+            terms.append(word)
+    normalized = normalize_query(text)
+    for run in _CJK_RUN_RE.findall(_QUESTION_WORDS_RE.sub(" ", normalized)):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def term_coverage(query: str, text: str) -> float:
+    """问题要点在文本中出现的比例；text 需已经过 normalize_query。问题没有要点时返回1.0。"""
+    terms = query_terms(query)
+    if not terms:
+        return 1.0
+    return sum(1 for term in terms if term in text) / len(terms)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计token数：中文字符约1个token，其余约4个字符1个token。"""
+    cjk = len(_CJK_CHAR_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def compact_message(content: str, max_chars: int = HISTORY_COMPACT_CHARS) -> str:
+    """压缩一条历史回复：去掉图片、链接地址、引用标号和Markdown标记，合并空白后截断。"""
+    text = _MD_IMAGE_RE.sub("", content)
+    text = _MD_LINK_RE.sub(r"\1", text)
+    text = _CITATION_RE.sub("", text)
+    text = _MD_SYNTAX_RE.sub("", text)
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+def fit_history(
+    messages: Optional[List[Dict[str, str]]],
+    max_tokens: int = HISTORY_TOKEN_BUDGET,
+    full_turns: int = HISTORY_FULL_TURNS,
+) -> List[Dict[str, str]]:
+    """
+    在token预算内组装传给模型的历史消息。
+
+    最近 full_turns 条助手回复保留全文（预算不足时也压缩），更早的压缩；
+    从最新的消息往前累加，超出预算后丢弃更早的全部消息，并保证历史以用户消息开头。
+    """
+    messages = list(messages or [])
+    assistant_seen = 0
+    fitted: List[Dict[str, str]] = []
+    used = 0
+    for message in reversed(messages):
+        content = message.get("content") or ""
+        if message.get("role") == "assistant":
+            assistant_seen += 1
+            if assistant_seen > full_turns:
+                content = compact_message(content)
+        cost = estimate_tokens(content)
+        if used + cost > max_tokens and message.get("role") == "assistant":
+            # 放不下全文时先退回压缩形式，仍放不下才停止
+            content = compact_message(content)
+            cost = estimate_tokens(content)
+        if used + cost > max_tokens:
+            break
+        used += cost
+        fitted.append({"role": message["role"], "content": content})
+    fitted.reverse()
+    while fitted and fitted[0]["role"] != "user":
+        fitted.pop(0)
+    return fitted
+
+
+class ChatHistory:
+    """
+    一个会话的对话记录：条数有上限，长对话不会无限占用内存。
+    保存的是全文（界面按原样重新渲染），压缩只在 for_model() 组装传给模型的历史时进行。
+    """
+
+    def __init__(self, max_messages: int = HISTORY_MAX_MESSAGES, full_turns: int = HISTORY_FULL_TURNS):
+        self.max_messages = max_messages
+        self.full_turns = full_turns
+        self.messages: List[Dict[str, str]] = []
+
+    def append(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        excess = len(self.messages) - self.max_messages
+        if excess > 0:
+            del self.messages[:excess]
+            while self.messages and self.messages[0]["role"] != "user":
+                self.messages.pop(0)
+
+    def for_model(self, max_tokens: int = HISTORY_TOKEN_BUDGET) -> List[Dict[str, str]]:
+        return fit_history(self.messages, max_tokens, self.full_turns)
+
+    def clear(self):
+        self.messages.clear()
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __len__(self):
+        return len(self.messages)
+
+
+class RetrievalContext:
+    """上一轮（或几轮）检索得到的搜索结果与正文，以及服务过的问题。"""
+
+    def __init__(self, query: str, search_summaries: List[Tuple], answer_blocks: List[Tuple[str, str]]):
+        self.queries = [query]
+        self.search_summaries = list(search_summaries)
+        self.answer_blocks = list(answer_blocks)
+        self.updated_at = time.time()
+        self._text = None
+
+    @property
+    def topic(self) -> str:
+        """最初的问题，补充搜索时作为话题前缀。"""
+        return self.queries[0]
+
+    def expired(self) -> bool:
+        return time.time() - self.updated_at > CONTEXT_TTL
+
+    def text(self) -> str:
+        # 覆盖率计算用的小写全文，按需生成一次
+        if self._text is None:
+            parts = list(self.queries)
+            parts.extend(f"{title or ''} {snippet or ''}" for title, _, snippet in self.search_summaries)
+            parts.extend(md for md, _ in self.answer_blocks)
+            self._text = normalize_query("\n".join(parts))
+        return self._text
+
+    def coverage(self, query: str) -> float:
+        """问题要点在已有资料中出现的比例。"""
+        return term_coverage(query, self.text())
+
+    def touch(self, query: str):
+        self.queries.append(query)
+        self.updated_at = time.time()
+        self._text = None
+
+    def merge(self, query: str, search_summaries: List[Tuple], answer_blocks: List[Tuple[str, str]]):
+        """合并补充搜索的结果，按URL去重，超出上限时丢弃最早的资料。"""
+        known = {url for _, url in self.answer_blocks}
+        self.answer_blocks.extend(block for block in answer_blocks if block[1] not in known)
+        known = {url for _, url, _ in self.search_summaries}
+        self.search_summaries.extend(s for s in search_summaries if s[1] not in known)
+        del self.answer_blocks[:-CONTEXT_MAX_BLOCKS]
+        del self.search_summaries[:-CONTEXT_MAX_BLOCKS]
+        self.touch(query)
+
+
+class RouteDecision(NamedTuple):
+    action: str  # "reuse" | "incremental" | "full"
+    search_query: Optional[str] = None
+    coverage: float = 0.0
+
+
+def route_turn(query: str, context: Optional[RetrievalContext]) -> RouteDecision:
+    """根据上一轮资料为本轮问题选择检索策略，只做本地字符串匹配，不调用模型。"""
+    if context is None or context.expired() or not context.answer_blocks:
+        return RouteDecision("full", query)
+    coverage = context.coverage(query)
+    follow_up = _FOLLOW_UP_RE.search(query) is not None and (
+        len(normalize_query(query)) <= FOLLOW_UP_CHARS or coverage >= INCREMENTAL_COVERAGE
+    )
+    if follow_up or coverage >= REUSE_COVERAGE:
+        return RouteDecision("reuse", None, coverage)
+    if coverage >= INCREMENTAL_COVERAGE:
+        # 追问往往省略主语，带上原话题让补充搜索命中同一主题下的缺失部分
+        return RouteDecision("incremental", f"{context.topic} {query}", coverage)
+    return RouteDecision("full", query, coverage)
+
+
+class ConversationState:
+    """一个会话跨轮次保存的状态。"""
+
+    def __init__(self):
+        self.history = ChatHistory()
+        self.retrieval: Optional[RetrievalContext] = None
+
+
+class ConversationStore:
+    """HTTP服务端按 session_id 保存会话状态，LRU淘汰并丢弃过期会话。"""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = CONTEXT_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "collections.OrderedDict[str, Tuple[float, ConversationState]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationState:
+        now = time.time()
+        with self._lock:
+            item = self._sessions.pop(session_id, None)
+            state = item[1] if item is not None and now - item[0] < self.ttl else ConversationState()
+            self._sessions[session_id] = (now, state)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return state
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """获取进程级会话存储。"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(max_sessions=int(os.getenv("LINKA_SESSION_MAX", "1000")))
+    return _store
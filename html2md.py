@@ -1,214 +1,28 @@
-import requests
-import trafilatura
-from markdownify import markdownify as md
 import json
-from dateutil.parser import parse
-from datetime import timezone
-from typing import Optional
-import asyncio
-from bs4 import BeautifulSoup
-from image_utils.async_image_analysis import AsyncImageAnalysis
-from markdownify import MarkdownConverter
+import logging
 import re
-from typing import List, Dict, Any
-from markdownify import MarkdownConverter, abstract_inline_conversion, chomp
-from urllib.parse import urljoin, urlparse
-from bs4 import BeautifulSoup
+from datetime import timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 import asyncio
-import os
-from typing import Optional
-from image_utils.async_image_analysis import AsyncImageAnalysis
 
+import requests
+from dotenv import load_dotenv
 
-class ImageDescMarkdownConverter(MarkdownConverter):
-    """
-    自定义Markdown转换器，继承自MarkdownConverter。
-    提供了更灵活的HTML到Markdown转换选项，例如：
-    - 转换链接为绝对路径。
-    - 移除所有链接和图片。
-    - 特殊处理包含colspan或rowspan的表格。
-    """
+from net_utils.http_session import get_http_session
+from cancellation import OperationCancelled, raise_if_cancelled
+from tracing import span
+from profiling import profile_scope
 
-    def __init__(self, **kwargs):
-        """
-        初始化自定义的Markdown转换器。
-
-        :param current_url: 当前页面的URL，用于将相对链接和图片路径转换为绝对路径。
-                            如果提供了此参数，图片和链接的URL将自动转换为绝对路径。
-        :param kwargs: 其他传递给父类MarkdownConverter的参数。
-                       例如：strip (需要移除的标签列表), convert (仅转换的标签列表), heading_style等。
-        """
-        super().__init__(**kwargs)
-        self.current_url = kwargs.get("current_url", None)  # 存储当前URL，用于路径转换
-        self.img_desc_map = kwargs.get("img_desc_map", {})  # 新增，保存图片描述映射
-
-    def convert_img(self, el, text, parent_tags):
-        """
-        转换<img>标签为Markdown格式的图片。
-        如果提供了current_url，则将图片src转换为绝对路径。
-        仅做基础的Markdown图片语法转换，不再进行图片分析。
-
-        :param el: BeautifulSoup的Tag对象，代表<img>元素。
-        :param text: 图片的替代文本（通常为空，因为alt属性会被单独提取）。
-        :param parent_tags: 父标签集合，用于判断上下文。
-        :return: Markdown格式的图片字符串，或者在特定情况下返回alt文本或空字符串。
-        """
-        alt_text = el.attrs.get("alt", "") or ""
-        src_url = el.attrs.get("src", "") or ""
-        title_text = el.attrs.get("title", "") or ""
-
-        if (
-            "_inline" in parent_tags
-            and el.parent.name not in self.options["keep_inline_images_in"]
-        ):
-            return alt_text
-
-        if not src_url:
-            return alt_text
-
-        # 转换为绝对路径
-        if self.current_url:
-            src_url = urljoin(self.current_url, src_url)
-
-        # 优先使用AI分析结果
-        if self.img_desc_map and src_url in self.img_desc_map:
-            desc_info = self.img_desc_map[src_url]
-            ai_title = desc_info.get("title") or alt_text or "图片"
-            ai_desc = desc_info.get("description", "")
-            md = f"![{ai_title}]({src_url})"
-            if ai_desc:
-                md += "\n" + "\n".join(f"> {line}" for line in ai_desc.strip().splitlines())
-            return md
-
-        if title_text:
-            escaped_title = title_text.replace('"', r"\"")
-            title_part = f' "{escaped_title}"'
-        else:
-            title_part = ""
-        return f"![{alt_text}]({src_url}{title_part})"
-
-    def _process_table_element(self, element):
-        """
-        辅助方法：处理包含colspan或rowspan属性的表格元素（td, th）。
-        此方法会解析传入的表格元素字符串，并移除除了'colspan'和'rowspan'之外的所有属性。
-        目的是在保留表格结构的同时，简化HTML，以便后续可能由其他工具或手动进行更复杂的Markdown转换。
-
-        :param element: BeautifulSoup的Tag对象，代表一个HTML表格元素（如<table>, <tr>, <td>, <th>）。
-        :return: 处理后的HTML元素字符串，仅保留colspan和rowspan属性。
-        """
-        # 使用BeautifulSoup解析传入的元素字符串，确保操作的是一个独立的DOM结构
-        soup = BeautifulSoup(str(element), "html.parser")
-        # 遍历soup中的所有标签
-        for tag in soup.find_all(True):
-            # 定义需要保留的属性列表
-            attrs_to_keep = ["colspan", "rowspan"]
-            # 更新标签的属性字典，只保留在attrs_to_keep列表中的属性
-            tag.attrs = {
-                key: value for key, value in tag.attrs.items() if key in attrs_to_keep
-            }
-        # 返回处理后soup的字符串表示形式
-        return str(soup)
-
-    def convert_table(self, el, text, parent_tags):
-        """
-        转换<table>标签为Markdown格式。
-        如果表格中的<td>或<th>标签包含colspan或rowspan属性，
-        则调用_process_table_element方法返回处理过的HTML字符串（保留结构但简化属性），
-        否则，调用父类的convert_table方法进行标准转换。
-
-        :param el: BeautifulSoup的Tag对象，代表<table>元素。
-        :param text: 表格的内部文本内容（通常由子元素的转换结果拼接而成）。
-        :param parent_tags: 父标签集合，用于判断上下文。
-        :return: Markdown格式的表格字符串，或者在包含合并单元格时返回处理后的HTML字符串。
-        """
-        # 使用BeautifulSoup解析传入的<table>元素字符串
-        soup = BeautifulSoup(str(el), "html.parser")
-        # 检查表格中是否存在任何带有colspan或rowspan属性的<td>或<th>标签
-        has_colspan_or_rowspan = any(
-            tag.has_attr("colspan") or tag.has_attr("rowspan")
-            for tag in soup.find_all(["td", "th"])
-        )
-        if has_colspan_or_rowspan:
-            # 如果存在合并单元格，则调用_process_table_element处理整个表格元素
-            # 返回的是简化属性后的HTML字符串，而不是Markdown
-            return self._process_table_element(el)
-        else:
-            # 如果没有合并单元格，则调用父类的convert_table方法进行标准Markdown转换
-            return super().convert_table(el, text, parent_tags)
-
-    def convert_a(self, el, text, parent_tags):
-        """
-        转换<a>标签（链接）为Markdown格式。
-        如果提供了current_url，则将链接href转换为绝对路径。
-        处理自动链接（autolinks）和默认标题（default_title）的选项。
-
-        :param el: BeautifulSoup的Tag对象，代表<a>元素。
-        :param text: 链接的显示文本。
-        :param convert_as_inline: 布尔值，指示是否应将此链接作为内联元素处理。
-        :return: Markdown格式的链接字符串，或者在特定情况下返回空字符串。
-        """
-
-        # 使用chomp函数处理链接文本，分离前导/尾随空格
-        prefix, suffix, text = chomp(text)
-        if not text:
-            # 如果链接文本为空（例如空的<a></a>标签），则返回空字符串
-            return ""
-
-        # 获取链接的href和title属性
-        href_url = el.get("href")
-        title_text = el.get("title")
-
-        if self.current_url and href_url:
-            # 如果需要将链接href转换为绝对路径
-            # 使用urljoin将href_url（可能是相对路径）与current_url合并为绝对路径
-            href_url = urljoin(self.current_url, href_url)
-
-        # 处理Markdownify的autolinks选项：如果链接文本和href相同，且无标题，则使用<href>格式
-        if (
-            self.options.get("autolinks", False)  # 检查autolinks选项是否存在且为True
-            and text.replace(r"\_", "_")
-            == href_url  # 文本（处理转义的下划线后）与href相同
-            and not title_text  # 没有title属性
-            and not self.options.get("default_title", False)
-        ):  # default_title选项未开启
-            return f"<{href_url}>"  # 返回自动链接格式
-
-        # 处理Markdownify的default_title选项：如果没有title属性，但开启了default_title，则使用href作为title
-        if self.options.get("default_title", False) and not title_text and href_url:
-            title_text = href_url
-
-        # 处理链接标题，如果存在，则进行转义并格式化
-        if title_text:
-            escaped_title = title_text.replace('"', r"\"")  # 转义双引号
-            title_part = f' "{escaped_title}"'  # 格式化为 "title"
-        else:
-            title_part = ""  # 如果没有标题，则为空
-
-        # 返回标准Markdown格式的链接：[text](href_url "title_text")
-        # 如果href_url为空或None，则只返回处理过的文本（prefix + text + suffix）
-        return (
-            f"{prefix}[{text}]({href_url}{title_part}){suffix}"
-            if href_url
-            else f"{prefix}{text}{suffix}"
-        )
+if TYPE_CHECKING:
+    from image_utils.async_image_analysis import AsyncImageAnalysis
 
-    # 加粗标签<b>的转换，使用markdownify库提供的abstract_inline_conversion辅助函数
-    # self.options['strong_em_symbol'] 通常是 '*' 或 '_'
-    # lambda self: 2 * self.options['strong_em_symbol'] 表示使用两个符号包裹文本，例如 **text**
-    convert_b = abstract_inline_conversion(
-        lambda self: 2 * self.options.get("strong_em_symbol", "*")
-    )
+# trafilatura、markdownify、BeautifulSoup、dateutil 和图片分析模块（openai、aiofiles）导入较慢，
+# 均在首次使用时才加载，只用搜索摘要的进程不必承担；preload() 可在启动时提前加载。
+# 图片分析模块导入时会读取 .env，这里保留该行为，保证模型配置照常生效。
+load_dotenv()
 
-    # 强调标签<em>或<i>的转换，同样使用abstract_inline_conversion
-    # lambda self: self.options['strong_em_symbol'] 表示使用一个符号包裹文本，例如 *text*
-    convert_em = abstract_inline_conversion(
-        lambda self: self.options.get("strong_em_symbol", "*")
-    )
-    convert_i = convert_em  # <i>标签通常与<em>行为一致
+logger = logging.getLogger(__name__)
 
-    # 删除线标签<del>或<s>的转换
-    convert_del = abstract_inline_conversion(lambda self: "~~")
-    convert_s = convert_del  # <s>标签通常与<del>行为一致
 
 # 匹配Markdown图片语法的正则表达式
 IMG_TAG_RE = re.compile(r'!\[.*?\]\((https?://[^\)]+)\)', re.IGNORECASE)
@@ -221,7 +35,7 @@ def extract_img_urls(markdown: str) -> List[str]:
 
 
 async def analyze_images_concurrently(
-    img_urls: List[str], analyzer: AsyncImageAnalysis
+    img_urls: List[str], analyzer: "AsyncImageAnalysis"
 ) -> List[Dict[str, Any]]:
     tasks = [analyzer.analyze_image(image_url=url) for url in img_urls]
     return await asyncio.gather(*tasks)
@@ -251,8 +65,31 @@ def replace_img_tags_with_markdown(
     return IMG_TAG_RE.sub(replacement, html)
 
 
+# 尚未附带描述的图片：图片语法后没有紧跟 "> " 开头的描述行
+UNDESCRIBED_IMG_RE = re.compile(IMG_TAG_RE.pattern + r'(?!\n> )', re.IGNORECASE)
+
+
+def apply_image_descriptions(markdown: str, descriptions: Dict[str, Dict[str, Any]]) -> str:
+    """按 {图片URL: 分析结果} 为Markdown中的图片补上标题和描述，已附带描述的图片保持不变。"""
+    if not descriptions:
+        return markdown
+
+    def replacement(match):
+        url = match.group(1)
+        result = descriptions.get(url)
+        if not result or result.get("error"):
+            return match.group(0)
+        md = f"![{result.get('title') or '图片'}]({url})"
+        desc = result.get("description", "")
+        if desc:
+            md += "\n" + "\n".join(f"> {line}" for line in desc.strip().splitlines())
+        return md
+
+    return UNDESCRIBED_IMG_RE.sub(replacement, markdown)
+
+
 def html2md_with_concurrent_image_analysis(
-    html: str, analyzer: AsyncImageAnalysis
+    html: str, analyzer: "AsyncImageAnalysis"
 ) -> str:
     """批量并发分析图片并替换为带AI描述的Markdown图片语法"""
     img_urls = extract_img_urls(html)
@@ -263,6 +100,9 @@ def html2md_with_concurrent_image_analysis(
 
 
 async def analyze_images_from_html(html, provider="zhipu", max_concurrent=10):
+    from bs4 import BeautifulSoup
+    from image_utils.vision_router import create_image_analyzer
+
     soup = BeautifulSoup(html, "html.parser")
     img_tags = soup.find_all("img")
     img_srcs = [img.get("src") for img in img_tags if img.get("src")]
@@ -272,7 +112,7 @@ async def analyze_images_from_html(html, provider="zhipu", max_concurrent=10):
     img_srcs = list(dict.fromkeys(img_srcs))
     # 构造分析输入
     image_sources = [{"image_url": src} for src in img_srcs]
-    async with AsyncImageAnalysis(
+    async with create_image_analyzer(
         provider=provider, max_concurrent=max_concurrent
     ) as analyzer:
         results = await analyzer.analyze_multiple_images(image_sources)
@@ -287,6 +127,75 @@ async def analyze_images_from_html(html, provider="zhipu", max_concurrent=10):
     return img_desc_map
 
 
+# Markdown输出配置：
+#     default  便于阅读的Markdown，按80列折行，链接保留完整地址
+#     prompt   送入模型的紧凑Markdown，不折行、合并空白、丢弃页面框架元素，链接地址替换为文档内短编号
+OUTPUT_PROFILES = ("default", "prompt")
+
+_LINK_REF_RE = re.compile(r'\]\(#(L\d+)\)')
+
+
+def render_markdown(
+    html: str,
+    url: Optional[str] = None,
+    output_profile: str = "default",
+    link_table: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    将正文HTML转换为Markdown。
+    :param output_profile: 输出配置，见 OUTPUT_PROFILES
+    :param link_table: prompt 配置下传入一个字典时，链接输出为短编号 [文字](#L1)，转换后填入编号到原地址的
+        对应关系（可用 expand_link_refs 还原）；不传时链接只保留文字
+    """
+    if output_profile not in OUTPUT_PROFILES:
+        raise ValueError(f"未知的输出配置: {output_profile}")
+    if output_profile == "prompt":
+        from html2md_converter import PromptMarkdownConverter
+
+        converter = PromptMarkdownConverter(current_url=url, link_refs=link_table is not None)
+        markdown = converter.convert(html)
+        if link_table is not None:
+            link_table.update(converter.link_table)
+        return markdown
+    from html2md_converter import ImageDescMarkdownConverter
+
+    return ImageDescMarkdownConverter(heading_style="ATX", wrap=True, wrap_width=80).convert(html)
+
+
+def expand_link_refs(markdown: str, link_table: Dict[str, str]) -> str:
+    """把 prompt 配置输出中的链接编号还原为原地址，未知编号保持不变。"""
+    return _LINK_REF_RE.sub(
+        lambda m: f"]({link_table[m.group(1)]})" if m.group(1) in link_table else m.group(0),
+        markdown,
+    )
+
+
+def __getattr__(name):
+    # 转换器类移到了 html2md_converter，按需导入以保持 html2md.ImageDescMarkdownConverter 可用
+    if name == "ImageDescMarkdownConverter":
+        from html2md_converter import ImageDescMarkdownConverter
+
+        return ImageDescMarkdownConverter
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def preload(analyze_images: bool = True) -> None:
+    """
+    提前加载转换用到的重量级依赖，并用一小段HTML跑一遍提取和转换，
+    预热 trafilatura/lxml 的解析器与 markdownify 的内部缓存。
+    """
+    import trafilatura
+    from dateutil.parser import parse
+
+    sample = "<html><body><article><h1>Linka</h1><p>" + "预热 warm-up. " * 40 + "</p></article></body></html>"
+    html_content = trafilatura.extract(sample, include_tables=True, include_images=True, include_links=True)
+    for output_profile in OUTPUT_PROFILES:
+        render_markdown(html_content or sample, output_profile=output_profile)
+    parse("2024-05-13")
+    if analyze_images:
+        import image_utils.vision_router  # noqa: F401
+
+
 def convert_url_to_markdown(
     url: str,
     provider: str = "zhipu",
@@ -296,6 +205,11 @@ def convert_url_to_markdown(
     max_concurrent: int = 10,
     analyze_images: bool = True,  
     add_frontmatter: bool = True,  
+    cancel_token=None,
+    profile: Optional[bool] = None,
+    output_profile: str = "default",
+    link_table: Optional[Dict[str, str]] = None,
+    defer_images: bool = False,
 ) -> Optional[str]:
     """
     获取网页主要内容，转换为带YAML Frontmatter的Markdown字符串。
@@ -307,33 +221,59 @@ def convert_url_to_markdown(
     :param max_concurrent: 最大图片分析并发数
     :param analyze_images: 是否开启图片分析
     :param add_frontmatter: 是否添加YAML frontmatter（新增）
+    :param cancel_token: 取消令牌（可选），取消后在下一个检查点抛出OperationCancelled，并中止进行中的图片分析
+    :param profile: 是否对本次转换进行性能剖析（None表示按 LINKA_PROFILE_RATE 采样）
+    :param output_profile: Markdown输出配置，"default" 或 "prompt"（见 OUTPUT_PROFILES）
+    :param link_table: prompt 配置下用于接收链接编号到原地址对应关系的字典（可选，不传时链接只保留文字）
+    :param defer_images: 为True时不等待图片分析：只使用已缓存的图片描述，其余图片提交后台分析，
+        结果写入图片描述缓存（见 image_utils.image_desc_cache）
     :return: Markdown字符串或None
     """
-    print(f"🚀 正在处理 URL: {url}\n")
+    with profile_scope("convert", force=profile, url=url):
+        return _convert_url_to_markdown(
+            url, provider, api_key, base_url, vision_model, max_concurrent,
+            analyze_images, add_frontmatter, cancel_token, output_profile, link_table, defer_images,
+        )
+
+
+def _convert_url_to_markdown(
+    url, provider, api_key, base_url, vision_model, max_concurrent,
+    analyze_images, add_frontmatter, cancel_token, output_profile="default", link_table=None,
+    defer_images=False,
+) -> Optional[str]:
+    logger.debug("🚀 正在处理 URL: %s", url)
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     try:
-        resp = requests.get(url, headers=headers, timeout=20)
+        raise_if_cancelled(cancel_token)
+        # 使用共享会话：复用连接池、DNS缓存以及预连接建立的连接
+        with span("page.fetch", url=url) as fetch_span:
+            resp = get_http_session().get(url, headers=headers, timeout=20)
+            fetch_span.set(status=resp.status_code, bytes=len(resp.content))
         resp.raise_for_status()
+        raise_if_cancelled(cancel_token)
         
         # --- 步骤 1: 使用trafilatura提取内容 ---
-        html_content = trafilatura.extract(
-            resp.content,
-            include_comments=False,
-            include_tables=True,
-            include_images=True,
-            include_links=True,
-        )
-        json_output = trafilatura.extract(
-            resp.content,
-            output_format="json",
-            include_comments=False,
-            include_tables=True,
-        )
+        import trafilatura
+
+        with span("page.extract", url=url):
+            html_content = trafilatura.extract(
+                resp.content,
+                include_comments=False,
+                include_tables=True,
+                include_images=True,
+                include_links=True,
+            )
+            json_output = trafilatura.extract(
+                resp.content,
+                output_format="json",
+                include_comments=False,
+                include_tables=True,
+            )
 
         if not html_content and not json_output:
-            print("❌ 提取内容失败，页面可能不兼容或无正文。")
+            logger.info("❌ 提取内容失败，页面可能不兼容或无正文: %s", url)
             return None
 
         metadata = {
@@ -355,7 +295,7 @@ def convert_url_to_markdown(
                     }
                 )
             except json.JSONDecodeError:
-                print("❌ 解析提取的JSON数据失败，使用默认元数据。")
+                logger.info("❌ 解析提取的JSON数据失败，使用默认元数据: %s", url)
 
         # 使用HTML内容，如果没有则尝试从JSON获取文本
         main_content = html_content
@@ -371,70 +311,93 @@ def convert_url_to_markdown(
                 pass
 
         if not main_content:
-            print("❌ 未能提取到任何文本内容")
+            logger.info("❌ 未能提取到任何文本内容: %s", url)
             return None
 
-        print(f"📏 提取到的内容长度: {len(main_content)} 字符")        # --- 步骤 3: 处理HTML内容并转换为Markdown ---
+        logger.debug("📏 提取到的内容长度: %d 字符", len(main_content))
+        # --- 步骤 3: 处理HTML内容并转换为Markdown ---
         if "<" in main_content and ">" in main_content:
             clean_html = main_content
         else:
             clean_html = f"<p>{main_content.replace(chr(10), '</p><p>')}</p>"
         
         # 先转换为基础Markdown
-        converter = ImageDescMarkdownConverter(
-            heading_style="ATX", wrap=True, wrap_width=80
-        )
-        markdown_body = converter.convert(clean_html)
+        with span("page.convert", url=url, html_chars=len(clean_html), output_profile=output_profile) as convert_span:
+            markdown_body = render_markdown(clean_html, url, output_profile, link_table)
+            convert_span.set(md_chars=len(markdown_body))
         
         # --- 步骤 4: 对Markdown中的图片进行分析和替换 ---
+        raise_if_cancelled(cancel_token)
         if analyze_images:
-            print(f"🔍 开始图片分析，provider: {provider}")
-            # 用正则从Markdown中提取图片URL
-            img_urls = re.findall(r'!\[.*?\]\((https?://[^\)]+)\)', markdown_body)
-            
-            if img_urls:
+            logger.debug("🔍 开始图片分析，provider: %s", provider)
+            from image_utils.image_desc_cache import get_background_analyzer, get_image_desc_cache
+
+            # 用正则从Markdown中提取图片URL，已缓存描述的图片不再调用视觉模型
+            desc_cache = get_image_desc_cache()
+            with span("page.images.filter", url=url) as filter_span:
+                img_srcs_unique = extract_img_urls(markdown_body)
+                descriptions = desc_cache.get_many(img_srcs_unique)
+                missing = [src for src in img_srcs_unique if src not in descriptions]
+                filter_span.set(images=len(img_srcs_unique), cached=len(descriptions))
+
+            if missing and defer_images:
+                # 后台分析：先返回不含图片描述的Markdown，分析结果写入缓存，供之后的回答使用
+                get_background_analyzer().submit(missing, provider, api_key, base_url, vision_model)
+                logger.debug("🕒 %d 个图片转入后台分析", len(missing))
+            elif missing:
+                from image_utils.vision_router import create_image_analyzer
+
                 loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(loop)
 
                 async def analyze_with_params():
-                    async with AsyncImageAnalysis(
+                    async with create_image_analyzer(
                         provider=provider,
                         api_key=api_key,
                         base_url=base_url,
                         vision_model=vision_model,  # 传递视觉模型
                         max_concurrent=max_concurrent,
                     ) as analyzer:
-                        img_srcs_unique = list(dict.fromkeys(img_urls))
-                        image_sources = [{"image_url": src} for src in img_srcs_unique]
-                        print(f"🔮 开始分析 {len(img_srcs_unique)} 个唯一图片...")
+                        image_sources = [{"image_url": src} for src in missing]
+                        logger.debug("🔮 开始分析 %d 个唯一图片...", len(missing))
                         results = await analyzer.analyze_multiple_images(image_sources)
-                        print(f"🎯 分析结果: {results}")
+                        logger.debug("🎯 分析结果: %s", results)
                         return results
 
-                results = loop.run_until_complete(analyze_with_params())
-                  # 替换Markdown中的图片
-                img_srcs_unique = list(dict.fromkeys(img_urls))
-                for i, img_url in enumerate(img_srcs_unique):
-                    if i < len(results) and isinstance(results[i], dict) and not results[i].get("error"):
-                        title = results[i].get("title", "图片")
-                        desc = results[i].get("description", "")
-                        
-                        # 构建新的图片Markdown
-                        new_img_md = f"![{title}]({img_url})"
-                        if desc:
-                            new_img_md += "\n" + "\n".join(f"> {line}" for line in desc.strip().splitlines())
-                        
-                        # 替换原有的图片标记
-                        old_pattern = rf'!\[.*?\]\({re.escape(img_url)}\)'
-                        markdown_body = re.sub(old_pattern, new_img_md, markdown_body)
-                        
-                print("✅ 图片分析和替换完成")
+                task = loop.create_task(analyze_with_params())
+
+                def cancel_analysis():
+                    # 从其他线程取消分析任务：排队中的图片不再调用视觉模型，客户端随上下文退出关闭
+                    try:
+                        loop.call_soon_threadsafe(task.cancel)
+                    except RuntimeError:
+                        pass  # 事件循环已关闭
+
+                unregister = cancel_token.add_callback(cancel_analysis) if cancel_token else None
+                try:
+                    results = loop.run_until_complete(task)
+                except asyncio.CancelledError:
+                    raise OperationCancelled("图片分析已取消")
+                finally:
+                    if unregister:
+                        unregister()
+                    loop.close()
+                for src, result in zip(missing, results):
+                    if isinstance(result, dict) and not result.get("error"):
+                        desc_cache.put(src, result)
+                        descriptions[src] = result
+
+            # 替换Markdown中的图片
+            markdown_body = apply_image_descriptions(markdown_body, descriptions)
+            logger.debug("✅ 图片分析和替换完成")
         else:
-            print("⏭️ 跳过图片分析")
+            logger.debug("⏭️ 跳过图片分析")
 
         # --- 步骤 5: 处理元数据 (对应 dayjs) ---
         try:
             if metadata["date"]:
+                from dateutil.parser import parse
+
                 parsed_date = parse(metadata["date"])
                 # 转换为带时区的标准格式
                 standard_date = parsed_date.astimezone(timezone.utc).strftime(
@@ -463,11 +426,14 @@ def convert_url_to_markdown(
 
         return final_content
 
+    except OperationCancelled:
+        logger.debug("⏹️ 已取消处理 URL: %s", url)
+        raise
     except requests.exceptions.RequestException as e:
-        print(f"❌ 网络请求错误: {e}")
+        logger.warning("❌ 网络请求错误: %s", e)
         return None
     except Exception as e:
-        print(f"❌ 发生未知错误: {e}")
+        logger.warning("❌ 发生未知错误: %s", e)
         return None
 
 
@@ -6,7 +6,7 @@ import asyncio
 import time
 import json
 import logging
-from typing import Dict, Any, List, Union, Optional
+from typing import Dict, Any, List, Union, Optional, Tuple
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import base64 
@@ -14,17 +14,27 @@ import re
 import aiofiles # 导入 aiofiles
 import tempfile
 import requests
+import collections
 from .prompts import MULTIMODAL_PROMPT # 导入提示词模板
+from .image_preprocess import IMAGE_PREPROCESS, prepare_local_image, prepare_remote_image
+from tracing import span
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # 辅助函数：将图片转换为 base64 (使用 aiofiles 实现真正的异步)
 async def image_to_base64_async(file_path: str) -> str:
-    """将图像文件异步转换为 base64 编码的字符串."""
+    """将图像文件异步转换为 base64 编码的字符串（按3字节整数倍分块读取编码）."""
     try:
+        parts = []
         async with aiofiles.open(file_path, "rb") as image_file:
-            image_bytes = await image_file.read()
-            return base64.b64encode(image_bytes).decode('utf-8')
+            while True:
+                chunk = await image_file.read(3 * 64 * 1024)
+                if not chunk:
+                    break
+                parts.append(base64.b64encode(chunk).decode('utf-8'))
+        return "".join(parts)
     except FileNotFoundError:
         logging.error(f"图片文件未找到: {file_path}")
         raise
@@ -116,6 +126,7 @@ class AsyncImageAnalysis:
         vision_model: str = None,
         prompt: Optional[str] = None,
         max_concurrent: int = 5,
+        preprocess: Optional[bool] = None,
     ):
         """
         初始化图像分析器
@@ -127,6 +138,8 @@ class AsyncImageAnalysis:
             vision_model (str, optional): 视觉模型名称，如果不提供则从环境变量或默认值读取
             prompt (Optional[str], optional): 自定义提示词
             max_concurrent (int): 最大并发数
+            preprocess (bool, optional): 是否先在本地下载、缩小并重新编码图片再上传，
+                默认取 LINKA_IMAGE_PREPROCESS；需要 Pillow 才会缩放
         """
         self.provider = provider.lower()
         
@@ -150,21 +163,30 @@ class AsyncImageAnalysis:
                            os.getenv(config["model_env"]) or 
                            config["default_models"][0])
         
-        print(f"使用提供商: {self.provider}")
-        print(f"API基础URL: {self.base_url}")
-        print(f"视觉模型: {self.vision_model}")
+        logger.debug("使用提供商: %s, API基础URL: %s, 视觉模型: %s", self.provider, self.base_url, self.vision_model)
         
         self.client = AsyncOpenAI(
             api_key=self.api_key,
             base_url=self.base_url,
         )
 
+        self._init_shared(prompt, max_concurrent, preprocess)
+
+    def _init_shared(self, prompt: Optional[str], max_concurrent: int, preprocess: Optional[bool]):
+        """初始化与具体提供商无关的状态：提示词、并发限制、预处理与按内容去重。"""
         # 设置提示词
         self._prompt = prompt or MULTIMODAL_PROMPT
         
         # 设置并发限制
         self.semaphore = asyncio.Semaphore(max_concurrent)
 
+        self.preprocess = IMAGE_PREPROCESS if preprocess is None else preprocess
+        # 按图片内容哈希去重：内容相同的图片（如不同尺寸参数、不同CDN地址）只调用一次视觉模型；
+        # 键还包含模型、细节级别和提示词，同一图片用不同参数分析时不会拿到别的参数的结果
+        self._digest_results: "collections.OrderedDict[Tuple, Dict[str, Any]]" = collections.OrderedDict()
+        self._digest_inflight: Dict[Tuple, asyncio.Future] = {}
+        self._digest_cache_size = 256
+
     async def __aenter__(self):
         """进入异步上下文."""
         # 客户端已在 __init__ 中初始化。
@@ -208,26 +230,65 @@ class AsyncImageAnalysis:
                 raise ValueError("只能提供一个图像来源：image_url或local_image_path")
 
             # 处理图像来源
-            final_image_url = image_url
-            image_format = "jpeg"  # 默认格式
-            if local_image_path:
-                try:
-                    from PIL import Image # 条件导入
-                    loop = asyncio.get_event_loop()
-                    def get_image_format():
-                        with Image.open(local_image_path) as img:
-                            return img.format.lower() if img.format else "jpeg"
-                    image_format = await loop.run_in_executor(None, get_image_format)
-                except ImportError:
-                    logging.warning(f"Pillow (PIL) 库未找到。无法确定图片 {local_image_path} 的格式，将使用默认jpeg。请安装Pillow以获得更准确的格式检测。")
-                except Exception as e:
-                    logging.warning(f"无法打开或识别图片格式 {local_image_path}: {e}, 使用默认jpeg")
-                base64_image = await image_to_base64_async(local_image_path)
-                final_image_url = f"data:image/{image_format};base64,{base64_image}"
+            final_image_url, digest = await self._prepare_image(image_url, local_image_path, detail)
+            key = None
+            if digest is not None:
+                key = (digest, model or self.vision_model, detail, prompt or self._prompt)
+                if key in self._digest_results:
+                    self._digest_results.move_to_end(key)
+                    return dict(self._digest_results[key])
+                pending = self._digest_inflight.get(key)
+                if pending is not None:
+                    return dict(await asyncio.shield(pending))
+                self._digest_inflight[key] = asyncio.get_running_loop().create_future()
 
-            model_to_use = model or self.vision_model
-            prompt_text = prompt or self._prompt
             try:
+                result = await self._call_vision_model(
+                    final_image_url, image_url or local_image_path, model, detail, prompt, temperature
+                )
+            except BaseException:
+                if key is not None:
+                    self._digest_inflight.pop(key).cancel()
+                raise
+            if key is not None:
+                self._digest_inflight.pop(key).set_result(result)
+                if not result.get("error"):
+                    self._digest_results[key] = result
+                    while len(self._digest_results) > self._digest_cache_size:
+                        self._digest_results.popitem(last=False)
+            return result
+
+    async def _prepare_image(self, image_url, local_image_path, detail):
+        """
+        准备上传给服务商的图片地址，返回 (url, 内容哈希)。
+
+        开启预处理时远程图片经共享连接池下载并缩小到 detail 对应的分辨率，下载失败则退回原URL
+        交给服务商抓取（此时无哈希）；本地图片总是在本地编码。
+        """
+        loop = asyncio.get_running_loop()
+        if local_image_path:
+            with span("vision.preprocess", source="local") as preprocess_span:
+                prepared = await loop.run_in_executor(None, prepare_local_image, local_image_path, detail)
+                preprocess_span.set(bytes_in=prepared.original_bytes, bytes_out=prepared.encoded_bytes)
+            return prepared.data_url, prepared.digest
+        if not self.preprocess or not image_url.startswith(("http://", "https://")):
+            return image_url, None
+        try:
+            with span("vision.preprocess", source="remote") as preprocess_span:
+                prepared = await loop.run_in_executor(None, prepare_remote_image, image_url, detail)
+                preprocess_span.set(bytes_in=prepared.original_bytes, bytes_out=prepared.encoded_bytes)
+        except Exception as e:
+            logger.debug("图片预处理失败，交由服务商直接抓取 %s: %s", image_url, e)
+            return image_url, None
+        logger.debug("图片预处理 %s: %d -> %d 字节", image_url, prepared.original_bytes, prepared.encoded_bytes)
+        return prepared.data_url, prepared.digest
+
+    async def _call_vision_model(self, final_image_url, source, model, detail, prompt, temperature):
+        """调用视觉模型分析一张图片，失败时返回带 error 字段的结果。"""
+        model_to_use = model or self.vision_model
+        prompt_text = prompt or self._prompt
+        try:
+            with span("vision.call", provider=self.provider, model=model_to_use):
                 response = await self.client.chat.completions.create(
                     model=model_to_use,
                     messages=[
@@ -245,16 +306,12 @@ class AsyncImageAnalysis:
                     temperature=temperature,
                     max_tokens=300,
                 )
-                result_content = response.choices[0].message.content
-                analysis_result = extract_title_and_description(result_content)
-                return analysis_result
-            except Exception as e:
-                logging.error(f"API调用失败: {e}")
-                print(f"❌ 图像分析失败，URL: {final_image_url}")
-                print(f"   错误详情: {str(e)}")
-                print(f"   使用模型: {model_to_use}")
-                return {"error": f"API调用失败: {str(e)}", "title": "", "description": ""}
-            # 已无临时文件，无需finally清理
+            result_content = response.choices[0].message.content
+            analysis_result = extract_title_and_description(result_content)
+            return analysis_result
+        except Exception as e:
+            logger.error("❌ 图像分析失败，URL: %s，模型: %s，错误详情: %s", source, model_to_use, e)
+            return {"error": f"API调用失败: {str(e)}", "title": "", "description": ""}
 
     async def analyze_multiple_images(
         self,
@@ -0,0 +1,207 @@
+"""
+图片描述缓存与后台图片分析
+
+ImageDescriptionCache 按图片URL保存视觉模型给出的标题和描述（进程级，LRU + 有效期）；
+同步分析和后台分析的结果都写入这里，之后涉及同一图片的页面直接使用缓存的描述，不再调用视觉模型。
+BackgroundImageAnalyzer 在独立线程的事件循环中分析图片，不阻塞页面转换和回答生成。
+
+环境变量：
+    LINKA_IMAGE_DESC_CACHE_SIZE=5000        # 缓存的图片描述条数
+    LINKA_IMAGE_DESC_CACHE_TTL=604800       # 图片描述的有效期（秒）
+    LINKA_BACKGROUND_VISION_CONCURRENCY=4   # 后台分析的视觉调用并发数
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from cancellation import raise_if_cancelled
+
+logger = logging.getLogger(__name__)
+
+
+class ImageDescriptionCache:
+    """线程安全的图片描述缓存，只保存分析成功的结果。"""
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 7 * 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "collections.OrderedDict[str, Tuple[float, Dict[str, Any]]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(url)
+            if item is None or time.time() - item[0] > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return item[1]
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """返回已缓存的 {url: 结果}。"""
+        found = {}
+        for url in dict.fromkeys(urls):
+            result = self.get(url)
+            if result is not None:
+                found[url] = result
+        return found
+
+    def put(self, url: str, result: Dict[str, Any]):
+        if not url or not isinstance(result, dict) or result.get("error"):
+            return
+        entry = {"title": result.get("title", ""), "description": result.get("description", "")}
+        with self._lock:
+            self._entries.pop(url, None)
+            self._entries[url] = (time.time(), entry)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class BackgroundImageAnalyzer:
+    """
+    后台图片分析器：在专用线程的事件循环中调用视觉模型，结果写入图片描述缓存。
+
+    同一图片同时只分析一次；同一模型配置共用一个分析器实例，视觉调用并发受 max_concurrent 限制。
+    """
+
+    def __init__(self, cache: ImageDescriptionCache, max_concurrent: int = 4):
+        self.cache = cache
+        self.max_concurrent = max_concurrent
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._analyzers: Dict[Tuple, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="linka-vision-bg", daemon=True).start()
+            return self._loop
+
+    def submit(self, urls: Iterable[str], provider: str = "guiji", api_key: str = None,
+               base_url: str = None, vision_model: str = None) -> Dict[str, concurrent.futures.Future]:
+        """
+        提交图片分析，已有缓存描述的图片跳过。
+        :return: 尚无描述的图片 {url: Future}，包括本次新提交的和已在分析中的；Future 的结果为分析结果字典
+        """
+        futures: Dict[str, concurrent.futures.Future] = {}
+        new_urls: List[str] = []
+        for url in dict.fromkeys(urls):
+            if not url or self.cache.get(url) is not None:
+                continue
+            with self._lock:
+                future = self._inflight.get(url)
+                if future is None:
+                    future = self._inflight[url] = concurrent.futures.Future()
+                    new_urls.append(url)
+            futures[url] = future
+        if new_urls:
+            asyncio.run_coroutine_threadsafe(
+                self._analyze(new_urls, (provider, api_key, base_url, vision_model)), self._get_loop()
+            )
+        return futures
+
+    async def _analyze(self, urls: List[str], config: Tuple):
+        results: List[Dict[str, Any]] = []
+        try:
+            try:
+                analyzer = self._analyzers.get(config)
+                if analyzer is None:
+                    from image_utils.vision_router import create_image_analyzer
+
+                    provider, api_key, base_url, vision_model = config
+                    analyzer = self._analyzers[config] = create_image_analyzer(
+                        provider=provider, api_key=api_key, base_url=base_url,
+                        vision_model=vision_model, max_concurrent=self.max_concurrent,
+                    )
+                results = await analyzer.analyze_multiple_images([{"image_url": url} for url in urls])
+            except Exception as e:
+                logger.warning("后台图片分析失败: %s", e)
+                results = [{"error": str(e), "title": "", "description": ""}] * len(urls)
+            for url, result in zip(urls, results):
+                if result.get("error"):
+                    self.failed += 1
+                else:
+                    self.cache.put(url, result)
+                    self.completed += 1
+        finally:
+            # 取消或意外异常时也要结束等待中的 Future 并移出在途表，否则同一图片之后不会再被提交
+            for index, url in enumerate(urls):
+                with self._lock:
+                    future = self._inflight.pop(url, None)
+                if future is None or future.done():
+                    continue
+                if index < len(results):
+                    future.set_result(results[index])
+                else:
+                    future.set_result({"error": "后台图片分析已中止", "title": "", "description": ""})
+
+    def wait(self, futures: Iterable[concurrent.futures.Future], timeout: float, cancel_token=None) -> int:
+        """等待给定的分析任务完成，最多 timeout 秒；返回其中分析成功的数量。"""
+        futures = list(futures)
+        pending = set(futures)
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            raise_if_cancelled(cancel_token)
+            _, pending = concurrent.futures.wait(pending, timeout=min(0.5, remaining))
+        return sum(1 for f in futures if f.done() and not f.result().get("error"))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {"inflight": inflight, "completed": self.completed, "failed": self.failed}
+
+
+_cache: Optional[ImageDescriptionCache] = None
+_analyzer: Optional[BackgroundImageAnalyzer] = None
+_lock = threading.Lock()
+
+
+def get_image_desc_cache() -> ImageDescriptionCache:
+    """获取进程级图片描述缓存。"""
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = ImageDescriptionCache(
+                    max_entries=int(os.getenv("LINKA_IMAGE_DESC_CACHE_SIZE", "5000")),
+                    ttl=float(os.getenv("LINKA_IMAGE_DESC_CACHE_TTL", str(7 * 86400))),
+                )
+    return _cache
+
+
+def get_background_analyzer() -> BackgroundImageAnalyzer:
+    """获取进程级后台图片分析器。"""
+    global _analyzer
+    cache = get_image_desc_cache()
+    if _analyzer is None:
+        with _lock:
+            if _analyzer is None:
+                _analyzer = BackgroundImageAnalyzer(
+                    cache, max_concurrent=int(os.getenv("LINKA_BACKGROUND_VISION_CONCURRENCY", "4"))
+                )
+    return _analyzer
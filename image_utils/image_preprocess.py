@@ -0,0 +1,153 @@
+"""
+视觉调用前的图片预处理：经共享连接池下载图片，按视觉模型实际使用的分辨率缩小并重新编码，
+计算内容哈希用于去重，并分块进行base64编码。
+
+Pillow 为可选依赖：未安装时跳过缩放与重新编码，原样编码下载到的图片。
+
+环境变量：
+    LINKA_IMAGE_PREPROCESS=1          # 是否在本地预处理远程图片（0 表示把URL直接交给服务商）
+    LINKA_IMAGE_MAX_BYTES=10485760    # 下载图片的大小上限
+    LINKA_IMAGE_JPEG_QUALITY=80       # 重新编码的JPEG质量
+"""
+import base64
+import hashlib
+import io
+import logging
+import os
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Tuple
+
+from net_utils.http_session import get_http_session
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREPROCESS = os.getenv("LINKA_IMAGE_PREPROCESS", "1") != "0"
+IMAGE_MAX_BYTES = int(os.getenv("LINKA_IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+JPEG_QUALITY = int(os.getenv("LINKA_IMAGE_JPEG_QUALITY", "80"))
+
+# detail="low" 时服务商按 512x512 处理图片；"high" 时先缩放到 2048 以内
+DETAIL_MAX_SIDE = {"low": 512, "high": 2048, "auto": 2048}
+
+# base64每3字节输出4字符，按3的整数倍分块编码即可直接拼接
+_B64_CHUNK = 3 * 64 * 1024
+
+_MAGIC_MIME = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+class PreparedImage(NamedTuple):
+    data_url: str
+    digest: str          # 编码后图片内容的sha256，用于去重
+    original_bytes: int
+    encoded_bytes: int
+
+
+def sniff_mime(data: bytes) -> str:
+    """按文件头判断图片类型，无法识别时按JPEG处理。"""
+    for magic, mime in _MAGIC_MIME:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def iter_base64(stream: BinaryIO, chunk_size: int = _B64_CHUNK) -> Iterator[str]:
+    """分块读取并编码，避免一次性持有整份原始数据的额外副本。"""
+    chunk_size -= chunk_size % 3
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield base64.b64encode(chunk).decode("ascii")
+
+
+def to_data_url(stream: BinaryIO, mime: str) -> str:
+    return f"data:{mime};base64," + "".join(iter_base64(stream))
+
+
+def fetch_image_bytes(url: str, max_bytes: int = IMAGE_MAX_BYTES, timeout: float = 15) -> bytes:
+    """经共享会话流式下载图片，超过大小上限时抛出ValueError。"""
+    with get_http_session().get(url, stream=True, timeout=timeout) as resp:
+        resp.raise_for_status()
+        declared = int(resp.headers.get("Content-Length") or 0)
+        if declared > max_bytes:
+            raise ValueError(f"图片过大: {declared} 字节")
+        buffer = io.BytesIO()
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            buffer.write(chunk)
+            if buffer.tell() > max_bytes:
+                raise ValueError(f"图片超过 {max_bytes} 字节")
+        return buffer.getvalue()
+
+
+def downscale(source, max_side: int, quality: int = JPEG_QUALITY) -> Optional[Tuple[bytes, str]]:
+    """
+    缩放到最长边不超过 max_side 并重新编码：不透明图片用JPEG，带透明通道的用PNG。
+
+    :param source: 图片字节或文件路径
+    :return: (编码后的字节, MIME类型)；未安装Pillow时返回None
+    """
+    try:
+        from PIL import Image  # 条件导入
+    except ImportError:
+        return None
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        # JPEG可在解码阶段直接按比例缩小，省去全尺寸解码
+        img.draft("RGB", (max_side, max_side))
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        output = io.BytesIO()
+        if has_alpha:
+            img.convert("RGBA").save(output, format="PNG", optimize=True)
+            return output.getvalue(), "image/png"
+        img.convert("RGB").save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue(), "image/jpeg"
+
+
+def _safe_downscale(source, max_side: int) -> Optional[Tuple[bytes, str]]:
+    try:
+        return downscale(source, max_side)
+    except Exception as e:
+        logger.debug("图片缩放失败，使用原图: %s", e)
+        return None
+
+
+def _encode(data: bytes, mime: str, original_bytes: int) -> PreparedImage:
+    return PreparedImage(
+        data_url=to_data_url(io.BytesIO(data), mime),
+        digest=hashlib.sha256(data).hexdigest(),
+        original_bytes=original_bytes,
+        encoded_bytes=len(data),
+    )
+
+
+def prepare_remote_image(url: str, detail: str = "low") -> PreparedImage:
+    """下载远程图片并按 detail 对应的分辨率缩小、重新编码。"""
+    data = fetch_image_bytes(url)
+    reencoded = _safe_downscale(data, DETAIL_MAX_SIDE.get(detail, 2048))
+    # 缩放后反而更大（如本来就很小的PNG）时保留原图
+    if reencoded is not None and len(reencoded[0]) < len(data):
+        return _encode(reencoded[0], reencoded[1], len(data))
+    return _encode(data, sniff_mime(data), len(data))
+
+
+def prepare_local_image(path: str, detail: str = "low") -> PreparedImage:
+    """缩小并编码本地图片；未安装Pillow时直接从文件分块编码。"""
+    original_bytes = os.path.getsize(path)
+    reencoded = _safe_downscale(path, DETAIL_MAX_SIDE.get(detail, 2048))
+    if reencoded is not None and len(reencoded[0]) < original_bytes:
+        return _encode(reencoded[0], reencoded[1], original_bytes)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        head = f.read(16)
+        f.seek(0)
+        for chunk in iter(lambda: f.read(_B64_CHUNK), b""):
+            digest.update(chunk)
+        f.seek(0)
+        data_url = to_data_url(f, sniff_mime(head))
+    return PreparedImage(data_url, digest.hexdigest(), original_bytes, original_bytes)
@@ -0,0 +1,109 @@
+"""
+视觉模型提供商的健康状态：延迟与错误率的滑动平均、连续失败后的暂停，进程内共享，供 vision_router 路由使用。
+本模块不依赖模型客户端，/healthz 可直接读取而不必提前加载图片分析模块。
+
+环境变量：
+    LINKA_VISION_FAILURE_THRESHOLD=3   # 连续失败多少次后暂停该提供商
+    LINKA_VISION_COOLDOWN=30           # 暂停时长（秒），之后重新试用
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv("LINKA_VISION_FAILURE_THRESHOLD", "3"))
+COOLDOWN = float(os.getenv("LINKA_VISION_COOLDOWN", "30"))
+
+# 延迟与错误率的指数滑动平均系数
+EWMA_ALPHA = 0.3
+# 尚无延迟样本的提供商按该延迟（秒）估计：比它慢的已知提供商会让位，新提供商因此得到试用
+DEFAULT_LATENCY = 3.0
+# 错误率对路由评分的放大系数
+ERROR_PENALTY = 4.0
+
+
+class ProviderHealth:
+    """单个提供商的健康状态：延迟与错误率的滑动平均、连续失败次数和暂停截止时间。"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.paused_until = 0.0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            self._record_latency(latency)
+            self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok:
+                self.consecutive_failures = 0
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= FAILURE_THRESHOLD:
+                self.paused_until = time.monotonic() + COOLDOWN
+                self.consecutive_failures = 0
+                logger.warning("视觉模型提供商 %s 连续失败，暂停 %.0f 秒", self.name, COOLDOWN)
+
+    def record_abandoned(self, elapsed: float):
+        """调用被对冲结果取代而中止：耗时至少为 elapsed，计入延迟但不计为失败。"""
+        with self._lock:
+            self._record_latency(elapsed)
+
+    def record_hedge(self):
+        """该提供商作为对冲备选被调用。"""
+        with self._lock:
+            self.hedges += 1
+
+    def _record_latency(self, latency: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += EWMA_ALPHA * (latency - self.latency)
+
+    def available(self) -> bool:
+        return time.monotonic() >= self.paused_until
+
+    def score(self, weight: float) -> float:
+        """路由评分，越小越优先。"""
+        latency = self.latency if self.latency is not None else DEFAULT_LATENCY
+        return latency * (1 + ERROR_PENALTY * self.error_rate) / max(weight, 1e-6)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "calls": self.calls,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "paused": not self.available(),
+            }
+
+
+_health: Dict[str, ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_provider_health(name: str) -> ProviderHealth:
+    """获取进程级的提供商健康状态，各分析器实例共享。"""
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth(name)
+        return _health[name]
+
+
+def vision_provider_stats() -> Dict[str, Dict[str, Any]]:
+    """各提供商的健康状态，用于 /healthz。"""
+    with _health_lock:
+        providers = list(_health.values())
+    return {health.name: health.stats() for health in providers}
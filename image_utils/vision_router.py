@@ -0,0 +1,207 @@
+"""
+多视觉模型提供商的路由、故障转移与对冲
+
+MultiProviderImageAnalysis 与 AsyncImageAnalysis 接口相同，但同时持有多个已配置的提供商
+（见 AsyncImageAnalysis.PROVIDER_CONFIGS）：每次调用按各提供商的延迟和错误率选出最健康的一个，
+失败或超时时依次转移到下一个；设置对冲延迟后，调用超过该时长仍未返回就同时向下一个提供商发起，
+取先成功的结果。各提供商的健康状态见 provider_health。
+
+环境变量：
+    LINKA_VISION_PROVIDERS=            # 提供商列表，如 "guiji,zhipu:0.5,volces"，冒号后为权重（默认1）；
+                                       # 为空时只使用调用方指定的单个提供商
+    LINKA_VISION_TIMEOUT=20            # 单个提供商的调用超时（秒），超时按失败计并转移
+    LINKA_VISION_HEDGE_AFTER=0         # 对冲延迟（秒），0 表示不对冲
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from tracing import span
+
+from .async_image_analysis import AsyncImageAnalysis
+from .provider_health import get_provider_health
+
+logger = logging.getLogger(__name__)
+
+VISION_PROVIDERS = os.getenv("LINKA_VISION_PROVIDERS", "")
+VISION_TIMEOUT = float(os.getenv("LINKA_VISION_TIMEOUT", "20"))
+VISION_HEDGE_AFTER = float(os.getenv("LINKA_VISION_HEDGE_AFTER", "0"))
+
+
+def parse_provider_list(spec: str) -> List[Tuple[str, float]]:
+    """解析 "guiji,zhipu:0.5" 形式的提供商列表，返回 [(名称, 权重)]，忽略未知的提供商。"""
+    providers = []
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in AsyncImageAnalysis.PROVIDER_CONFIGS:
+            logger.warning("忽略未知的视觉模型提供商: %s", name)
+            continue
+        providers.append((name, float(weight) if weight.strip() else 1.0))
+    return providers
+
+
+class MultiProviderImageAnalysis(AsyncImageAnalysis):
+    """
+    多提供商图像分析器。
+
+    图片预处理、按内容去重和并发限制沿用 AsyncImageAnalysis；每次视觉调用按健康评分选择提供商，
+    失败或超时时转移到下一个，超过 hedge_after 秒仍未返回时同时向下一个提供商发起对冲请求。
+    列表中未配置密钥或地址的提供商会被跳过。
+    """
+
+    def __init__(
+        self,
+        providers: List[Tuple[str, float]],
+        overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+        prompt: Optional[str] = None,
+        max_concurrent: int = 5,
+        preprocess: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+    ):
+        """
+        参数:
+            providers (list): [(提供商名称, 权重)]，评分相同时按列表顺序
+            overrides (dict, optional): {提供商名称: {"api_key", "base_url", "vision_model"}}，覆盖环境变量
+            prompt (Optional[str], optional): 自定义提示词
+            max_concurrent (int): 最大并发图片数（对冲请求不另占名额）
+            preprocess (bool, optional): 同 AsyncImageAnalysis
+            timeout (float, optional): 单个提供商的调用超时，默认取 LINKA_VISION_TIMEOUT
+            hedge_after (float, optional): 对冲延迟，默认取 LINKA_VISION_HEDGE_AFTER，0 表示不对冲
+        """
+        overrides = overrides or {}
+        self.members: Dict[str, AsyncImageAnalysis] = {}
+        self.weights: Dict[str, float] = {}
+        for name, weight in providers:
+            if name in self.members:
+                continue
+            try:
+                self.members[name] = AsyncImageAnalysis(
+                    provider=name, prompt=prompt, max_concurrent=max_concurrent, preprocess=False,
+                    **overrides.get(name, {}),
+                )
+            except ValueError as e:
+                logger.debug("跳过视觉模型提供商 %s: %s", name, e)
+                continue
+            self.weights[name] = weight
+        if not self.members:
+            raise ValueError(f"没有可用的视觉模型提供商: {[name for name, _ in providers]}")
+        self.provider = ",".join(self.members)
+        self.vision_model = None
+        self.timeout = VISION_TIMEOUT if timeout is None else timeout
+        self.hedge_after = VISION_HEDGE_AFTER if hedge_after is None else hedge_after
+        self._init_shared(prompt, max_concurrent, preprocess)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for member in self.members.values():
+            await member.client.close()
+
+    def route(self) -> List[str]:
+        """按健康评分排列的提供商；暂停中的提供商排在最后，仅在其他提供商都失败时使用。"""
+        order = list(self.members)
+        return sorted(
+            order,
+            key=lambda name: (
+                not get_provider_health(name).available(),
+                get_provider_health(name).score(self.weights[name]),
+                order.index(name),
+            ),
+        )
+
+    async def _call_vision_model(self, final_image_url, source, model, detail, prompt, temperature):
+        """按路由顺序调用各提供商直到成功（model 参数不适用于多提供商，各提供商使用自己的模型）。"""
+        candidates = self.route()
+        result = None
+        running = set()
+        with span("vision.route", providers=len(candidates)) as route_span:
+            try:
+                while candidates:
+                    running = {self._attempt(candidates.pop(0), final_image_url, source, detail, prompt, temperature)}
+                    hedged = False
+                    while running:
+                        hedge = self.hedge_after > 0 and not hedged and candidates
+                        done, running = await asyncio.wait(
+                            running, timeout=self.hedge_after if hedge else None,
+                            return_when=asyncio.FIRST_COMPLETED,
+                        )
+                        if not done:
+                            # 调用过慢：同时向下一个提供商发起，取先成功的结果
+                            backup = candidates.pop(0)
+                            get_provider_health(backup).record_hedge()
+                            running.add(self._attempt(backup, final_image_url, source, detail, prompt, temperature))
+                            hedged = True
+                            continue
+                        for task in done:
+                            name, result = task.result()
+                            if not result.get("error"):
+                                route_span.set(provider=name, hedged=hedged)
+                                return result
+            finally:
+                # 已有结果或调用方取消：中止仍在进行的调用
+                for task in running:
+                    task.cancel()
+            route_span.set(provider=None)
+        return result or {"error": "没有可用的视觉模型提供商", "title": "", "description": ""}
+
+    def _attempt(self, name, final_image_url, source, detail, prompt, temperature) -> asyncio.Task:
+        return asyncio.ensure_future(
+            self._call_provider(name, final_image_url, source, detail, prompt, temperature)
+        )
+
+    async def _call_provider(self, name, final_image_url, source, detail, prompt, temperature):
+        health = get_provider_health(name)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(
+                self.members[name]._call_vision_model(
+                    final_image_url, source, None, detail, prompt or self._prompt, temperature
+                ),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("视觉模型提供商 %s 调用超时（%.1f 秒）: %s", name, self.timeout, source)
+            result = {"error": f"{name} 调用超时", "title": "", "description": ""}
+        except asyncio.CancelledError:
+            health.record_abandoned(time.monotonic() - start)
+            raise
+        health.record(time.monotonic() - start, not result.get("error"))
+        return name, result
+
+
+_providers: Optional[List[Tuple[str, float]]] = None
+
+
+def _configured_providers() -> List[Tuple[str, float]]:
+    global _providers
+    if _providers is None:
+        _providers = parse_provider_list(VISION_PROVIDERS)
+    return _providers
+
+
+def create_image_analyzer(
+    provider: str = "zhipu",
+    api_key: str = None,
+    base_url: str = None,
+    vision_model: str = None,
+    max_concurrent: int = 5,
+    **kwargs,
+) -> AsyncImageAnalysis:
+    """
+    创建图像分析器：设置了 LINKA_VISION_PROVIDERS 时返回多提供商分析器，显式传入的密钥、地址和模型
+    只作用于同名提供商；否则返回绑定单个提供商的 AsyncImageAnalysis。
+    """
+    providers = _configured_providers()
+    if not providers:
+        return AsyncImageAnalysis(
+            provider=provider, api_key=api_key, base_url=base_url, vision_model=vision_model,
+            max_concurrent=max_concurrent, **kwargs,
+        )
+    override = {k: v for k, v in (("api_key", api_key), ("base_url", base_url), ("vision_model", vision_model)) if v}
+    return MultiProviderImageAnalysis(
+        providers, overrides={provider.lower(): override}, max_concurrent=max_concurrent, **kwargs
+    )
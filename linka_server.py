@@ -0,0 +1,183 @@
+"""
+无界面HTTP服务：以SSE流式接口提供完整的RAG流程，可独立于Streamlit界面部署和扩容
+
+用法：
+    python linka_server.py --host 127.0.0.1 --port 8765 --workers 4
+
+接口：
+    POST /v1/answer   请求体 {"query": "...", "history": [...], "analyze_images": false, "profile": false,
+                             "session_id": "...", "instant": false, "background_images": false}
+                      提供 session_id 时，同一会话的追问可复用上一轮检索到的资料；
+                      instant 为 true 时先根据搜索摘要生成初步回答（draft_delta 事件）；
+                      background_images 为 true 时图片在后台分析，先根据文字内容回答
+                      返回 text/event-stream，每个事件为 "data: <json>"，格式见 rag_pipeline.stream_answer
+    GET  /healthz     返回调度器、抓取层、问答缓存、缓存预热、视觉模型提供商与图片描述缓存的运行状态
+    GET  /metrics     Prometheus文本格式的分阶段耗时直方图
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from answer_cache import get_answer_cache
+from cache_warmer import get_cache_warmer
+from cancellation import CancelToken, OperationCancelled
+from conversation import get_conversation_store
+from image_utils.image_desc_cache import get_background_analyzer, get_image_desc_cache
+from image_utils.provider_health import vision_provider_stats
+from net_utils.fetch_scheduler import get_fetch_scheduler
+from net_utils.http_session import get_http_stats
+from rag_pipeline import stream_answer
+from tracing import PrometheusSink, add_sink, configure_logging, get_sink
+from warmup import warm_up, warmup_enabled
+
+# 每个流式请求在该线程池中驱动同步的RAG流程，事件通过事件循环转发给客户端
+MAX_STREAMS = int(os.getenv("LINKA_API_MAX_STREAMS", "64"))
+_executor = ThreadPoolExecutor(max_workers=MAX_STREAMS, thread_name_prefix="linka-api")
+
+
+def format_sse(event: dict) -> bytes:
+    """将事件编码为一条SSE消息。"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def handle_answer(request: web.Request) -> web.StreamResponse:
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="请求体必须是JSON")
+    if not isinstance(payload, dict):
+        raise web.HTTPBadRequest(text="请求体必须是JSON对象")
+    query = payload.get("query") or ""
+    if not isinstance(query, str):
+        raise web.HTTPBadRequest(text="query必须是字符串")
+    query = query.strip()
+    if not query:
+        raise web.HTTPBadRequest(text="query不能为空")
+
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream; charset=utf-8",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    cancel_token = CancelToken()
+    session_id = payload.get("session_id")
+    conversation = get_conversation_store().get(str(session_id)) if session_id else None
+
+    def produce():
+        try:
+            for event in stream_answer(
+                query,
+                chat_history=payload.get("history"),
+                analyze_images=bool(payload.get("analyze_images")),
+                cancel_token=cancel_token,
+                profile=True if payload.get("profile") else None,
+                conversation=conversation,
+                instant=bool(payload.get("instant")),
+                background_images=bool(payload.get("background_images")),
+            ):
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            logging.exception("RAG流程执行失败")
+            loop.call_soon_threadsafe(queue.put_nowait, {"type": "error", "message": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    producer = loop.run_in_executor(_executor, produce)
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            await response.write(format_sse(event))
+    except (asyncio.CancelledError, ConnectionResetError):
+        # 客户端断开：取消后台流程，释放抓取名额、视觉调用和模型连接
+        cancel_token.cancel()
+        raise
+    finally:
+        cancel_token.cancel()
+    await producer
+    await response.write_eof()
+    return response
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    cache = get_answer_cache()
+    warmer = get_cache_warmer()
+    return web.json_response(
+        {
+            "status": "ok",
+            "pid": os.getpid(),
+            "fetch": get_fetch_scheduler().stats(),
+            "http": get_http_stats(),
+            "answer_cache": cache.stats() if cache is not None else None,
+            "sessions": len(get_conversation_store()),
+            "warmer": warmer.stats() if warmer is not None else None,
+            "vision": vision_provider_stats(),
+            "image_descriptions": {**get_image_desc_cache().stats(), **get_background_analyzer().stats()},
+        }
+    )
+
+
+async def on_startup(app: web.Application):
+    # 在开始接受请求之前完成预热，首个查询不再承担导入和建连开销
+    if warmup_enabled():
+        app["warmup"] = await asyncio.get_running_loop().run_in_executor(_executor, warm_up)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=get_sink(PrometheusSink).render(), content_type="text/plain")
+
+
+def create_app() -> web.Application:
+    if get_sink(PrometheusSink) is None:
+        add_sink(PrometheusSink())
+    app = web.Application()
+    app.router.add_post("/v1/answer", handle_answer)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(on_startup)
+    return app
+
+
+def run_worker(host: str, port: int, reuse_port: bool):
+    web.run_app(create_app(), host=host, port=port, reuse_port=reuse_port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Linka 无界面HTTP服务")
+    parser.add_argument("--host", default=os.getenv("LINKA_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("LINKA_API_PORT", "8765")))
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数，多进程时共享端口（SO_REUSEPORT）")
+    args = parser.parse_args()
+    configure_logging()
+
+    print(f"🚀 Linka API 启动: http://{args.host}:{args.port}  workers={args.workers}")
+    if args.workers <= 1:
+        run_worker(args.host, args.port, reuse_port=False)
+        return
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(args.host, args.port, True), daemon=True)
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
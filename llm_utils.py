@@ -0,0 +1,176 @@
+"""
+大模型调用工具函数
+"""
+import os
+import threading
+import time
+import httpx
+import openai
+from cancellation import OperationCancelled, raise_if_cancelled
+from prompt_utils import format_query_with_references, get_system_prompt
+from tracing import record_span, span
+
+
+# 生成客户端的连接池与超时配置，可通过环境变量调整
+LLM_POOL_SIZE = int(os.getenv("LINKA_LLM_POOL_SIZE", "32"))
+LLM_TIMEOUT = float(os.getenv("LINKA_LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LINKA_LLM_CONNECT_TIMEOUT", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LINKA_LLM_KEEPALIVE_EXPIRY", "60"))
+
+_client_lock = threading.Lock()
+_generation_config = None
+_generation_client = None
+
+
+def get_generation_config() -> dict:
+    """读取一次并缓存文本模型的配置（GUIJI_API_KEY / GUIJI_BASE_URL / GUIJI_TEXT_MODEL）。"""
+    global _generation_config
+    if _generation_config is None:
+        _generation_config = {
+            "api_key": os.getenv("GUIJI_API_KEY"),
+            "base_url": os.getenv("GUIJI_BASE_URL"),
+            "model": os.getenv("GUIJI_TEXT_MODEL"),
+        }
+    return _generation_config
+
+
+def _http_options() -> dict:
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_POOL_SIZE,
+            max_keepalive_connections=LLM_POOL_SIZE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    }
+
+
+def get_generation_client() -> openai.OpenAI:
+    """获取进程级共享的文本生成客户端（keep-alive连接池），各轮对话复用同一组连接。"""
+    global _generation_client
+    if _generation_client is None:
+        with _client_lock:
+            if _generation_client is None:
+                config = get_generation_config()
+                _generation_client = openai.OpenAI(
+                    api_key=config["api_key"],
+                    base_url=config["base_url"],
+                    http_client=openai.DefaultHttpxClient(**_http_options()),
+                )
+    return _generation_client
+
+
+def reset_generation_clients():
+    """丢弃缓存的配置与客户端（环境变量变更后调用，例如基准测试切换到模拟接口）。"""
+    global _generation_config, _generation_client
+    with _client_lock:
+        client, _generation_client = _generation_client, None
+        _generation_config = None
+    if client is not None:
+        client.close()
+
+
+def build_rag_messages(query, answer_blocks, chat_history=None):
+    """
+    构建RAG对话消息：系统提示词 + 历史消息 + 带参考内容的用户问题。
+
+    参数:
+        query (str): 用户问题。
+        answer_blocks (list): 包含(正文, url)元组的列表。
+        chat_history (list, optional): 历史消息列表。
+
+    返回:
+        list: OpenAI格式的消息列表。
+    """
+    with span("prompt.build", blocks=len(answer_blocks)) as prompt_span:
+        # 拼接参考内容
+        prompt = format_query_with_references(query, answer_blocks)
+        sys_prompt = get_system_prompt() # 调用函数获取系统提示词
+        # 历史记录放在系统提示词之后、用户问题之前
+        messages = [{"role": "system", "content": sys_prompt}]
+        messages.extend(chat_history or [])
+        messages.append({"role": "user", "content": prompt})
+        prompt_span.set(prompt_chars=len(prompt))
+    return messages
+
+
+def call_guiji_rag_model_stream(query, answer_blocks, _, chat_history=None, cancel_token=None):
+    """
+    调用硅基文本模型，返回流式响应。
+
+    参数:
+        query (str): 用户问题。
+        answer_blocks (list): 包含(正文, url)元组的列表。
+        chat_history (list, optional): 历史消息列表。
+        cancel_token (CancelToken, optional): 取消令牌，取消时关闭流式连接。
+
+    返回:
+        openai的流式响应对象。
+    """
+    raise_if_cancelled(cancel_token)
+    messages = build_rag_messages(query, answer_blocks, chat_history)
+    # 记录请求发出时间（create 返回时响应头已到达），首token时间包含建连、排队和等待响应头
+    started = time.perf_counter()
+    response = get_generation_client().chat.completions.create(
+        model=get_generation_config()["model"], messages=messages, stream=True, max_tokens=4096
+    )
+    response._linka_started = started
+    if cancel_token is not None:
+        # 取消时立即关闭底层HTTP连接，中断服务端生成
+        cancel_token.add_callback(response.close)
+    return response
+
+
+def iter_stream_deltas(response, cancel_token=None):
+    """
+    逐个产出流式响应中的文本增量；取消后停止迭代并关闭连接。
+
+    参数:
+        response: call_guiji_rag_model_stream 返回的流式响应。
+        cancel_token (CancelToken, optional): 取消令牌。
+
+    返回:
+        文本增量的生成器。
+    """
+    started = getattr(response, "_linka_started", None) or time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    error = None
+    cancelled = False
+    try:
+        for chunk in response:
+            raise_if_cancelled(cancel_token)
+            delta = (
+                chunk.choices[0].delta.content
+                if chunk.choices and chunk.choices[0].delta
+                else ""
+            )
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    record_span("llm.ttft", first_token_at - started)
+                chunks += 1
+                yield delta
+    except (GeneratorExit, OperationCancelled):
+        # 调用方提前关闭生成器（取消或不再需要后续内容）：记为取消而不是错误
+        cancelled = True
+        raise
+    except BaseException as e:
+        if isinstance(e, Exception) and cancel_token is not None and cancel_token.cancelled:
+            # 取消回调关闭连接后，读取流会抛出网络异常，统一转换为取消异常
+            cancelled = True
+            raise_if_cancelled(cancel_token)
+        error = type(e).__name__
+        raise
+    finally:
+        response.close()
+        # 流式响应中每个增量块约对应一个token，以块数估算生成速度
+        generating = time.perf_counter() - first_token_at if first_token_at else 0.0
+        record_span(
+            "llm.generate",
+            time.perf_counter() - started,
+            error=error,
+            cancelled=cancelled,
+            chunks=chunks,
+            tokens_per_sec=chunks / generating if generating > 0 else 0.0,
+        )
@@ -0,0 +1,133 @@
+"""
+进程内DNS缓存：包装 socket.getaddrinfo，按TTL缓存解析结果，供抓取层共享
+"""
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# 保存原始的解析函数，卸载缓存时恢复
+_original_getaddrinfo = socket.getaddrinfo
+
+
+class DNSCache:
+    """
+    带TTL的DNS解析缓存。
+
+    以 getaddrinfo 的全部参数作为键缓存解析结果，过期后重新解析。
+    同一主机的并发未命中只会触发一次真实解析，其余线程等待该结果。
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        """
+        :param ttl: 缓存有效期（秒）
+        :param max_entries: 最大缓存条目数，超出时淘汰最早过期的条目
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple, Tuple[float, Any]] = {}
+        self._inflight: Dict[Tuple, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """与 socket.getaddrinfo 签名一致的缓存解析函数。"""
+        key = (host, port, family, type, proto, flags)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[0] > time.monotonic():
+                    self.hits += 1
+                    return list(entry[1])
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    # 由当前线程负责解析
+                    self.misses += 1
+                    waiter = self._inflight[key] = threading.Event()
+                    break
+            # 其他线程正在解析同一主机，等待其完成后重新查缓存
+            waiter.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= time.monotonic():
+                    # 对方解析失败，自己再尝试一次
+                    continue
+                self.hits += 1
+                return list(entry[1])
+
+        try:
+            result = _original_getaddrinfo(host, port, family, type, proto, flags)
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._evict_locked()
+                self._entries[key] = (time.monotonic() + self.ttl, result)
+            return list(result)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            waiter.set()
+
+    def _evict_locked(self):
+        """淘汰已过期的条目；若仍超出上限，则淘汰最早过期的一半。"""
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            ordered = sorted(self._entries.items(), key=lambda item: item[1][0])
+            for key, _ in ordered[: len(ordered) // 2 or 1]:
+                del self._entries[key]
+
+    def clear(self):
+        """清空缓存及统计。"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中统计。"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "ttl": self.ttl,
+            }
+
+
+_dns_cache: Optional[DNSCache] = None
+_install_lock = threading.Lock()
+
+
+def install_dns_cache(ttl: float = 300.0, max_entries: int = 1024) -> DNSCache:
+    """
+    安装进程级DNS缓存（替换 socket.getaddrinfo），重复调用返回同一实例。
+
+    :param ttl: 缓存有效期（秒）
+    :param max_entries: 最大缓存条目数
+    :return: 当前生效的DNSCache实例
+    """
+    global _dns_cache
+    with _install_lock:
+        if _dns_cache is None:
+            _dns_cache = DNSCache(ttl=ttl, max_entries=max_entries)
+            socket.getaddrinfo = _dns_cache.getaddrinfo
+        return _dns_cache
+
+
+def uninstall_dns_cache():
+    """卸载DNS缓存，恢复原始的 socket.getaddrinfo。"""
+    global _dns_cache
+    with _install_lock:
+        socket.getaddrinfo = _original_getaddrinfo
+        _dns_cache = None
+
+
+def get_dns_cache_stats() -> Dict[str, Any]:
+    """返回DNS缓存的命中统计，未安装时返回空统计。"""
+    if _dns_cache is None:
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0, "ttl": 0}
+    return _dns_cache.stats()
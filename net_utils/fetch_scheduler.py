@@ -0,0 +1,231 @@
+"""
+进程级抓取调度器：全局并发上限 + 单站点并发上限 + 按查询时间与结果排名排序的优先队列，
+另有供缓存预热等后台任务使用的低优先级通道
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+
+
+class SchedulerBusyError(RuntimeError):
+    """等待队列已满且在超时时间内未腾出空位。"""
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "host", "fn", "future", "background")
+
+    def __init__(self, priority, seq, host, fn, future, background=False):
+        self.priority = priority
+        self.seq = seq
+        self.host = host
+        self.fn = fn
+        self.future = future
+        self.background = background
+
+    def __lt__(self, other):
+        # 后台任务排在所有交互任务之后
+        return (self.background, self.priority, self.seq) < (other.background, other.priority, other.seq)
+
+
+class FetchScheduler:
+    """
+    所有会话共享的抓取调度器。
+
+    优先级 = 查询开始时间 + 排名 * rank_spacing（越小越先执行）。
+    因此各会话的靠前结果优先于任何会话的靠后结果；同时较早查询的靠后结果
+    会随时间推移逐渐排到新查询之前，不会被饿死。
+    等待队列超过 max_pending 时，submit 会阻塞调用方（背压）或抛出 SchedulerBusyError。
+
+    后台任务（background=True）只在没有可执行的交互任务时才出队，且同时执行的数量
+    不超过 max_concurrency * background_share，其余并发始终留给交互请求。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        per_host_limit: int = 2,
+        max_pending: int = 200,
+        rank_spacing: float = 2.0,
+        background_share: float = 0.25,
+    ):
+        """
+        :param max_concurrency: 全局同时执行的抓取任务数（即工作线程数）
+        :param per_host_limit: 同一站点同时执行的抓取任务数
+        :param max_pending: 等待队列上限，超过后对提交方施加背压
+        :param rank_spacing: 每相差一个排名折算的秒数
+        :param background_share: 后台任务最多占用的并发比例（至少1个）
+        """
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.max_pending = max_pending
+        self.rank_spacing = rank_spacing
+        self.max_background = max(1, int(max_concurrency * background_share))
+        self._background_active = 0
+        self._heap = []
+        self._host_active: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._shutdown = False
+        self._active = 0
+        self._completed = 0
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"linka-fetch-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        url: str,
+        fn: Callable[[], Any],
+        rank: int = 0,
+        query_time: Optional[float] = None,
+        block: bool = True,
+        timeout: Optional[float] = None,
+        background: bool = False,
+    ) -> Future:
+        """
+        提交一个抓取任务。
+
+        :param url: 任务对应的URL，用于单站点并发限制
+        :param fn: 无参可调用对象，在工作线程中执行
+        :param rank: 结果排名（0为最靠前）
+        :param query_time: 查询开始时间（time.monotonic()），默认当前时间
+        :param block: 队列已满时是否阻塞等待
+        :param timeout: 阻塞等待的最长时间（秒），None表示一直等待
+        :param background: 是否作为后台任务（如缓存预热）以最低优先级执行
+        :return: concurrent.futures.Future
+        """
+        if query_time is None:
+            query_time = time.monotonic()
+        future = Future()
+        # 在提交方的上下文中执行任务，使追踪span等上下文变量跨线程延续
+        context = contextvars.copy_context()
+        job = _Job(
+            query_time + rank * self.rank_spacing,
+            next(self._seq),
+            urlparse(url).netloc.lower(),
+            lambda: context.run(fn),
+            future,
+            background,
+        )
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("调度器已关闭")
+            if len(self._heap) >= self.max_pending:
+                if not block:
+                    raise SchedulerBusyError("抓取队列已满")
+                if not self._cond.wait_for(
+                    lambda: len(self._heap) < self.max_pending or self._shutdown, timeout
+                ):
+                    raise SchedulerBusyError("等待抓取队列空位超时")
+            heapq.heappush(self._heap, job)
+            self._cond.notify_all()
+        return future
+
+    def _next_job_locked(self) -> Optional[_Job]:
+        """取出优先级最高、且所属站点未达到并发上限的任务；后台任务另受后台并发上限限制。"""
+        skipped = []
+        job = None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            if candidate.future.cancelled():
+                continue
+            if candidate.background and self._background_active >= self.max_background:
+                # 堆中其余任务也都是后台任务
+                skipped.append(candidate)
+                break
+            if self._host_active.get(candidate.host, 0) < self.per_host_limit:
+                job = candidate
+                break
+            skipped.append(candidate)
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    job = self._next_job_locked()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    return
+                self._host_active[job.host] = self._host_active.get(job.host, 0) + 1
+                self._active += 1
+                self._background_active += job.background
+                # 出队后通知被背压阻塞的提交方
+                self._cond.notify_all()
+            try:
+                if job.future.set_running_or_notify_cancel():
+                    try:
+                        job.future.set_result(job.fn())
+                    except BaseException as e:
+                        job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    remaining = self._host_active[job.host] - 1
+                    if remaining:
+                        self._host_active[job.host] = remaining
+                    else:
+                        del self._host_active[job.host]
+                    self._active -= 1
+                    self._background_active -= job.background
+                    self._completed += 1
+                    self._cond.notify_all()
+
+    def shutdown(self, wait: bool = True):
+        """关闭调度器，取消尚未开始的任务。"""
+        with self._cond:
+            self._shutdown = True
+            for job in self._heap:
+                job.future.cancel()
+            self._heap.clear()
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前调度状态。"""
+        with self._cond:
+            return {
+                "active": self._active,
+                "pending": len(self._heap),
+                "completed": self._completed,
+                "max_concurrency": self.max_concurrency,
+                "per_host_limit": self.per_host_limit,
+                "active_hosts": len(self._host_active),
+                "background_active": self._background_active,
+                "max_background": self.max_background,
+            }
+
+
+_scheduler: Optional[FetchScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_fetch_scheduler() -> FetchScheduler:
+    """获取进程级共享的抓取调度器，参数可通过 LINKA_FETCH_* 环境变量配置。"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = FetchScheduler(
+                    max_concurrency=int(os.getenv("LINKA_FETCH_CONCURRENCY", "16")),
+                    per_host_limit=int(os.getenv("LINKA_FETCH_PER_HOST", "2")),
+                    max_pending=int(os.getenv("LINKA_FETCH_MAX_PENDING", "200")),
+                    rank_spacing=float(os.getenv("LINKA_FETCH_RANK_SPACING", "2.0")),
+                    background_share=float(os.getenv("LINKA_FETCH_BACKGROUND_SHARE", "0.25")),
+                )
+    return _scheduler
@@ -0,0 +1,272 @@
+"""
+HTTP录制/回放：将抓取层与搜索层的请求和响应（含头部、正文与耗时）写入SQLite归档，
+回放时按录制的延迟返回同样的响应，用于无网络的确定性压测与版本对比。
+
+启用方式（环境变量）：
+    LINKA_CAPTURE_MODE=record|replay
+    LINKA_CAPTURE_ARCHIVE=linka_capture.sqlite
+    LINKA_CAPTURE_LATENCY_SCALE=1.0     # 回放延迟倍率，0 表示不等待
+
+查看归档：
+    python -m net_utils.http_capture linka_capture.sqlite
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    request_key TEXT NOT NULL,
+    method TEXT,
+    url TEXT,
+    request_headers TEXT,
+    status INTEGER,
+    reason TEXT,
+    response_headers TEXT,
+    body BLOB,
+    elapsed REAL NOT NULL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_exchanges_key ON exchanges (kind, request_key, id);
+"""
+
+
+class ReplayMissError(requests.exceptions.ConnectionError):
+    """回放模式下归档中没有对应的录制。"""
+
+
+def request_key(method: str, url: str, body: Optional[bytes] = None) -> str:
+    """请求的匹配键：方法 + 去掉片段的URL + 请求体摘要。"""
+    key = f"{method.upper()} {url.split('#', 1)[0]}"
+    if body:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key += " " + hashlib.sha1(body).hexdigest()
+    return key
+
+
+class CaptureArchive:
+    """
+    基于SQLite的录制归档，正文以zlib压缩存储。
+
+    同一请求被录制多次时，回放按录制顺序依次返回，用完后循环。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._cursors: Dict[tuple, int] = {}
+
+    def record(self, kind: str, key: str, elapsed: float, status: int = None, reason: str = None,
+               method: str = None, url: str = None, request_headers: Dict = None,
+               response_headers: Dict = None, body: bytes = b""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO exchanges (kind, request_key, method, url, request_headers, status, reason,"
+                " response_headers, body, elapsed, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    kind, key, method, url,
+                    json.dumps(dict(request_headers or {}), ensure_ascii=False),
+                    status, reason,
+                    json.dumps(dict(response_headers or {}), ensure_ascii=False),
+                    zlib.compress(body or b""),
+                    elapsed, time.time(),
+                ),
+            )
+            self._conn.commit()
+
+    def lookup(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """按录制顺序取出下一条匹配记录。"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, reason, response_headers, body, elapsed, url FROM exchanges"
+                " WHERE kind = ? AND request_key = ? ORDER BY id",
+                (kind, key),
+            ).fetchall()
+            if not rows:
+                return None
+            cursor = self._cursors.get((kind, key), 0)
+            self._cursors[(kind, key)] = cursor + 1
+        status, reason, headers, body, elapsed, url = rows[cursor % len(rows)]
+        return {
+            "status": status,
+            "reason": reason,
+            "headers": json.loads(headers or "{}"),
+            "body": zlib.decompress(body) if body else b"",
+            "elapsed": elapsed,
+            "url": url,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, COUNT(*), SUM(LENGTH(body)), AVG(elapsed) FROM exchanges GROUP BY kind"
+            ).fetchall()
+        return {
+            kind: {"exchanges": count, "compressed_bytes": size or 0, "avg_elapsed_ms": (avg or 0) * 1000}
+            for kind, count, size, avg in rows
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RecordingAdapter(HTTPAdapter):
+    """正常发送请求，并将完整的请求/响应写入归档。流式请求直接透传，不录制。"""
+
+    def __init__(self, archive: CaptureArchive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def send(self, request, stream=False, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, stream=stream, **kwargs)
+        if stream:
+            return response
+        body = response.content  # 读取完整正文
+        self.archive.record(
+            "http",
+            request_key(request.method, request.url, request.body),
+            time.perf_counter() - started,
+            status=response.status_code,
+            reason=response.reason,
+            method=request.method,
+            url=request.url,
+            request_headers=request.headers,
+            response_headers=response.headers,
+            body=body,
+        )
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """不访问网络，从归档构造响应，并按录制的耗时（乘以倍率）等待。"""
+
+    def __init__(self, archive: CaptureArchive, latency_scale: float = 1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+        self.latency_scale = latency_scale
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        entry = self.archive.lookup("http", request_key(request.method, request.url, request.body))
+        if entry is None:
+            raise ReplayMissError(f"归档中没有该请求的录制: {request.method} {request.url}", request=request)
+        if self.latency_scale:
+            time.sleep(entry["elapsed"] * self.latency_scale)
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        # 录制的正文已解压缩，去掉编码相关头部以免被再次解码
+        response.headers.pop("Content-Encoding", None)
+        response._content = entry["body"]
+        response._content_consumed = True
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        response.connection = self
+        return response
+
+
+_archive: Optional[CaptureArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_capture_mode() -> str:
+    return os.getenv("LINKA_CAPTURE_MODE", "").lower()
+
+
+def get_capture_archive() -> Optional[CaptureArchive]:
+    """录制/回放模式下返回进程级归档，否则返回None。"""
+    global _archive
+    if get_capture_mode() not in ("record", "replay"):
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = CaptureArchive(os.getenv("LINKA_CAPTURE_ARCHIVE", "linka_capture.sqlite"))
+    return _archive
+
+
+def configure_session_capture(session: requests.Session, **adapter_kwargs) -> Optional[str]:
+    """
+    按环境变量为会话挂载录制或回放适配器。
+
+    :param session: 共享的 requests.Session
+    :param adapter_kwargs: 传给 HTTPAdapter 的连接池参数
+    :return: 生效的模式，未启用时返回None
+    """
+    archive = get_capture_archive()
+    if archive is None:
+        return None
+    mode = get_capture_mode()
+    if mode == "record":
+        adapter = RecordingAdapter(archive, **adapter_kwargs)
+    else:
+        scale = float(os.getenv("LINKA_CAPTURE_LATENCY_SCALE", "1.0"))
+        adapter = ReplayAdapter(archive, latency_scale=scale, **adapter_kwargs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    logger.info("HTTP捕获模式: %s, 归档: %s", mode, archive.path)
+    return mode
+
+
+def capture_call(kind: str, key: str, fn: Callable[[], Any]) -> Any:
+    """
+    对返回可JSON序列化结果的调用（如搜索）进行录制或回放；未启用捕获时直接调用。
+
+    :param kind: 记录类别，如 "search:duckduckgo"
+    :param key: 匹配键，通常由调用参数构成
+    :param fn: 实际执行调用的无参函数
+    """
+    archive = get_capture_archive()
+    if archive is None:
+        return fn()
+    if get_capture_mode() == "replay":
+        entry = archive.lookup(kind, key)
+        if entry is None:
+            raise ReplayMissError(f"归档中没有该调用的录制: {kind} {key}")
+        scale = float(os.getenv("LINKA_CAPTURE_LATENCY_SCALE", "1.0"))
+        if scale:
+            time.sleep(entry["elapsed"] * scale)
+        return json.loads(entry["body"].decode("utf-8"))
+    started = time.perf_counter()
+    result = fn()
+    archive.record(
+        kind, key, time.perf_counter() - started,
+        body=json.dumps(result, ensure_ascii=False).encode("utf-8"),
+    )
+    return result
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("用法: python -m net_utils.http_capture <archive.sqlite>")
+        sys.exit(1)
+    for kind, stats in CaptureArchive(sys.argv[1]).stats().items():
+        print(
+            f"{kind:<24} {stats['exchanges']:>6} 条  压缩后 {stats['compressed_bytes'] / 1024:.1f} KB"
+            f"  平均耗时 {stats['avg_elapsed_ms']:.1f} ms"
+        )
@@ -0,0 +1,143 @@
+"""
+共享HTTP会话：进程级连接池 + DNS缓存 + 结果站点预连接
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .dns_cache import get_dns_cache_stats, install_dns_cache
+from .http_capture import configure_session_capture
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# 连接池与DNS缓存配置，可通过环境变量调整
+HTTP_POOL_CONNECTIONS = int(os.getenv("LINKA_HTTP_POOL_CONNECTIONS", "64"))
+HTTP_POOL_MAXSIZE = int(os.getenv("LINKA_HTTP_POOL_MAXSIZE", "16"))
+DNS_CACHE_TTL = float(os.getenv("LINKA_DNS_CACHE_TTL", "300"))
+
+_session = None
+_session_lock = threading.Lock()
+_preconnect_executor = None
+
+# 首字节时间统计（requests 的 elapsed 即发出请求到解析完响应头的耗时）
+_ttfb_lock = threading.Lock()
+_ttfb_stats = {"count": 0, "total": 0.0, "max": 0.0}
+
+
+def _record_ttfb(response, *args, **kwargs):
+    """响应钩子：记录每次请求的首字节时间。"""
+    elapsed = response.elapsed.total_seconds()
+    with _ttfb_lock:
+        _ttfb_stats["count"] += 1
+        _ttfb_stats["total"] += elapsed
+        _ttfb_stats["max"] = max(_ttfb_stats["max"], elapsed)
+    return response
+
+
+def get_http_session() -> requests.Session:
+    """
+    获取进程级共享的 requests.Session。
+
+    首次调用时安装DNS缓存（LINKA_DNS_CACHE_TTL 设为 0 可关闭），
+    并为 http/https 挂载较大的连接池，使各次抓取复用 keep-alive 连接。
+    """
+    global _session
+    if _session is not None:
+        return _session
+    with _session_lock:
+        if _session is None:
+            if DNS_CACHE_TTL > 0:
+                install_dns_cache(ttl=DNS_CACHE_TTL)
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # LINKA_CAPTURE_MODE=record|replay 时替换为录制/回放适配器
+            configure_session_capture(
+                session, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE
+            )
+            session.headers["User-Agent"] = DEFAULT_USER_AGENT
+            session.hooks["response"].append(_record_ttfb)
+            _session = session
+    return _session
+
+
+def preconnect(url: str, timeout: float = 5.0) -> bool:
+    """
+    预先建立到目标站点的连接（DNS解析 + TCP + TLS握手），并放回连接池供后续抓取复用。
+
+    :param url: 目标URL，只使用其scheme和host部分
+    :param timeout: 建连超时（秒）
+    :return: 是否成功建立连接
+    """
+    session = get_http_session()
+    if session.proxies or urlparse(url).scheme not in ("http", "https"):
+        return False
+    adapter = session.get_adapter(url)
+    if type(adapter) is not HTTPAdapter:
+        return False  # 录制/回放模式下不预连接
+    try:
+        request = requests.Request("HEAD", url).prepare()
+        # 与实际发请求时使用同一个连接池（同一pool key），否则预连接的连接无法被复用
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            pool = adapter.get_connection_with_tls_context(request, verify=session.verify)
+        else:
+            pool = adapter.get_connection(url)
+        conn = pool._get_conn(timeout=timeout)
+        try:
+            conn.timeout = timeout
+            conn.connect()
+        except Exception:
+            conn.close()
+            pool._put_conn(conn)
+            raise
+        pool._put_conn(conn)
+        return True
+    except Exception as e:
+        logging.debug(f"预连接失败 {url}: {e}")
+        return False
+
+
+def preconnect_hosts(urls: Iterable[str], max_workers: int = 8) -> List:
+    """
+    并行预连接一组URL所在的站点（按 scheme+host 去重），不阻塞调用方。
+
+    :param urls: URL列表，通常是搜索结果链接
+    :param max_workers: 预连接线程数
+    :return: 各站点预连接任务的Future列表
+    """
+    global _preconnect_executor
+    if _preconnect_executor is None:
+        with _session_lock:
+            if _preconnect_executor is None:
+                _preconnect_executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix="linka-preconnect"
+                )
+    origins = {}
+    for url in urls:
+        if not url:
+            continue
+        parsed = urlparse(url)
+        origins.setdefault(f"{parsed.scheme}://{parsed.netloc}", url)
+    return [_preconnect_executor.submit(preconnect, url) for url in origins.values()]
+
+
+def get_http_stats() -> Dict[str, Any]:
+    """返回抓取层统计：请求数、平均/最大首字节时间（毫秒）以及DNS缓存命中率。"""
+    with _ttfb_lock:
+        count = _ttfb_stats["count"]
+        stats = {
+            "requests": count,
+            "avg_ttfb_ms": _ttfb_stats["total"] / count * 1000 if count else 0.0,
+            "max_ttfb_ms": _ttfb_stats["max"] * 1000,
+        }
+    stats["dns"] = get_dns_cache_stats()
+    return stats
@@ -0,0 +1,197 @@
+"""
+按需性能剖析：对单次查询（显式开启或按比例采样）采集cProfile CPU剖析与tracemalloc内存差异，
+写入滚动目录，并附带查询和URL，便于在线上定位慢查询与内存热点。
+
+环境变量：
+    LINKA_PROFILE_RATE=0.01        # 采样比例，0 表示只在显式开启时剖析
+    LINKA_PROFILE_DIR=profiles     # 输出目录
+    LINKA_PROFILE_KEEP=50          # 最多保留的剖析记录数，超出时删除最旧的
+    LINKA_PROFILE_TOP=25           # 内存差异与CPU热点的条目数
+
+每条记录是一个子目录，包含：
+    meta.json      查询、URL、耗时、内存峰值
+    cpu.prof       pstats格式的原始数据（可用 snakeviz 等工具查看）
+    cpu.txt        按累计耗时排序的热点
+    memory.txt     剖析前后的tracemalloc差异（按代码行）
+嵌套的剖析（如查询内各页面的转换，运行在抓取线程中）写入同一目录，文件名带阶段前缀。
+"""
+import contextlib
+import contextvars
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("linka_profile_run", default=None)
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+class ProfileRun:
+    """一条剖析记录（一个输出目录）。"""
+
+    def __init__(self, kind: str, meta: Dict[str, Any]):
+        root = os.getenv("LINKA_PROFILE_DIR", "profiles")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.directory = os.path.join(root, f"{stamp}-{kind}-{uuid.uuid4().hex[:6]}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.meta = dict(meta, kind=kind, started_at=time.time())
+        self.thread_id = threading.get_ident()
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def set(self, **meta):
+        """补充元信息（例如搜索完成后才知道的URL列表）。"""
+        with self._lock:
+            self.meta.update(meta)
+
+    def add_stage(self, kind: str, **meta) -> Dict[str, Any]:
+        """登记一个嵌套阶段，返回其元信息字典（name 字段即输出文件前缀）。"""
+        with self._lock:
+            stage = dict(meta, name=f"{kind}-{next(self._seq)}")
+            self.meta.setdefault("stages", []).append(stage)
+        return stage
+
+    def write_meta(self):
+        with self._lock:
+            with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(self.meta, f, ensure_ascii=False, indent=2, default=str)
+
+
+def annotate_profile(**meta):
+    """为当前剖析记录补充元信息；未在剖析时不做任何事。"""
+    run = _current_run.get()
+    if run is not None:
+        run.set(**meta)
+
+
+def _should_profile(force: Optional[bool]) -> bool:
+    if force is not None:
+        return force
+    rate = float(os.getenv("LINKA_PROFILE_RATE", "0") or 0)
+    return rate > 0 and random.random() < rate
+
+
+def _top_n() -> int:
+    return int(os.getenv("LINKA_PROFILE_TOP", "25"))
+
+
+def _write_cpu(profiler: cProfile.Profile, directory: str, prefix: str):
+    profiler.dump_stats(os.path.join(directory, f"{prefix}.prof"))
+    buffer = io.StringIO()
+    pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(_top_n() * 2)
+    with open(os.path.join(directory, f"{prefix}.txt"), "w", encoding="utf-8") as f:
+        f.write(buffer.getvalue())
+
+
+def _start_tracemalloc() -> bool:
+    """开始跟踪内存分配；返回本次调用是否负责停止。"""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            return True
+        return False
+
+
+def _stop_tracemalloc(owner: bool):
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if owner and _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _rotate():
+    """只保留最近 LINKA_PROFILE_KEEP 条记录。"""
+    root = os.getenv("LINKA_PROFILE_DIR", "profiles")
+    keep = int(os.getenv("LINKA_PROFILE_KEEP", "50"))
+    try:
+        entries = sorted(
+            (os.path.join(root, name) for name in os.listdir(root)),
+            key=os.path.getmtime,
+        )
+    except OSError:
+        return
+    for path in entries[: max(0, len(entries) - keep)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def profile_scope(kind: str, force: Optional[bool] = None, **meta):
+    """
+    剖析一段代码。
+
+    - 已处于某条剖析记录中（例如查询内的页面转换）：剖析当前线程的CPU，写入同一目录。
+    - 否则按 force 或采样比例决定是否新建记录，同时采集CPU与内存差异。
+
+    :param kind: 阶段名，如 "query"、"convert"
+    :param force: True强制剖析，False强制不剖析，None按采样比例
+    :param meta: 写入meta.json的附加信息（query、url等）
+    :return: 上下文中产出 ProfileRun 或 None
+    """
+    parent = _current_run.get()
+    if parent is not None:
+        if parent.thread_id == threading.get_ident():
+            # 同一线程已由外层剖析覆盖
+            yield parent
+            return
+        stage = parent.add_stage(kind, **meta)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield parent
+        finally:
+            profiler.disable()
+            _write_cpu(profiler, parent.directory, stage["name"])
+            stage["seconds"] = time.perf_counter() - started
+        return
+
+    if not _should_profile(force):
+        yield None
+        return
+
+    run = ProfileRun(kind, meta)
+    token = _current_run.set(run)
+    owner = _start_tracemalloc()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield run
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        _current_run.reset(token)
+        try:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            _stop_tracemalloc(owner)
+            stats = after.compare_to(before, "lineno")
+            with open(os.path.join(run.directory, "memory.txt"), "w", encoding="utf-8") as f:
+                f.write(f"峰值内存: {peak / 1024 / 1024:.1f} MB（tracemalloc统计，含同时段其他线程）\n\n")
+                for stat in stats[: _top_n()]:
+                    f.write(f"{stat}\n")
+            _write_cpu(profiler, run.directory, "cpu")
+            run.set(seconds=elapsed, traced_peak_mb=peak / 1024 / 1024)
+            run.write_meta()
+            logger.info("📈 已写入剖析记录: %s (%.2fs)", run.directory, elapsed)
+        except Exception:
+            logger.exception("写入剖析记录失败")
+        _rotate()
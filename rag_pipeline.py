@@ -0,0 +1,248 @@
+"""
+RAG主流程：搜索 -> 抓取转换 -> 流式生成，以事件流的形式输出，供Streamlit界面、HTTP服务等复用
+"""
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from answer_cache import get_answer_cache
+from cache_warmer import get_cache_warmer
+from cancellation import raise_if_cancelled
+from conversation import INCREMENTAL_RESULTS, ConversationState, RetrievalContext, fit_history, route_turn
+from image_utils.image_desc_cache import get_background_analyzer, get_image_desc_cache
+from llm_utils import call_guiji_rag_model_stream, iter_stream_deltas
+from net_utils.http_session import DEFAULT_USER_AGENT
+from search_processing import process_search_and_content, retrieval_scope, start_retrieval, submit_image_analysis
+
+# 缓存回答按该长度切分为增量事件，前端沿用流式渲染逻辑
+CACHED_CHUNK_CHARS = 200
+
+# 后台图片分析模式下，是否在图片分析完成后更新回答，以及为此最多等待的秒数
+IMAGE_UPDATE_ANSWER = os.getenv("LINKA_IMAGE_UPDATE_ANSWER", "1") != "0"
+IMAGE_UPDATE_TIMEOUT = float(os.getenv("LINKA_IMAGE_UPDATE_TIMEOUT", "30"))
+
+
+def stream_answer(
+    query: str,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    analyze_images: bool = False,
+    cancel_token=None,
+    user_agent: Optional[str] = None,
+    profile: Optional[bool] = None,
+    use_cache: bool = True,
+    conversation: Optional[ConversationState] = None,
+    instant: bool = False,
+    background_images: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    执行完整的RAG流程并逐步产出事件。
+
+    参数:
+        query (str): 用户问题。
+        chat_history (list, optional): 本轮之前的历史消息列表，超出token预算的部分会被压缩或丢弃。
+        analyze_images (bool): 是否开启图片分析。
+        cancel_token (CancelToken, optional): 取消令牌。
+        user_agent (str, optional): 搜索使用的User-Agent。
+        profile (bool, optional): 是否对检索阶段进行性能剖析，None表示按采样比例。
+        use_cache (bool): 是否使用问答缓存；只对不依赖上文的首轮问题生效。为False时也不计入缓存预热的访问频次。
+        conversation (ConversationState, optional): 会话状态；提供时追问可复用上一轮资料或只做补充搜索。
+        instant (bool): 需要完整搜索时，先仅凭搜索摘要生成初步回答，网页抓取在后台继续，
+            抓到正文后再生成完整回答替换初步回答。
+        background_images (bool): 开启图片分析时不等待视觉模型：先用文字正文（及已缓存的图片描述）生成回答，
+            图片在后台分析并写入图片描述缓存；LINKA_IMAGE_UPDATE_ANSWER 开启时，分析完成后再生成
+            带图片描述的回答替换先前的回答。
+
+    返回:
+        事件字典的生成器，type 取值：
+        - "status": 进度提示，字段 message
+        - "sources": 搜索结果，字段 search_results（(title, url, snippet) 列表），
+          route 为本轮检索策略（"full" / "incremental" / "reuse"）
+        - "draft_delta" / "draft_done": 初步回答的增量与全文，字段 content / answer；stage 为
+          "snippets"（instant 模式，基于搜索摘要）或 "images"（后台图片分析模式，尚无图片描述）；
+          之后的 "delta" 事件属于替换初步回答的完整回答
+        - "delta": 回答增量，字段 content
+        - "done": 生成结束，字段 answer（完整回答），cached 表示是否来自缓存
+    """
+    standalone = _is_standalone(chat_history)
+    warmer = get_cache_warmer()
+    if warmer is not None and use_cache and standalone:
+        # 只统计使用缓存的实时请求；后台刷新（use_cache=False）计入频次会让热点问题自我维持
+        warmer.observe(query)
+    cache = get_answer_cache() if use_cache and standalone else None
+    if cache is not None:
+        entry = cache.get(query, analyze_images)
+        if entry is not None:
+            cache.refresh_if_stale(
+                entry, lambda: _compute_answer(entry.query, analyze_images, user_agent), analyze_images
+            )
+            if conversation is not None and entry.answer_blocks:
+                # 缓存的首轮回答同样留下参考内容，追问（如"展开第二点"）可以复用
+                conversation.retrieval = RetrievalContext(query, entry.search_results, entry.answer_blocks)
+            yield {"type": "status", "message": "⚡ 命中缓存，直接返回最近的回答。"}
+            yield {"type": "sources", "search_results": entry.search_results, "route": "cache"}
+            for i in range(0, len(entry.answer), CACHED_CHUNK_CHARS):
+                raise_if_cancelled(cancel_token)
+                yield {"type": "delta", "content": entry.answer[i:i + CACHED_CHUNK_CHARS]}
+            yield {"type": "done", "answer": entry.answer, "cached": True}
+            return
+
+    context = conversation.retrieval if conversation is not None else None
+    decision = route_turn(query, context)
+
+    def retrieve(search_query, max_results):
+        return process_search_and_content(
+            search_query,
+            max_results=max_results,
+            user_agent=user_agent or DEFAULT_USER_AGENT,
+            analyze_images=analyze_images,
+            cancel_token=cancel_token,
+            profile=profile,
+            defer_images=background_images,
+        )
+
+    draft = ""
+    if decision.action == "reuse":
+        context.touch(query)
+        search_summaries, answer_blocks = list(context.search_summaries), list(context.answer_blocks)
+        yield {"type": "status", "message": f"♻️ 复用上一轮检索到的{len(answer_blocks)}篇资料。"}
+        yield {"type": "sources", "search_results": search_summaries, "route": decision.action}
+    elif decision.action == "incremental":
+        yield {"type": "status", "message": f"🔍 补充搜索：{decision.search_query}"}
+        new_summaries, new_blocks = retrieve(decision.search_query, INCREMENTAL_RESULTS)
+        context.merge(query, new_summaries, new_blocks)
+        search_summaries, answer_blocks = list(context.search_summaries), list(context.answer_blocks)
+        yield {"type": "sources", "search_results": search_summaries, "route": decision.action}
+        yield {"type": "status", "message": f"✅ 补充了{len(new_blocks)}篇资料，共{len(answer_blocks)}篇。"}
+    elif instant:
+        yield {"type": "status", "message": "🔍 正在进行 DuckDuckGo 搜索..."}
+        # 剖析与 retrieval span 从搜索一直保持到 collect() 返回，与 process_search_and_content 一致
+        with retrieval_scope(query, analyze_images=analyze_images, profile=profile):
+            job = start_retrieval(
+                query,
+                user_agent=user_agent or DEFAULT_USER_AGENT,
+                analyze_images=analyze_images,
+                cancel_token=cancel_token,
+                defer_images=background_images,
+            )
+            # 覆盖率检查与扩展抓取在后台进行，与初步回答的生成重叠
+            job.start_expansion()
+            search_summaries = job.search_summaries
+            yield {"type": "sources", "search_results": search_summaries, "route": decision.action}
+            snippet_blocks = job.snippet_blocks()
+            try:
+                if snippet_blocks:
+                    # 搜索一返回就基于摘要作答，此时网页仍在调度器中并行抓取
+                    yield {"type": "status", "message": "⚡ 先根据搜索摘要生成初步回答，网页正文仍在后台抓取..."}
+                    parts = []
+                    for delta in _generate(query, snippet_blocks, chat_history, cancel_token):
+                        parts.append(delta)
+                        yield {"type": "draft_delta", "content": delta, "stage": "snippets"}
+                    draft = "".join(parts)
+                    yield {"type": "draft_done", "answer": draft, "stage": "snippets"}
+                answer_blocks = job.collect()
+            except BaseException:
+                # 初步回答失败或调用方不再读取事件：撤销仍在排队的抓取
+                job.cancel()
+                raise
+        if conversation is not None and answer_blocks:
+            conversation.retrieval = RetrievalContext(query, search_summaries, answer_blocks)
+        yield {"type": "status", "message": f"✅ 已获取{job.fetched_pages}/{len(search_summaries)}篇网页正文。"}
+        if draft and job.fetched_pages == 0:
+            # 没有比摘要更多的内容，初步回答即最终回答
+            if cache is not None:
+                cache.put(query, draft, search_summaries, analyze_images, answer_blocks)
+            yield {"type": "done", "answer": draft, "cached": False}
+            return
+    else:
+        yield {"type": "status", "message": "🔍 正在进行 DuckDuckGo 搜索..."}
+        search_summaries, answer_blocks = retrieve(query, 10)
+        if conversation is not None and answer_blocks:
+            conversation.retrieval = RetrievalContext(query, search_summaries, answer_blocks)
+        yield {"type": "sources", "search_results": search_summaries, "route": decision.action}
+        yield {"type": "status", "message": f"✅ 搜索完成，共{len(search_summaries)}条结果。"}
+    if not answer_blocks:
+        yield {"type": "done", "answer": ""}
+        return
+
+    if analyze_images:
+        # 本地索引、复用的资料和后台分析完成的图片都从缓存补上描述
+        answer_blocks = _apply_cached_image_descriptions(answer_blocks)
+    pending = (
+        list(submit_image_analysis(_image_urls(answer_blocks)).values())
+        if analyze_images and background_images else []
+    )
+    if pending and IMAGE_UPDATE_ANSWER and not draft:
+        raise_if_cancelled(cancel_token)
+        yield {"type": "status", "message": f"🖼️ {len(pending)}张图片在后台分析，先根据文字内容生成回答..."}
+        parts = []
+        for delta in _generate(query, answer_blocks, chat_history, cancel_token):
+            parts.append(delta)
+            yield {"type": "draft_delta", "content": delta, "stage": "images"}
+        draft = "".join(parts)
+        yield {"type": "draft_done", "answer": draft, "stage": "images"}
+        analyzed = get_background_analyzer().wait(pending, IMAGE_UPDATE_TIMEOUT, cancel_token)
+        if not analyzed:
+            # 图片分析未能及时完成，文字回答即最终回答；分析结果仍会写入缓存
+            if cache is not None:
+                cache.put(query, draft, search_summaries, analyze_images, answer_blocks)
+            yield {"type": "done", "answer": draft, "cached": False}
+            return
+        answer_blocks = _apply_cached_image_descriptions(answer_blocks)
+        yield {"type": "status", "message": f"🖼️ 已完成{analyzed}张图片的分析，正在更新回答..."}
+
+    raise_if_cancelled(cancel_token)
+    yield {"type": "status", "message": "🤖 正在调用大模型流式生成回答..."}
+    parts = []
+    for delta in _generate(query, answer_blocks, chat_history, cancel_token):
+        parts.append(delta)
+        yield {"type": "delta", "content": delta}
+    answer = "".join(parts)
+    if cache is not None:
+        cache.put(query, answer, search_summaries, analyze_images, answer_blocks)
+    yield {"type": "done", "answer": answer, "cached": False}
+
+
+def _generate(query, answer_blocks, chat_history, cancel_token) -> Iterator[str]:
+    """基于给定参考内容流式生成回答，逐个产出文本增量。"""
+    response = call_guiji_rag_model_stream(
+        query, answer_blocks, None, fit_history(chat_history), cancel_token=cancel_token
+    )
+    yield from iter_stream_deltas(response, cancel_token)
+
+
+def _image_urls(answer_blocks) -> List[str]:
+    from html2md import extract_img_urls
+
+    return list(dict.fromkeys(url for md, _ in answer_blocks for url in extract_img_urls(md)))
+
+
+def _apply_cached_image_descriptions(answer_blocks):
+    """用图片描述缓存为参考内容中尚无描述的图片补上标题和描述。"""
+    from html2md import apply_image_descriptions, extract_img_urls
+
+    cache = get_image_desc_cache()
+    enriched = []
+    for md, url in answer_blocks:
+        descriptions = cache.get_many(extract_img_urls(md))
+        enriched.append((apply_image_descriptions(md, descriptions) if descriptions else md, url))
+    return enriched
+
+
+def _is_standalone(chat_history: Optional[List[Dict[str, str]]]) -> bool:
+    """没有助手回复的对话视为独立问题，其答案不依赖上文，可以跨会话复用。"""
+    return not any(m.get("role") == "assistant" for m in chat_history or [])
+
+
+def _compute_answer(query: str, analyze_images: bool, user_agent: Optional[str]) -> Tuple[str, List, List]:
+    """不经过缓存完整执行一次流程，返回 (answer, search_results, answer_blocks)，用于后台刷新。"""
+    answer, search_results = "", []
+    conversation = ConversationState()
+    for event in stream_answer(
+        query, analyze_images=analyze_images, user_agent=user_agent, profile=False, use_cache=False,
+        conversation=conversation,
+    ):
+        if event["type"] == "sources":
+            search_results = event["search_results"]
+        elif event["type"] == "done":
+            answer = event["answer"]
+    answer_blocks = conversation.retrieval.answer_blocks if conversation.retrieval is not None else []
+    return answer, search_results, answer_blocks
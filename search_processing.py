@@ -1,33 +1,282 @@
 import asyncio
+import concurrent.futures
+import contextlib
 import os
+import threading
+import time
+from typing import Dict, Optional
 from html2md import convert_url_to_markdown
 from web_search.duckduckgo_search import search_duckduckgo
+from web_search import local_index
+from net_utils.http_session import preconnect_hosts
+from net_utils.fetch_scheduler import get_fetch_scheduler
+from answer_cache import normalize_query
+from cancellation import raise_if_cancelled
+from conversation import term_coverage
+from tracing import span
+from profiling import annotate_profile, profile_scope
 
-def fetch_and_convert(url, add_frontmatter=True, analyze_images=False):
-    return convert_url_to_markdown(
+# 检索结果页面送入模型前使用的Markdown输出配置（见 html2md.OUTPUT_PROFILES）
+MARKDOWN_PROFILE = os.getenv("LINKA_MARKDOWN_PROFILE", "prompt")
+
+# 自适应检索深度：先抓取排名最靠前的几篇，正文对问题要点的覆盖不足时再逐批扩展，最多到 max_results 篇
+ADAPTIVE_RETRIEVAL = os.getenv("LINKA_ADAPTIVE_RETRIEVAL", "1") != "0"
+ADAPTIVE_INITIAL = int(os.getenv("LINKA_ADAPTIVE_INITIAL", "3"))
+ADAPTIVE_STEP = int(os.getenv("LINKA_ADAPTIVE_STEP", "2"))
+ADAPTIVE_COVERAGE = float(os.getenv("LINKA_ADAPTIVE_COVERAGE", "0.8"))
+ADAPTIVE_MIN_PAGES = int(os.getenv("LINKA_ADAPTIVE_MIN_PAGES", "2"))
+
+
+def fetch_and_convert(url, add_frontmatter=True, analyze_images=False, cancel_token=None, defer_images=False):
+    with span("page", url=url, analyze_images=analyze_images) as page_span:
+        md = convert_url_to_markdown(
+            url,
+            provider="guiji",
+            api_key=os.getenv("GUIJI_API_KEY"),
+            base_url=os.getenv("GUIJI_BASE_URL"),
+            analyze_images=analyze_images,
+            add_frontmatter=add_frontmatter,
+            cancel_token=cancel_token,
+            profile=False,  # 只在所属查询被剖析时作为其嵌套阶段剖析
+            output_profile=MARKDOWN_PROFILE,
+            defer_images=defer_images,
+        )
+        page_span.set(ok=bool(md), chars=len(md) if md else 0)
+        return md
+
+
+def submit_fetch_and_convert(url, rank=0, query_time=None, add_frontmatter=True, analyze_images=False, cancel_token=None, background=False, defer_images=False):
+    """将抓取任务提交给进程级调度器，返回concurrent.futures.Future；background为True时以后台优先级执行。"""
+    return get_fetch_scheduler().submit(
         url,
-        provider="guiji",
-        api_key=os.getenv("GUIJI_API_KEY"),
-        base_url=os.getenv("GUIJI_BASE_URL"),
-        analyze_images=analyze_images,
-        add_frontmatter=add_frontmatter,
+        lambda: fetch_and_convert(
+            url, add_frontmatter=add_frontmatter, analyze_images=analyze_images, cancel_token=cancel_token,
+            defer_images=defer_images,
+        ),
+        rank=rank,
+        query_time=query_time,
+        background=background,
     )
 
 
-async def fetch_and_convert_async(url, add_frontmatter=True, analyze_images=False, session=None):
-    loop = asyncio.get_event_loop()
+def submit_image_analysis(urls):
+    """以页面转换所用的视觉模型配置提交后台图片分析，返回尚无缓存描述的图片 {url: Future}。"""
+    from image_utils.image_desc_cache import get_background_analyzer
+
+    return get_background_analyzer().submit(
+        urls, provider="guiji", api_key=os.getenv("GUIJI_API_KEY"), base_url=os.getenv("GUIJI_BASE_URL")
+    )
+
+
+async def fetch_and_convert_async(url, add_frontmatter=True, analyze_images=False, session=None, rank=0, query_time=None, cancel_token=None):
     try:
-        return await loop.run_in_executor(
-            None, lambda: fetch_and_convert(url, add_frontmatter=add_frontmatter, analyze_images=analyze_images)
+        future = submit_fetch_and_convert(
+            url, rank=rank, query_time=query_time, add_frontmatter=add_frontmatter,
+            analyze_images=analyze_images, cancel_token=cancel_token,
         )
+        return await asyncio.wrap_future(future)
     except Exception:
         return None
 
-def process_search_and_content(query, max_results=10, proxies=None, user_agent=None, analyze_images=False):
-    """并发抓取内容，无法获取的直接用搜索body。"""
-    results = search_duckduckgo(
-        query, max_results=max_results, proxies=proxies, user_agent=user_agent
+
+def _future_result(future):
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception:
+        return None
+
+
+def process_search_and_content(query, max_results=10, proxies=None, user_agent=None, analyze_images=False, preconnect=True, cancel_token=None, profile=None, adaptive=None, defer_images=False):
+    """
+    并发抓取内容，无法获取的直接用搜索body。
+    defer_images为True时图片分析不阻塞页面转换：未缓存描述的图片转入后台分析。
+    adaptive为True时先抓取前几篇，覆盖不足再扩展（None表示按 LINKA_ADAPTIVE_RETRIEVAL）。
+    preconnect为True时，拿到搜索结果后立即并行预连接各结果站点。
+    cancel_token被取消时，撤销尚未开始的抓取任务、中止进行中的图片分析，并抛出OperationCancelled。
+    profile为True时对本次查询进行CPU/内存剖析（None表示按 LINKA_PROFILE_RATE 采样），各页面转换作为嵌套阶段记录。
+    """
+    with retrieval_scope(query, max_results=max_results, analyze_images=analyze_images, profile=profile):
+        return _process_search_and_content(
+            query, max_results, proxies, user_agent, analyze_images, preconnect, cancel_token, adaptive,
+            defer_images,
+        )
+
+
+@contextlib.contextmanager
+def retrieval_scope(query, max_results=10, analyze_images=False, profile=None):
+    """
+    一次检索的剖析与追踪范围：按 profile 对查询进行剖析，并记录 retrieval span。
+    直接使用 start_retrieval 的调用方应从搜索开始一直保持到 collect() 返回。
+    """
+    with profile_scope("query", force=profile, query=query, analyze_images=analyze_images), \
+            span("retrieval", max_results=max_results):
+        yield
+
+
+def _process_search_and_content(query, max_results, proxies, user_agent, analyze_images, preconnect, cancel_token, adaptive=None, defer_images=False):
+    job = start_retrieval(
+        query, max_results=max_results, proxies=proxies, user_agent=user_agent,
+        analyze_images=analyze_images, preconnect=preconnect, cancel_token=cancel_token, adaptive=adaptive,
+        defer_images=defer_images,
     )
+    return job.search_summaries, job.collect()
+
+
+class RetrievalJob:
+    """
+    一次进行中的检索：搜索结果已经返回，各页面的抓取转换已提交给调度器在后台执行。
+    snippet_blocks() 可立即用于生成初步回答，collect() 等待抓取完成并返回最终的参考内容。
+
+    自适应模式下只有靠前的结果已提交，其余序号在 deferred 中；collect() 在已抓到的正文
+    覆盖问题要点不足时，经 submit(序号) 逐批提交后续结果。start_expansion() 可让这一过程
+    提前在后台线程中进行，与初步回答的生成重叠。
+    """
+
+    def __init__(self, search_summaries, urls, bodies, futures, cancel_token=None, local_urls=(),
+                 query=None, submit=None, deferred=()):
+        self.search_summaries = search_summaries
+        self.urls = urls
+        self.bodies = bodies
+        self.futures = futures
+        self.cancel_token = cancel_token
+        self.local_urls = set(local_urls)  # 直接取自本地索引、无需抓取的页面
+        self.query = query
+        self.fetched_pages = 0
+        self.submitted_pages = sum(1 for idx, f in enumerate(futures) if f is not None and urls[idx] not in self.local_urls)
+        self._submit = submit
+        self._deferred = list(deferred)
+        self._normalized: Dict[int, str] = {}
+        self._expansion: Optional[concurrent.futures.Future] = None
+        self._cancelled = False
+        self._unregister = None
+        if cancel_token is not None:
+            # 取消时撤销仍在排队的任务，释放调度器名额给其他会话
+            self._unregister = cancel_token.add_callback(
+                lambda: [future.cancel() for future in futures if future is not None]
+            )
+
+    def snippet_blocks(self):
+        """仅由搜索标题和摘要组成的参考内容，格式与 collect() 的结果相同。"""
+        return [
+            (f"{title or ''}\n{snippet}", url)
+            for (title, url, snippet) in self.search_summaries
+            if snippet
+        ]
+
+    def start_expansion(self):
+        """在后台线程中等待首批抓取并按覆盖率扩展，不阻塞调用方；collect() 等待其完成。"""
+        if self._expansion is None and self._deferred:
+            self._expansion = concurrent.futures.Future()
+            threading.Thread(target=self._run_expansion, name="linka-expand", daemon=True).start()
+
+    def _run_expansion(self):
+        try:
+            self._expansion.set_result(self._expand())
+        except BaseException as e:
+            self._expansion.set_exception(e)
+
+    def cancel(self):
+        """放弃这次检索：撤销尚未开始的抓取任务。"""
+        self._cancelled = True
+        self._deferred = []
+        for future in self.futures:
+            if future is not None:
+                future.cancel()
+        if self._unregister:
+            self._unregister()
+            self._unregister = None
+
+    def collect(self):
+        """
+        等待全部抓取结束，返回 [(markdown, url)]；抓取失败或未抓取的页面用搜索摘要兜底。
+        自适应模式下，已抓到的正文覆盖问题要点不足时逐批扩展抓取后续结果。
+        """
+        try:
+            md_results = self._expansion.result() if self._expansion is not None else self._expand()
+        finally:
+            if self._unregister:
+                self._unregister()
+                self._unregister = None
+        raise_if_cancelled(self.cancel_token)
+        index = local_index.get_local_index()
+        answer_blocks = []
+        self.fetched_pages = 0
+        for idx, md in enumerate(md_results):
+            url = self.urls[idx]
+            if md and md.strip():
+                answer_blocks.append((md, url))
+                self.fetched_pages += 1
+                if index is not None and url not in self.local_urls:
+                    index.submit_page(url, self.search_summaries[idx][0], md)
+            else:
+                # 用原始body作为兜底内容
+                answer_blocks.append((self.bodies[idx] or "", url))
+        return answer_blocks
+
+    def _expand(self):
+        """等待已提交的抓取，覆盖率不足时逐批提交后续结果，返回各结果的Markdown（未抓取为None）。"""
+        md_results = [_future_result(future) for future in self.futures]
+        while self._deferred and not self._cancelled:
+            coverage = self._coverage(md_results)
+            if coverage is not None and coverage >= ADAPTIVE_COVERAGE:
+                break
+            raise_if_cancelled(self.cancel_token)
+            wave, self._deferred = self._deferred[:ADAPTIVE_STEP], self._deferred[ADAPTIVE_STEP:]
+            with span("retrieval.expand", pages=len(wave), coverage=round(coverage or 0.0, 3)):
+                for idx in wave:
+                    self.futures[idx] = self._submit(idx)
+                    self.submitted_pages += 1
+                for idx in wave:
+                    md_results[idx] = _future_result(self.futures[idx])
+        return md_results
+
+    def _coverage(self, md_results) -> Optional[float]:
+        """已抓到正文对问题要点的覆盖率；正文页数不足 ADAPTIVE_MIN_PAGES 时返回None（需要扩展）。"""
+        for idx, md in enumerate(md_results):
+            if md and md.strip() and idx not in self._normalized:
+                self._normalized[idx] = normalize_query(md)
+        if len(self._normalized) < ADAPTIVE_MIN_PAGES:
+            return None
+        return term_coverage(self.query or "", "\n".join(self._normalized.values()))
+
+
+def start_retrieval(query, max_results=10, proxies=None, user_agent=None, analyze_images=False, preconnect=True, cancel_token=None, use_local_index=True, background=False, adaptive=None, defer_images=False):
+    """
+    执行搜索并把各结果页面的抓取转换提交给调度器，不等待抓取完成，返回RetrievalJob。
+    先查本地索引：本地结果足以覆盖问题时不再联网搜索；否则联网搜索并附加少量本地结果，
+    近期抓取过的页面直接使用本地正文，不再重新抓取。
+    use_local_index为False时跳过本地索引，全部重新搜索抓取（抓取结果仍会写入索引）；
+    background为True时抓取任务以后台优先级提交（缓存预热使用）；
+    adaptive为True时只先提交前 ADAPTIVE_INITIAL 篇，其余由 collect() 按覆盖率决定是否抓取
+    （None表示按 LINKA_ADAPTIVE_RETRIEVAL）；
+    defer_images为True时页面转换不等待图片分析，未缓存描述的图片转入后台分析。
+    """
+    if adaptive is None:
+        adaptive = ADAPTIVE_RETRIEVAL
+    query_time = time.monotonic()
+    local_results, local_coverage = [], 0.0
+    if use_local_index:
+        with span("search", engine="local") as local_span:
+            local_results = local_index.search_local_index(
+                query, max_results=max_results, max_age=local_index.FRESH_SECONDS
+            )
+            local_coverage = local_index.coverage(query, local_results) if local_results else 0.0
+            local_span.set(results=len(local_results), coverage=round(local_coverage, 3))
+    local_pages = {r["href"]: r["markdown"] for r in local_results}
+    if local_index.answerable(query, local_results):
+        results = local_results
+    else:
+        with span("search", engine="duckduckgo") as search_span:
+            results = search_duckduckgo(
+                query, max_results=max_results, proxies=proxies, user_agent=user_agent
+            )
+            search_span.set(results=len(results))
+        web_urls = {r.get("href") or r.get("url") for r in results}
+        results = results + [r for r in local_results if r["href"] not in web_urls][:local_index.EXTRA_RESULTS]
+        if use_local_index:
+            local_pages.update(local_index.fresh_pages(web_urls))
     search_summaries = []
     urls = []
     bodies = []
@@ -39,19 +288,34 @@ def process_search_and_content(query, max_results=10, proxies=None, user_agent=N
         urls.append(url)
         bodies.append(snippet)
 
-    async def batch_fetch():
-        tasks = [fetch_and_convert_async(url, add_frontmatter=False, analyze_images=analyze_images) if url else None for url in urls]
-        return await asyncio.gather(*tasks)
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    md_results = loop.run_until_complete(batch_fetch())
-    answer_blocks = []
-    for idx, md in enumerate(md_results):
-        url = urls[idx]
-        if md and md.strip():
-            answer_blocks.append((md, url))
-        else:
-            # 用原始body作为兜底内容
-            answer_blocks.append((bodies[idx] or "", url))
-    return search_summaries, answer_blocks
+    annotate_profile(urls=urls)
+    raise_if_cancelled(cancel_token)
+    remote = [idx for idx, url in enumerate(urls) if url and url not in local_pages]
+    # 自适应模式下先抓取的篇数
+    initial = remote[:ADAPTIVE_INITIAL] if adaptive else remote
+    deferred = remote[len(initial):]
+    if preconnect and not proxies:
+        # 预连接与排队等待调度并行进行，抓取时直接复用已握手的连接
+        preconnect_hosts([urls[idx] for idx in initial])
+
+    def submit(idx):
+        return submit_fetch_and_convert(
+            urls[idx], rank=idx, query_time=query_time, add_frontmatter=False,
+            analyze_images=analyze_images, cancel_token=cancel_token, background=background,
+            defer_images=defer_images,
+        )
+
+    # 交给进程级调度器：全局/单站点并发受限，按查询时间和排名排序，队列满时在此处阻塞（背压）
+    futures = [_completed_future(local_pages[url]) if url in local_pages else None for url in urls]
+    for idx in initial:
+        futures[idx] = submit(idx)
+    return RetrievalJob(
+        search_summaries, urls, bodies, futures, cancel_token, local_urls=local_pages,
+        query=query, submit=submit, deferred=deferred,
+    )
+
+
+def _completed_future(result):
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
@@ -0,0 +1,13 @@
+"""
+统计工具函数，供批量问答报告和性能基准共用
+"""
+import math
+from typing import List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数。"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))]
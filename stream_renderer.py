@@ -0,0 +1,87 @@
+"""
+流式回答渲染：合并模型增量后按时间间隔或字符数批量刷新，避免每个token都重新渲染整段回答
+"""
+import os
+import time
+from typing import Callable, List
+
+# 刷新间隔与最大积压字符数，可通过环境变量调整
+STREAM_INTERVAL_MS = float(os.getenv("LINKA_STREAM_INTERVAL_MS", "50"))
+STREAM_MAX_PENDING_CHARS = int(os.getenv("LINKA_STREAM_MAX_PENDING_CHARS", "400"))
+
+
+class BufferedStreamRenderer:
+    """
+    缓冲式流渲染器。
+
+    增量先追加到块列表中，满足以下任一条件时才调用一次 render(完整文本)：
+    - 距离上次刷新超过 interval 秒
+    - 积压的字符数超过 max_pending_chars
+    这样渲染次数由刷新频率决定，而不是由token数量决定。
+    """
+
+    def __init__(
+        self,
+        render: Callable[[str], None],
+        interval: float = STREAM_INTERVAL_MS / 1000,
+        max_pending_chars: int = STREAM_MAX_PENDING_CHARS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        :param render: 渲染回调，接收当前完整文本，例如 placeholder.markdown
+        :param interval: 最小刷新间隔（秒），0 表示每个增量都刷新
+        :param max_pending_chars: 积压字符数上限，超过后立即刷新
+        :param clock: 时钟函数，便于测试替换
+        """
+        self._render = render
+        self.interval = interval
+        self.max_pending_chars = max_pending_chars
+        self._clock = clock
+        self._chunks: List[str] = []
+        self._rendered_chunks = 0
+        self._pending_chars = 0
+        self._last_flush = clock()
+        self.renders = 0
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def has_pending(self) -> bool:
+        return self._rendered_chunks < len(self._chunks)
+
+    def append(self, delta: str):
+        """追加一个增量，必要时触发刷新。"""
+        if not delta:
+            return
+        self._chunks.append(delta)
+        self._pending_chars += len(delta)
+        if (
+            self._pending_chars >= self.max_pending_chars
+            or self._clock() - self._last_flush >= self.interval
+        ):
+            self.flush()
+
+    def tick(self):
+        """在没有新增量时调用（例如等待下一个事件超时），把到期的积压内容刷出去。"""
+        if self.has_pending and self._clock() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """立即渲染当前完整文本。"""
+        if not self.has_pending:
+            return
+        if len(self._chunks) > 1:
+            # 合并已有块，使后续join只需处理少量块
+            self._chunks = ["".join(self._chunks)]
+        self._render(self._chunks[0])
+        self._rendered_chunks = len(self._chunks)
+        self._pending_chars = 0
+        self._last_flush = self._clock()
+        self.renders += 1
+
+    def close(self) -> str:
+        """刷出剩余内容并返回完整文本。"""
+        self.flush()
+        return self.text
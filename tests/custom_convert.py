@@ -1,8 +1,10 @@
 from markdownify import MarkdownConverter, abstract_inline_conversion, chomp
 from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
 import asyncio
 import os
+import re
 from typing import Optional
 from image_utils.async_image_analysis import AsyncImageAnalysis
 
@@ -12,7 +14,13 @@ class CustomMarkdownConverter(MarkdownConverter):
     提供了更灵活的HTML到Markdown转换选项，例如：
     - 转换链接为绝对路径。
     - 移除所有链接和图片。
-    - 特殊处理包含colspan或rowspan的表格。    """
+    - 特殊处理包含colspan或rowspan的表格。
+    - 配置了图像分析器时，遍历DOM只为图片留占位符，转换结束后一次性并发分析全部图片再回填。    """
+
+    # 图片占位符使用私有区字符，不会被markdownify转义或与正文冲突
+    _IMAGE_PLACEHOLDER = "\ue000{}\ue001"
+    _IMAGE_PLACEHOLDER_RE = re.compile("\ue000(\\d+)\ue001")
+
     def __init__(self, current_url: str | None = None,
                  image_analyzer_provider: Optional[str] = None,
                  image_analyzer_api_key: Optional[str] = None,
@@ -35,6 +43,10 @@ class CustomMarkdownConverter(MarkdownConverter):
         super().__init__(**kwargs)
         
         self.current_url = current_url # 存储当前URL，用于路径转换
+        # 本次转换中待分析的图片：(src_url, alt_text, title_part)，按占位符序号排列
+        self._pending_images = []
+        # 分析器的客户端和信号量绑定在首次使用的事件循环上，所有批次都在同一个私有循环中执行
+        self._loop = None
         
         # 初始化图像分析器
         self.image_analyzer = None
@@ -58,7 +70,7 @@ class CustomMarkdownConverter(MarkdownConverter):
         """
         转换<img>标签为Markdown格式的图片。
         如果提供了current_url，则将图片src转换为绝对路径。
-        如果配置了图像分析器，将尝试分析图片并生成描述性的标题和描述（仅限远程URL）。
+        如果配置了图像分析器，远程URL的图片先输出占位符，由convert_soup在转换结束后批量分析并回填标题和描述。
 
         :param el: BeautifulSoup的Tag对象，代表<img>元素。
         :param text: 图片的替代文本（通常为空，因为alt属性会被单独提取）。
@@ -80,32 +92,88 @@ class CustomMarkdownConverter(MarkdownConverter):
         if self.current_url:
             src_url = urljoin(self.current_url, src_url)
 
-        # 尝试使用图像分析器 - 仅限远程 URL
-        if self.image_analyzer and src_url and src_url.startswith(('http://', 'https://')):
-            try:
-                analysis_result = asyncio.run(
-                    self.image_analyzer.analyze_image(image_url=src_url)
-                )
-                if analysis_result and not analysis_result.get('error'):
-                    analyzed_title = analysis_result.get('title', alt_text or '图片')
-                    analyzed_description = analysis_result.get('description', '')
-                    markdown_output = f'![{analyzed_title}]({src_url})'
-                    if analyzed_description:
-                        description_lines = analyzed_description.strip().split('\n')
-                        formatted_description = '\n'.join(f'> {line}' for line in description_lines)
-                        markdown_output += f'\n{formatted_description}'
-                    return markdown_output
-            except Exception as e:
-                print(f"图像分析失败: {e}")
-                # 分析失败，继续使用默认逻辑
-
         if title_text:
             escaped_title = title_text.replace('"', r'\"')
             title_part = f' "{escaped_title}"'
         else:
             title_part = ''
+
+        # 使用图像分析器 - 仅限远程 URL；先输出占位符，转换结束后批量分析再回填
+        if self.image_analyzer and src_url.startswith(('http://', 'https://')):
+            self._pending_images.append((src_url, alt_text, title_part))
+            return self._IMAGE_PLACEHOLDER.format(len(self._pending_images) - 1)
+
         return f'![{alt_text}]({src_url}{title_part})'
 
+    def convert_soup(self, soup):
+        """
+        转换整个文档：先完成DOM遍历，再并发解析遍历中收集的全部图片并替换占位符。
+        页面图片的分析耗时因此接近一次视觉调用，而不是每张图片依次累加。
+        """
+        self._pending_images = []
+        markdown = super().convert_soup(soup)
+        if not self._pending_images:
+            return markdown
+        pending, self._pending_images = self._pending_images, []
+        rendered = self._resolve_images(pending)
+        return self._IMAGE_PLACEHOLDER_RE.sub(lambda m: rendered[int(m.group(1))], markdown)
+
+    def _resolve_images(self, pending):
+        """
+        批量分析待处理图片（同一URL只分析一次），返回与pending一一对应的Markdown片段。
+        分析失败的图片退回普通图片语法。
+
+        :param pending: (src_url, alt_text, title_part) 列表
+        :return: Markdown字符串列表
+        """
+        unique_urls = list(dict.fromkeys(src_url for src_url, _, _ in pending))
+        try:
+            results = self._run_async(
+                self.image_analyzer.analyze_multiple_images([{"image_url": url} for url in unique_urls])
+            )
+            analyses = dict(zip(unique_urls, results))
+        except Exception as e:
+            print(f"图像分析失败: {e}")
+            analyses = {}
+
+        rendered = []
+        for src_url, alt_text, title_part in pending:
+            analysis_result = analyses.get(src_url)
+            if analysis_result and not analysis_result.get('error'):
+                analyzed_title = analysis_result.get('title', alt_text or '图片')
+                analyzed_description = analysis_result.get('description', '')
+                markdown_output = f'![{analyzed_title}]({src_url})'
+                if analyzed_description:
+                    description_lines = analyzed_description.strip().split('\n')
+                    formatted_description = '\n'.join(f'> {line}' for line in description_lines)
+                    markdown_output += f'\n{formatted_description}'
+                rendered.append(markdown_output)
+            else:
+                # 分析失败，使用默认逻辑
+                rendered.append(f'![{alt_text}]({src_url}{title_part})')
+        return rendered
+
+    def _run_async(self, coro):
+        """
+        在转换器的私有事件循环中执行协程；调用方线程已有运行中的事件循环时，改在辅助线程中执行。
+        """
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self._loop.run_until_complete(coro)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(self._loop.run_until_complete, coro).result()
+
+    def close(self):
+        """关闭图像分析器的客户端和私有事件循环。"""
+        if self._loop is not None and not self._loop.is_closed():
+            if self.image_analyzer is not None:
+                self._loop.run_until_complete(self.image_analyzer.client.close())
+            self._loop.close()
+        self._loop = None
+
     def _process_table_element(self, element):
         """
         辅助方法：处理包含colspan或rowspan属性的表格元素（td, th）。
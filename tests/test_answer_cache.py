@@ -0,0 +1,73 @@
+import threading
+import time
+
+from answer_cache import AnswerCache, normalize_query
+
+SOURCES = [("标题", "https://example.com/a", "摘要")]
+
+
+def test_exact_match_ignores_case_width_and_punctuation():
+    cache = AnswerCache()
+    cache.put("Python 3.13 有什么新特性？", "回答", SOURCES)
+    entry = cache.get("ｐｙｔｈｏｎ　3.13有什么新特性")
+    assert entry is not None and entry.answer == "回答"
+    assert cache.get("Python 3.13 有什么新特性？", analyze_images=True) is None
+    assert normalize_query("  A，B！") == "ab"
+
+
+def test_near_duplicate_cjk_query_matches():
+    cache = AnswerCache(similarity=0.8)
+    cache.put("北京今天的天气怎么样适合出门吗", "晴", SOURCES)
+    entry = cache.get("北京今天天气怎么样适合出门吗")
+    assert entry is not None and entry.answer == "晴"
+    assert cache.stats()["similar_hits"] == 1
+    assert cache.get("上海明天会下雨吗") is None
+
+
+def test_near_match_requires_identical_numbers():
+    cache = AnswerCache(similarity=0.8)
+    cache.put("请问2023年诺贝尔物理学奖的得主是谁以及他们的主要贡献是什么", "2023年的回答", SOURCES)
+    assert cache.get("请问2024年诺贝尔物理学奖的得主是谁以及他们的主要贡献是什么") is None
+    assert cache.get("请问2023年诺贝尔物理学奖得主是谁以及他们的主要贡献是什么").answer == "2023年的回答"
+
+
+def test_similarity_zero_only_matches_exactly():
+    cache = AnswerCache(similarity=0)
+    cache.put("北京今天的天气怎么样适合出门吗", "晴", SOURCES)
+    assert cache.get("北京今天天气怎么样适合出门吗") is None
+
+
+def test_expired_entries_are_not_returned():
+    cache = AnswerCache(ttl=600)
+    cache.put("北京今天的天气怎么样适合出门吗", "晴", SOURCES)
+    entry = cache.get("北京今天的天气怎么样适合出门吗")
+    entry.created_at -= 601
+    assert cache.get("北京今天的天气怎么样适合出门吗") is None
+    assert cache.get("北京今天天气怎么样适合出门吗") is None
+
+
+def test_refresh_if_stale_runs_once_per_entry():
+    cache = AnswerCache(ttl=600, refresh_before=120)
+    cache.put("北京今天的天气怎么样", "旧回答", SOURCES)
+    entry = cache.get("北京今天的天气怎么样")
+    calls = []
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "新回答", SOURCES, [("正文", "https://example.com/a")]
+
+    assert not cache.refresh_if_stale(entry, compute)
+    entry.created_at -= 500
+    assert cache.refresh_if_stale(entry, compute)
+    assert not cache.refresh_if_stale(entry, compute)
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.get("北京今天的天气怎么样").answer != "新回答":
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    refreshed = cache.get("北京今天的天气怎么样")
+    assert calls == [1]
+    assert refreshed.answer_blocks == [("正文", "https://example.com/a")]
+    assert refreshed.age() < 5
@@ -0,0 +1,25 @@
+from answer_cache import normalize_query
+from conversation import RetrievalContext, query_terms, route_turn, term_coverage
+
+
+def test_query_terms_split_english_words():
+    assert query_terms("Python 3.13 release date") == ["python", "313", "release", "date"]
+    assert query_terms("What is the capital of France and why is it there?") == ["capital", "france"]
+
+
+def test_term_coverage_english_query():
+    page = normalize_query("Python 3.13 was released on October 7, 2024. Release date and new features.")
+    assert term_coverage("Python 3.13 release date", page) == 1.0
+    assert term_coverage("Rust 1.80 release date", page) == 0.5
+
+
+def test_route_turn_new_questions_do_not_reuse():
+    context = RetrievalContext(
+        "Python 3.13 新特性",
+        [("Python 3.13", "https://example.com/py313", "Python 3.13 was released on October 7, 2024")],
+        [("Python 3.13 was released on October 7, 2024 with a new interactive REPL.", "https://example.com/py313")],
+    )
+    for query in ("为什么天空是蓝色的？", "这个周末上海有什么展览", "What is the capital of France and why is it there?"):
+        assert route_turn(query, context).action == "full"
+    assert route_turn("展开第二点", context).action == "reuse"
+    assert route_turn("Python 3.13 release date", context).action == "reuse"
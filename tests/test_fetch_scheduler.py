@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from net_utils.fetch_scheduler import FetchScheduler, SchedulerBusyError
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(**kwargs):
+        scheduler = FetchScheduler(**kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def occupy(scheduler, url="https://blocker.example/"):
+    """提交一个阻塞任务并等它开始执行，返回放行用的 Event。"""
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit(url, lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    return release
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.01)
+
+
+def test_jobs_run_in_query_time_plus_rank_order(make_scheduler):
+    scheduler = make_scheduler(max_concurrency=1, rank_spacing=2.0)
+    release = occupy(scheduler)
+    order = []
+    jobs = [("new-top", 100.0, 0), ("old-third", 95.0, 3), ("old-top", 95.0, 0), ("new-second", 100.0, 1)]
+    futures = [
+        scheduler.submit(f"https://{name}.example/", lambda name=name: order.append(name), rank=rank, query_time=t)
+        for name, t, rank in jobs
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    # 优先级：old-top 95, new-top 100, new-second 102, old-third 101
+    assert order == ["old-top", "new-top", "old-third", "new-second"]
+
+
+def test_per_host_limit(make_scheduler):
+    scheduler = make_scheduler(max_concurrency=4, per_host_limit=1)
+    lock = threading.Lock()
+    running = {"same": 0}
+    peak = {"same": 0}
+    release = threading.Event()
+
+    def job():
+        with lock:
+            running["same"] += 1
+            peak["same"] = max(peak["same"], running["same"])
+        release.wait(5)
+        with lock:
+            running["same"] -= 1
+
+    futures = [scheduler.submit(f"https://same.example/{i}", job) for i in range(3)]
+    other = scheduler.submit("https://other.example/", lambda: "other")
+    # 同站点任务占满名额时，其他站点的任务不受影响
+    assert other.result(5) == "other"
+    wait_until(lambda: scheduler.stats()["active"] == 1)
+    assert scheduler.stats()["pending"] == 2
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert peak["same"] == 1
+
+
+def test_backpressure_when_queue_is_full(make_scheduler):
+    scheduler = make_scheduler(max_concurrency=1, max_pending=1)
+    release = occupy(scheduler)
+    queued = scheduler.submit("https://a.example/", lambda: "queued")
+    with pytest.raises(SchedulerBusyError):
+        scheduler.submit("https://b.example/", lambda: None, block=False)
+    with pytest.raises(SchedulerBusyError):
+        scheduler.submit("https://b.example/", lambda: None, timeout=0.05)
+    release.set()
+    assert queued.result(5) == "queued"
+    assert scheduler.submit("https://b.example/", lambda: "ok", timeout=5).result(5) == "ok"
+
+
+def test_background_share_caps_background_jobs(make_scheduler):
+    scheduler = make_scheduler(max_concurrency=4, background_share=0.25)
+    assert scheduler.max_background == 1
+    release = threading.Event()
+    background = [
+        scheduler.submit(f"https://bg{i}.example/", lambda: release.wait(5), background=True) for i in range(3)
+    ]
+    wait_until(lambda: scheduler.stats()["background_active"] == 1)
+    time.sleep(0.05)
+    stats = scheduler.stats()
+    assert stats["background_active"] == 1
+    assert stats["pending"] == 2
+    # 后台任务排队时，交互任务仍可使用其余并发
+    assert scheduler.submit("https://live.example/", lambda: "live").result(5) == "live"
+    release.set()
+    for future in background:
+        assert future.result(5) is True
+
+
+def test_cancelled_queued_job_is_skipped(make_scheduler):
+    scheduler = make_scheduler(max_concurrency=1)
+    release = occupy(scheduler)
+    called = []
+    cancelled = scheduler.submit("https://a.example/", lambda: called.append("cancelled"))
+    kept = scheduler.submit("https://b.example/", lambda: called.append("kept"))
+    assert cancelled.cancel()
+    release.set()
+    kept.result(5)
+    assert called == ["kept"]
+    assert cancelled.cancelled()
+    wait_until(lambda: scheduler.stats()["pending"] == 0)
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from web_search.local_index import LocalIndex, answerable
+
+NOBEL_2023 = (
+    "2023年诺贝尔物理学奖授予皮埃尔·阿戈斯蒂尼、费伦茨·克劳斯和安妮·吕利耶，"
+    "表彰他们在阿秒光脉冲实验方法上的贡献。"
+)
+PYTHON_313 = "Python 3.13 was released on October 7, 2024 with a new interactive REPL and an experimental JIT."
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalIndex(str(tmp_path / "index.sqlite"), compact_every=0)
+    yield index
+    index.close()
+
+
+def test_search_finds_chinese_and_english_pages(index):
+    index.add_page("https://example.com/nobel-1", "2023年诺贝尔物理学奖", NOBEL_2023)
+    index.add_page("https://example.com/py313", "Python 3.13 release", PYTHON_313)
+    index.add_page("https://example.com/other", "无关页面", "今天上海多云，气温二十度。")
+
+    results = index.search("2023年诺贝尔物理学奖")
+    assert [r["href"] for r in results] == ["https://example.com/nobel-1"]
+    assert results[0]["markdown"] == NOBEL_2023
+    assert results[0]["coverage"] == 1.0
+
+    results = index.search("Python 3.13 release date")
+    assert [r["href"] for r in results] == ["https://example.com/py313"]
+    assert index.search("量子计算机的原理") == []
+
+
+def test_search_respects_max_age(index):
+    index.add_page("https://example.com/old", "2023年诺贝尔物理学奖", NOBEL_2023, fetched_at=time.time() - 7200)
+    assert index.search("2023年诺贝尔物理学奖", max_age=3600) == []
+    assert len(index.search("2023年诺贝尔物理学奖")) == 1
+
+
+def test_answerable_requires_pages_coverage_and_exact_terms(index):
+    index.add_page("https://example.com/nobel-1", "2023年诺贝尔物理学奖", NOBEL_2023)
+    one_page = index.search("2023年诺贝尔物理学奖")
+    assert not answerable("2023年诺贝尔物理学奖", one_page)
+
+    index.add_page("https://example.com/nobel-2", "2023年诺贝尔物理学奖揭晓", NOBEL_2023)
+    results = index.search("2023年诺贝尔物理学奖")
+    assert len(results) == 2
+    assert answerable("2023年诺贝尔物理学奖", results)
+    # 二元组覆盖率达到阈值，但年份不同，不能只凭本地结果回答
+    results = index.search("2024年诺贝尔物理学奖")
+    assert len(results) == 2
+    assert not answerable("2024年诺贝尔物理学奖", results)
+
+
+def test_compact_removes_stale_and_excess_pages(index):
+    now = time.time()
+    index.add_page("https://example.com/stale", "旧页面", NOBEL_2023, fetched_at=now - 40 * 86400)
+    for i in range(3):
+        index.add_page(f"https://example.com/p{i}", "页面", PYTHON_313, fetched_at=now - i)
+
+    assert index.compact(retention_days=30, max_pages=2) == 2
+    stats = index.stats()
+    assert stats["pages"] == 2
+    assert set(index.pages(["https://example.com/p0", "https://example.com/p1", "https://example.com/p2"])) == {
+        "https://example.com/p0", "https://example.com/p1",
+    }
+    assert index.search("2023年诺贝尔物理学奖") == []
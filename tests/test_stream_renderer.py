@@ -0,0 +1,53 @@
+from stream_renderer import BufferedStreamRenderer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_renderer(**kwargs):
+    clock = FakeClock()
+    rendered = []
+    renderer = BufferedStreamRenderer(rendered.append, clock=clock, **kwargs)
+    return renderer, clock, rendered
+
+
+def test_flushes_by_interval_not_per_delta():
+    renderer, clock, rendered = make_renderer(interval=0.05, max_pending_chars=1000)
+    for delta in ("你", "好", "，"):
+        renderer.append(delta)
+    assert rendered == []
+    clock.now = 0.05
+    renderer.append("世界")
+    assert rendered == ["你好，世界"]
+    renderer.append("！")
+    assert rendered == ["你好，世界"]
+    assert renderer.close() == "你好，世界！"
+    assert rendered == ["你好，世界", "你好，世界！"]
+    assert renderer.renders == 2
+
+
+def test_flushes_when_pending_chars_exceed_limit():
+    renderer, _, rendered = make_renderer(interval=10, max_pending_chars=5)
+    renderer.append("abc")
+    assert rendered == []
+    renderer.append("de")
+    assert rendered == ["abcde"]
+
+
+def test_tick_flushes_due_backlog():
+    renderer, clock, rendered = make_renderer(interval=0.05, max_pending_chars=1000)
+    renderer.append("a")
+    renderer.tick()
+    assert rendered == []
+    clock.now = 0.1
+    renderer.tick()
+    assert rendered == ["a"]
+    clock.now = 0.2
+    renderer.tick()
+    assert rendered == ["a"]
+    assert not renderer.has_pending
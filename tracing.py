@@ -0,0 +1,283 @@
+"""
+分阶段耗时追踪：结构化span + 可插拔输出（JSON日志、内存环形缓冲、Prometheus文本格式）
+
+未安装任何sink时，span() 返回共享的空操作对象，热路径上几乎没有开销。
+
+用法：
+    from tracing import span, record_span
+    with span("page.fetch", url=url) as s:
+        resp = session.get(url)
+        s.set(status=resp.status_code)
+
+通过环境变量启用：
+    LINKA_TRACE_SINKS=json,ring,prometheus
+    LINKA_TRACE_LOG=/var/log/linka/spans.jsonl   # json sink 的输出文件，缺省写入标准错误
+"""
+import collections
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("linka_trace", default=None)
+
+
+class SpanRecord:
+    """一次已完成的span。"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attrs", "error")
+
+    def __init__(self, name, trace_id, span_id, parent_id, start, duration, attrs, error=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration * 1000,
+            "attrs": self.attrs,
+            "error": self.error,
+        }
+
+
+class JsonLogSink:
+    """每个span写一行JSON。"""
+
+    def __init__(self, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._stream = open(path, "a", encoding="utf-8") if path else sys.stderr
+
+    def emit(self, record: SpanRecord):
+        line = json.dumps(record.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+
+class RingBufferSink:
+    """在内存中保留最近 capacity 个span，便于调试接口或测试读取。"""
+
+    def __init__(self, capacity: int = 2048):
+        self._records = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, record: SpanRecord):
+        with self._lock:
+            self._records.append(record)
+
+    def snapshot(self, name: Optional[str] = None) -> List[SpanRecord]:
+        with self._lock:
+            records = list(self._records)
+        return [r for r in records if name is None or r.name == name]
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+class PrometheusSink:
+    """按span名称聚合耗时直方图，render() 输出Prometheus文本格式。"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+        self._errors: Dict[str, int] = collections.Counter()
+
+    def emit(self, record: SpanRecord):
+        with self._lock:
+            hist = self._histograms.get(record.name)
+            if hist is None:
+                hist = self._histograms[record.name] = {
+                    "buckets": [0] * len(self.BUCKETS),
+                    "count": 0,
+                    "sum": 0.0,
+                }
+            for i, bound in enumerate(self.BUCKETS):
+                if record.duration <= bound:
+                    hist["buckets"][i] += 1
+            hist["count"] += 1
+            hist["sum"] += record.duration
+            if record.error:
+                self._errors[record.name] += 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP linka_span_duration_seconds Duration of pipeline stages.",
+            "# TYPE linka_span_duration_seconds histogram",
+        ]
+        with self._lock:
+            for name, hist in sorted(self._histograms.items()):
+                for bound, count in zip(self.BUCKETS, hist["buckets"]):
+                    lines.append(f'linka_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+                lines.append(f'linka_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {hist["count"]}')
+                lines.append(f'linka_span_duration_seconds_sum{{span="{name}"}} {hist["sum"]}')
+                lines.append(f'linka_span_duration_seconds_count{{span="{name}"}} {hist["count"]}')
+            lines.append("# HELP linka_span_errors_total Spans that ended with an error.")
+            lines.append("# TYPE linka_span_errors_total counter")
+            for name, count in sorted(self._errors.items()):
+                lines.append(f'linka_span_errors_total{{span="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+_sinks: List[Any] = []
+_sinks_lock = threading.Lock()
+
+
+def add_sink(sink):
+    """注册一个sink（任何带 emit(record) 方法的对象）。"""
+    with _sinks_lock:
+        _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    with _sinks_lock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+
+def get_sink(sink_type):
+    """返回第一个指定类型的sink，没有则返回None。"""
+    for sink in list(_sinks):
+        if isinstance(sink, sink_type):
+            return sink
+    return None
+
+
+def tracing_enabled() -> bool:
+    return bool(_sinks)
+
+
+def _emit(record: SpanRecord):
+    for sink in list(_sinks):
+        try:
+            sink.emit(record)
+        except Exception:
+            logging.getLogger(__name__).exception("span输出失败: %s", record.name)
+
+
+class _NoopSpan:
+    """未启用追踪时使用的空span。"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "attrs", "trace_id", "span_id", "parent_id", "_start", "_wall_start", "_token")
+
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """补充span属性。"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current_trace.get()
+        if parent is None:
+            self.trace_id = uuid.uuid4().hex[:16]
+            self.parent_id = None
+        else:
+            self.trace_id, self.parent_id = parent
+        self.span_id = uuid.uuid4().hex[:8]
+        self._token = _current_trace.set((self.trace_id, self.span_id))
+        self._wall_start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter() - self._start
+        _current_trace.reset(self._token)
+        _emit(
+            SpanRecord(
+                self.name, self.trace_id, self.span_id, self.parent_id, self._wall_start,
+                duration, self.attrs, f"{exc_type.__name__}: {exc_val}" if exc_type else None,
+            )
+        )
+        return False
+
+
+def span(name: str, **attrs):
+    """
+    创建一个span上下文管理器。未启用追踪时返回空操作对象。
+
+    :param name: 阶段名称，如 "search"、"page.fetch"
+    :param attrs: 附加属性
+    """
+    if not _sinks:
+        return _NOOP_SPAN
+    return _Span(name, attrs)
+
+
+def record_span(name: str, duration: float, error: Optional[str] = None, **attrs):
+    """
+    记录一个已在外部测量好耗时的span（例如首token时间）。
+
+    :param name: 阶段名称
+    :param duration: 耗时（秒）
+    :param error: 错误描述（可选）
+    :param attrs: 附加属性
+    """
+    if not _sinks:
+        return
+    parent = _current_trace.get()
+    trace_id, parent_id = parent if parent else (uuid.uuid4().hex[:16], None)
+    _emit(
+        SpanRecord(name, trace_id, uuid.uuid4().hex[:8], parent_id, time.time() - duration, duration, attrs, error)
+    )
+
+
+def configure_from_env():
+    """根据 LINKA_TRACE_SINKS / LINKA_TRACE_LOG 安装sink，重复调用不会重复安装。"""
+    names = [n.strip() for n in os.getenv("LINKA_TRACE_SINKS", "").split(",") if n.strip()]
+    factories = {
+        "json": (JsonLogSink, lambda: JsonLogSink(os.getenv("LINKA_TRACE_LOG"))),
+        "ring": (RingBufferSink, RingBufferSink),
+        "prometheus": (PrometheusSink, PrometheusSink),
+    }
+    for name in names:
+        if name not in factories:
+            logging.getLogger(__name__).warning("未知的追踪sink: %s", name)
+            continue
+        sink_type, factory = factories[name]
+        if get_sink(sink_type) is None:
+            add_sink(factory())
+
+
+def configure_logging():
+    """按 LINKA_LOG_LEVEL（默认WARNING）配置日志级别，供各入口脚本调用。"""
+    logging.basicConfig(
+        level=os.getenv("LINKA_LOG_LEVEL", "WARNING").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+configure_from_env()
@@ -0,0 +1,97 @@
+"""
+启动预热：在第一个用户请求到来之前预先导入重量级模块、创建共享客户端并预热缓存，
+避免首个查询承担冷启动开销。
+
+用法：
+    python warmup.py              # 执行一次预热并打印各阶段耗时
+    LINKA_WARMUP=0                # 关闭HTTP服务和Streamlit界面启动时的自动预热
+"""
+import logging
+import os
+import socket
+import time
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 启动时预解析的主机：搜索引擎与文本模型接口
+WARMUP_HOSTS = ("duckduckgo.com", "html.duckduckgo.com")
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("LINKA_WARMUP", "1") != "0"
+
+
+def _resolve(hosts: Iterable[str]):
+    # 经 socket.getaddrinfo 解析，安装了DNS缓存时顺带写入缓存
+    for host in hosts:
+        try:
+            socket.getaddrinfo(host, 443, type=socket.SOCK_STREAM)
+        except OSError as e:
+            logger.debug("预热解析 %s 失败: %s", host, e)
+
+
+def warm_up(analyze_images: bool = True, hosts: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    执行预热，返回各阶段耗时（秒）。任一阶段失败只记录日志，不影响服务启动。
+
+    阶段：
+        imports  导入检索、转换、生成链路的模块，并用样例HTML跑一遍正文提取与Markdown转换
+        network  创建共享HTTP会话（同时安装DNS缓存），预解析搜索引擎与模型接口的主机名
+        clients  创建文本生成客户端、抓取调度器、本地索引、问答缓存与会话存储，启动缓存预热
+    """
+    timings: Dict[str, float] = {}
+
+    def stage(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+        except Exception:
+            logger.exception("预热阶段 %s 失败", name)
+        timings[name] = time.perf_counter() - started
+
+    def imports():
+        import html2md
+        import rag_pipeline  # noqa: F401
+
+        html2md.preload(analyze_images=analyze_images)
+
+    def network():
+        from llm_utils import get_generation_config
+        from net_utils.http_session import get_http_session
+
+        get_http_session()
+        targets = list(hosts if hosts is not None else WARMUP_HOSTS)
+        base_url = get_generation_config().get("base_url")
+        if base_url and urlparse(base_url).hostname:
+            targets.append(urlparse(base_url).hostname)
+        _resolve(targets)
+
+    def clients():
+        from answer_cache import get_answer_cache
+        from cache_warmer import get_cache_warmer
+        from conversation import get_conversation_store
+        from llm_utils import get_generation_client
+        from net_utils.fetch_scheduler import get_fetch_scheduler
+        from web_search.local_index import get_local_index
+
+        get_generation_client()
+        get_fetch_scheduler()
+        get_local_index()
+        get_answer_cache()
+        get_conversation_store()
+        get_cache_warmer()
+
+    total = time.perf_counter()
+    stage("imports", imports)
+    stage("network", network)
+    stage("clients", clients)
+    timings["total"] = time.perf_counter() - total
+    logger.info("预热完成: %s", ", ".join(f"{k}={v:.3f}s" for k, v in timings.items()))
+    return timings
+
+
+if __name__ == "__main__":
+    for name, seconds in warm_up().items():
+        print(f"{name:>8}: {seconds:.3f}s")
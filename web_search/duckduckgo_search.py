@@ -1,6 +1,11 @@
 # filepath: c:\Users\k\Documents\project\programming_project\python_project\importance\Linka\web_search\duckduckgo_search.py
 from duckduckgo_search import DDGS
 from typing import List, Dict, Optional
+import json
+import logging
+from net_utils.http_capture import capture_call
+
+logger = logging.getLogger(__name__)
 
 
 def search_duckduckgo(query: str, max_results: int = 10, proxies: Optional[Dict] = None, user_agent: Optional[str] = None) -> List[Dict]:
@@ -24,16 +29,23 @@ def search_duckduckgo(query: str, max_results: int = 10, proxies: Optional[Dict]
         "User-Agent": user_agent or default_user_agent
     }
     
-    results = []
-    try:
+    def run_search():
+        results = []
         for r in ddgs.text(query, max_results=max_results):
             # 只收集结果，不做可访问性验证
             results.append(r)
+        return results
+
+    try:
+        # 录制/回放模式下经过捕获层，否则直接搜索
+        return capture_call(
+            "search:duckduckgo",
+            json.dumps([query, max_results], ensure_ascii=False),
+            run_search,
+        )
     except Exception as e:
-        print(f"DuckDuckGo 搜索出错: {e}")
+        logger.error("DuckDuckGo 搜索出错: %s", e)
         raise
-        
-    return results
 
 
 if __name__ == "__main__":
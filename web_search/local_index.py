@@ -0,0 +1,383 @@
+"""
+本地全文索引：把抓取转换后的页面按段落写入SQLite FTS5索引（附URL、标题、抓取时间），
+作为 search_duckduckgo 之外的另一个检索来源。最近查过的话题可以部分或全部直接用本地资料回答。
+
+中文按字符二元组、英文按单词建立索引，与 conversation.query_terms 的切分方式一致，
+不依赖SQLite的分词器扩展，FTS5内置的 unicode61 分词器即可。
+
+环境变量：
+    LINKA_LOCAL_INDEX=linka_index.sqlite     # 索引文件，设为空字符串关闭
+    LINKA_LOCAL_INDEX_FRESH=86400            # 该时间（秒）内抓取的页面直接使用，不再重新抓取
+    LINKA_LOCAL_INDEX_RETENTION_DAYS=30      # 压缩时删除早于该天数抓取的页面
+    LINKA_LOCAL_INDEX_MAX_PAGES=20000        # 页面数上限，压缩时删除最早抓取的页面
+    LINKA_LOCAL_INDEX_COMPACT_EVERY=500      # 每写入多少个页面自动压缩一次
+    LINKA_LOCAL_INDEX_PASSAGE_CHARS=800      # 段落切分的目标长度
+    LINKA_LOCAL_MIN_COVERAGE=0.5             # 页面命中的问题要点比例低于该值时不作为结果
+    LINKA_LOCAL_ANSWER_COVERAGE=0.8          # 本地结果覆盖的问题要点比例不低于该值（且英文、数字要点全部出现）时不再联网搜索
+    LINKA_LOCAL_ANSWER_MIN_PAGES=2           # 只用本地结果回答时至少需要的页面数
+    LINKA_LOCAL_EXTRA_RESULTS=2              # 联网搜索时额外附加的本地结果数
+
+查看与维护：
+    python -m web_search.local_index stats
+    python -m web_search.local_index search <问题>
+    python -m web_search.local_index compact [--vacuum]
+"""
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+
+from answer_cache import normalize_query
+from conversation import query_terms, term_coverage
+
+logger = logging.getLogger(__name__)
+
+FRESH_SECONDS = float(os.getenv("LINKA_LOCAL_INDEX_FRESH", "86400"))
+RETENTION_DAYS = float(os.getenv("LINKA_LOCAL_INDEX_RETENTION_DAYS", "30"))
+MAX_PAGES = int(os.getenv("LINKA_LOCAL_INDEX_MAX_PAGES", "20000"))
+COMPACT_EVERY = int(os.getenv("LINKA_LOCAL_INDEX_COMPACT_EVERY", "500"))
+PASSAGE_CHARS = int(os.getenv("LINKA_LOCAL_INDEX_PASSAGE_CHARS", "800"))
+MIN_COVERAGE = float(os.getenv("LINKA_LOCAL_MIN_COVERAGE", "0.5"))
+ANSWER_COVERAGE = float(os.getenv("LINKA_LOCAL_ANSWER_COVERAGE", "0.8"))
+ANSWER_MIN_PAGES = int(os.getenv("LINKA_LOCAL_ANSWER_MIN_PAGES", "2"))
+EXTRA_RESULTS = int(os.getenv("LINKA_LOCAL_EXTRA_RESULTS", "2"))
+
+# 每个页面最多返回的命中段落数
+PASSAGES_PER_PAGE = 3
+# 索引要点的切分版本（PRAGMA user_version）；切分方式变化后打开旧索引时重建要点列
+TERMS_VERSION = 2
+# 含英文字母或数字的要点（年份、版本号、型号、专有名词）必须在本地结果中原样出现才能跳过联网搜索
+_EXACT_TERM_RE = re.compile(r"[a-z0-9]")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_fetched ON pages (fetched_at);
+CREATE TABLE IF NOT EXISTS passages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    page_id INTEGER NOT NULL,
+    ordinal INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_passages_page ON passages (page_id, ordinal);
+CREATE VIRTUAL TABLE IF NOT EXISTS passage_terms USING fts5(title_terms, terms);
+"""
+
+
+def split_passages(markdown: str, passage_chars: int = PASSAGE_CHARS) -> List[str]:
+    """按空行把Markdown合并成不超过 passage_chars 的段落，过长的单段按长度切开。"""
+    passages: List[str] = []
+    current = ""
+    for block in markdown.split("\n\n"):
+        block = block.strip()
+        if not block:
+            continue
+        while len(block) > passage_chars:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(block[:passage_chars])
+            block = block[passage_chars:]
+        if current and len(current) + len(block) + 2 > passage_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+    if current:
+        passages.append(current)
+    return passages
+
+
+def index_terms(text: str) -> str:
+    """索引列的内容：以空格分隔的要点（英文单词、中文二元组）。"""
+    return " ".join(query_terms(text or ""))
+
+
+def match_expression(terms: Iterable[str]) -> str:
+    """FTS5查询：各要点加引号后以OR连接，按bm25排序。"""
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in dict.fromkeys(terms))
+
+
+def answerable(query: str, results: List[Dict]) -> bool:
+    """
+    本地结果是否足以直接回答、不再联网搜索：页面数与要点覆盖率达到阈值，且问题中的英文、数字要点
+    全部出现（二元组覆盖率对"2024年"与"2023年"这类差别不敏感）。
+    """
+    if len(results) < ANSWER_MIN_PAGES:
+        return False
+    text = _results_text(results)
+    if term_coverage(query, text) < ANSWER_COVERAGE:
+        return False
+    return all(term in text for term in query_terms(query) if _EXACT_TERM_RE.search(term))
+
+
+def _results_text(results: List[Dict]) -> str:
+    return normalize_query(" ".join(f"{r.get('title') or ''} {r.get('markdown') or ''}" for r in results))
+
+
+def coverage(query: str, results: List[Dict]) -> float:
+    """问题要点在本地结果（标题与命中段落）中出现的比例。"""
+    if not results:
+        return 0.0
+    return term_coverage(query, _results_text(results))
+
+
+class LocalIndex:
+    """
+    基于SQLite FTS5的页面段落索引。写入由单个后台线程串行执行，不阻塞检索流程。
+    """
+
+    def __init__(self, path: str, passage_chars: int = PASSAGE_CHARS, compact_every: int = COMPACT_EVERY):
+        self.path = path
+        self.passage_chars = passage_chars
+        self.compact_every = compact_every
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._upgrade_terms()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-index")
+        self._writes_since_compact = 0
+
+    def add_page(self, url: str, title: Optional[str], markdown: str, fetched_at: Optional[float] = None):
+        """写入（或替换）一个页面的全部段落。"""
+        passages = split_passages(markdown, self.passage_chars)
+        if not passages:
+            return
+        title_terms = index_terms(title)
+        with self._lock:
+            with self._conn:
+                self._delete_pages(self._conn.execute("SELECT id FROM pages WHERE url = ?", (url,)).fetchall())
+                page_id = self._conn.execute(
+                    "INSERT INTO pages (url, title, fetched_at) VALUES (?, ?, ?)",
+                    (url, title, fetched_at or time.time()),
+                ).lastrowid
+                for ordinal, passage in enumerate(passages):
+                    passage_id = self._conn.execute(
+                        "INSERT INTO passages (page_id, ordinal, content) VALUES (?, ?, ?)",
+                        (page_id, ordinal, passage),
+                    ).lastrowid
+                    self._conn.execute(
+                        "INSERT INTO passage_terms (rowid, title_terms, terms) VALUES (?, ?, ?)",
+                        (passage_id, title_terms, index_terms(passage)),
+                    )
+            self._writes_since_compact += 1
+            due = self.compact_every > 0 and self._writes_since_compact >= self.compact_every
+        if due:
+            self.compact()
+
+    def _upgrade_terms(self):
+        """旧版本切分方式建立的要点列按当前方式重建（段落正文不变）。"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= TERMS_VERSION:
+            return
+        rows = self._conn.execute(
+            "SELECT s.id, p.title, s.content FROM passages s JOIN pages p ON p.id = s.page_id"
+        ).fetchall()
+        with self._conn:
+            self._conn.execute("DELETE FROM passage_terms")
+            self._conn.executemany(
+                "INSERT INTO passage_terms (rowid, title_terms, terms) VALUES (?, ?, ?)",
+                ((passage_id, index_terms(title), index_terms(content)) for passage_id, title, content in rows),
+            )
+            self._conn.execute(f"PRAGMA user_version = {TERMS_VERSION}")
+        if rows:
+            logger.info("本地索引要点已按新的切分方式重建: %d 个段落", len(rows))
+
+    def submit_page(self, url: str, title: Optional[str], markdown: str):
+        """在后台写入页面，写入失败只记录日志。"""
+
+        def write():
+            try:
+                self.add_page(url, title, markdown)
+            except sqlite3.Error as e:
+                logger.warning("写入本地索引失败 %s: %s", url, e)
+
+        self._writer.submit(write)
+
+    def search(self, query: str, max_results: int = 10, max_age: Optional[float] = None) -> List[Dict]:
+        """
+        检索相关页面，结果格式与 search_duckduckgo 一致（title、href、body），
+        另含命中段落拼成的 markdown、抓取时间 fetched_at 和问题要点覆盖率 coverage。
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        since = time.time() - max_age if max_age else 0.0
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.url, p.title, p.fetched_at, s.ordinal, s.content"
+                " FROM passage_terms JOIN passages s ON s.id = passage_terms.rowid"
+                " JOIN pages p ON p.id = s.page_id"
+                " WHERE passage_terms MATCH ? AND p.fetched_at >= ?"
+                " ORDER BY bm25(passage_terms, 2.0, 1.0) LIMIT ?",
+                (match_expression(terms), since, max_results * PASSAGES_PER_PAGE * 4),
+            ).fetchall()
+        pages: Dict[str, Dict] = {}
+        for url, title, fetched_at, ordinal, content in rows:
+            page = pages.setdefault(url, {"title": title, "href": url, "fetched_at": fetched_at, "passages": []})
+            if len(page["passages"]) < PASSAGES_PER_PAGE:
+                page["passages"].append((ordinal, content))
+        results = []
+        for page in pages.values():
+            best = page["passages"][0][1]
+            page["body"] = best if len(best) <= 200 else best[:199] + "…"
+            page["markdown"] = "\n\n".join(content for _, content in sorted(page.pop("passages")))
+            page["coverage"] = coverage(query, [page])
+            if page["coverage"] >= MIN_COVERAGE:
+                results.append(page)
+            if len(results) >= max_results:
+                break
+        return results
+
+    def pages(self, urls: Iterable[str], max_age: float = FRESH_SECONDS) -> Dict[str, str]:
+        """返回在 max_age 秒内抓取过的页面全文 {url: markdown}。"""
+        urls = [url for url in dict.fromkeys(urls) if url]
+        if not urls:
+            return {}
+        placeholders = ",".join("?" * len(urls))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.url, s.content FROM pages p JOIN passages s ON s.page_id = p.id"
+                f" WHERE p.url IN ({placeholders}) AND p.fetched_at >= ? ORDER BY p.id, s.ordinal",
+                (*urls, time.time() - max_age),
+            ).fetchall()
+        found: Dict[str, List[str]] = {}
+        for url, content in rows:
+            found.setdefault(url, []).append(content)
+        return {url: "\n\n".join(parts) for url, parts in found.items()}
+
+    def compact(self, retention_days: float = RETENTION_DAYS, max_pages: int = MAX_PAGES, vacuum: bool = False) -> int:
+        """
+        删除超过保留期的页面和超出上限的最早页面，合并FTS5索引段；vacuum为True时同时回收文件空间。
+        返回删除的页面数。
+        """
+        with self._lock:
+            with self._conn:
+                stale = self._conn.execute(
+                    "SELECT id FROM pages WHERE fetched_at < ?", (time.time() - retention_days * 86400,),
+                ).fetchall()
+                excess = self._conn.execute(
+                    "SELECT id FROM pages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?", (max_pages,),
+                ).fetchall()
+                removed = self._delete_pages(set(stale) | set(excess))
+                self._conn.execute("INSERT INTO passage_terms (passage_terms) VALUES ('optimize')")
+            if vacuum:
+                self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._writes_since_compact = 0
+        if removed:
+            logger.info("本地索引压缩：删除 %d 个页面", removed)
+        return removed
+
+    def _delete_pages(self, page_rows) -> int:
+        # 调用方持有锁并处于事务中
+        page_ids = [row[0] for row in page_rows]
+        for page_id in page_ids:
+            self._conn.execute(
+                "DELETE FROM passage_terms WHERE rowid IN (SELECT id FROM passages WHERE page_id = ?)", (page_id,),
+            )
+            self._conn.execute("DELETE FROM passages WHERE page_id = ?", (page_id,))
+            self._conn.execute("DELETE FROM pages WHERE id = ?", (page_id,))
+        return len(page_ids)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            pages, oldest, newest = self._conn.execute(
+                "SELECT COUNT(*), MIN(fetched_at), MAX(fetched_at) FROM pages"
+            ).fetchone()
+            passages = self._conn.execute("SELECT COUNT(*) FROM passages").fetchone()[0]
+        return {
+            "pages": pages,
+            "passages": passages,
+            "oldest_age": time.time() - oldest if oldest else 0.0,
+            "newest_age": time.time() - newest if newest else 0.0,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+
+_local_index: Optional[LocalIndex] = None
+_local_index_lock = threading.Lock()
+
+
+def get_local_index() -> Optional[LocalIndex]:
+    """获取进程级本地索引；LINKA_LOCAL_INDEX 为空字符串时返回None。"""
+    global _local_index
+    path = os.getenv("LINKA_LOCAL_INDEX", "linka_index.sqlite")
+    if not path:
+        return None
+    if _local_index is None:
+        with _local_index_lock:
+            if _local_index is None:
+                try:
+                    _local_index = LocalIndex(path)
+                except sqlite3.Error as e:
+                    logger.warning("打开本地索引失败 %s: %s", path, e)
+                    return None
+    return _local_index
+
+
+def search_local_index(query: str, max_results: int = 10, max_age: Optional[float] = None) -> List[Dict]:
+    """
+    在本地索引中检索，结果格式与 search_duckduckgo 相同；索引未启用或出错时返回空列表。
+
+    Args:
+        query: 搜索关键词
+        max_results: 最大结果数量
+        max_age: 只返回该时间（秒）内抓取的页面，None 表示不限
+    """
+    index = get_local_index()
+    if index is None:
+        return []
+    try:
+        return index.search(query, max_results=max_results, max_age=max_age)
+    except sqlite3.Error as e:
+        logger.warning("本地索引检索失败: %s", e)
+        return []
+
+
+def fresh_pages(urls: Iterable[str], max_age: float = FRESH_SECONDS) -> Dict[str, str]:
+    """返回本地索引中 max_age 秒内抓取过的页面全文 {url: markdown}；索引未启用或出错时返回空字典。"""
+    index = get_local_index()
+    if index is None:
+        return {}
+    try:
+        return index.pages(urls, max_age=max_age)
+    except sqlite3.Error as e:
+        logger.warning("读取本地索引失败: %s", e)
+        return {}
+
+
+if __name__ == "__main__":
+    commands = ("stats", "search", "compact")
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("用法: python -m web_search.local_index stats | search <问题> | compact [--vacuum]")
+        sys.exit(1)
+    index = get_local_index()
+    if index is None:
+        print("本地索引未启用（LINKA_LOCAL_INDEX 为空）")
+        sys.exit(1)
+    if sys.argv[1] == "stats":
+        for key, value in index.stats().items():
+            print(f"{key:>12}: {value:.0f}")
+    elif sys.argv[1] == "search":
+        for i, result in enumerate(index.search(" ".join(sys.argv[2:])), 1):
+            print(f"{i}. [{result['coverage']:.2f}] {result['title']}  {result['href']}")
+            print(f"   {result['body']}")
+    else:
+        print(f"删除 {index.compact(vacuum='--vacuum' in sys.argv)} 个页面")
+    index.close()